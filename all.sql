@@ -1,87 +1,120 @@
--- @block
-DROP TABLE IF EXISTS InvoiceItem;
-DROP TABLE IF EXISTS Invoice;
-DROP TABLE IF EXISTS Product;
-DROP TABLE IF EXISTS Customer;
-
-CREATE TABLE Product (
-    importer VARCHAR(255),
-    status VARCHAR(50),
-    registration_date DATE,
-    alteration_date DATE,
-    discontinuation_date DATE,
-    brand VARCHAR(255),
-    product_code VARCHAR(10) PRIMARY KEY,
-    reference VARCHAR(255),
-    size VARCHAR(20),
-    printing_technology VARCHAR(50),
-    abrasion_resistance_group INTEGER,
-    usage_recommendation VARCHAR(20),
-    usage_description VARCHAR(255),
-    category VARCHAR(50),
-    edge_finishing VARCHAR(50),
-    recommended_installation_joint VARCHAR(20),
-    shade_variation VARCHAR(20),
-    shade_variation_description VARCHAR(255),
-    design_faces INTEGER,
-    high_releave VARCHAR(20),
-    tile_laying VARCHAR(20),
-    watermark_resistance VARCHAR(20),
-    new_thickness VARCHAR(20),
-    room_scene VARCHAR(20),
-    has_photo_faces VARCHAR(20),
-    kitchen_icon VARCHAR(20),
-    living_room_icon VARCHAR(20),
-    dormitory_icon VARCHAR(20),
-    bathroom_icon VARCHAR(20),
-    laundry_room_icon VARCHAR(20),
-    garage_icon VARCHAR(20),
-    external_area_icon VARCHAR(20),
-    common_area_icon VARCHAR(20),
-    internal_area_icon VARCHAR(20)
-);
-
-CREATE TABLE Customer (
-    customer_id INT AUTO_INCREMENT PRIMARY KEY,
-    name VARCHAR(255),
-    country VARCHAR(50)
-);
-
-CREATE TABLE Invoice (
-    invoice_number VARCHAR(100) PRIMARY KEY,
-    issue_date DATE,
-    fob DECIMAL(10,2),
-    destination_port VARCHAR(255),
-    customer_id INT,
-    FOREIGN KEY (customer_id) REFERENCES Customer(customer_id)
-);
-
-CREATE TABLE InvoiceItem (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    invoice_number VARCHAR(100),
-    product_code VARCHAR(10),
-    sqm DECIMAL(10,2),
-    unit_price DECIMAL(10,2),
-    total_price DECIMAL(10,2),
-    currency VARCHAR(30),
-    FOREIGN KEY (invoice_number) REFERENCES Invoice(invoice_number),
-    FOREIGN KEY (product_code) REFERENCES Product(product_code),
-    UNIQUE (invoice_number, product_code)
-);
-
--- @block
-SELECT * FROM product
-
--- @block
-SELECT COUNT(*) FROM invoiceitem;
-
-
-
--- @block
-DROP TABLE IF EXISTS InvoiceItem;
-DROP TABLE IF EXISTS Invoice;
-DROP TABLE IF EXISTS Product;
-DROP TABLE IF EXISTS Customer;
-
-
-
+-- @block
+DROP TABLE IF EXISTS InvoiceMonthlySummary;
+DROP TABLE IF EXISTS sync_watermark;
+DROP TABLE IF EXISTS InvoiceItem;
+DROP TABLE IF EXISTS Invoice;
+DROP TABLE IF EXISTS Product;
+DROP TABLE IF EXISTS Customer;
+
+CREATE TABLE Product (
+    importer VARCHAR(255),
+    status VARCHAR(50),
+    registration_date DATE,
+    alteration_date DATE,
+    discontinuation_date DATE,
+    brand VARCHAR(255),
+    product_code VARCHAR(10) PRIMARY KEY,
+    reference VARCHAR(255),
+    size VARCHAR(20),
+    printing_technology VARCHAR(50),
+    abrasion_resistance_group INTEGER,
+    usage_recommendation VARCHAR(20),
+    usage_description VARCHAR(255),
+    category VARCHAR(50),
+    edge_finishing VARCHAR(50),
+    recommended_installation_joint VARCHAR(20),
+    shade_variation VARCHAR(20),
+    shade_variation_description VARCHAR(255),
+    design_faces INTEGER,
+    high_releave VARCHAR(20),
+    tile_laying VARCHAR(20),
+    watermark_resistance VARCHAR(20),
+    new_thickness VARCHAR(20),
+    room_scene VARCHAR(20),
+    has_photo_faces VARCHAR(20),
+    kitchen_icon VARCHAR(20),
+    living_room_icon VARCHAR(20),
+    dormitory_icon VARCHAR(20),
+    bathroom_icon VARCHAR(20),
+    laundry_room_icon VARCHAR(20),
+    garage_icon VARCHAR(20),
+    external_area_icon VARCHAR(20),
+    common_area_icon VARCHAR(20),
+    internal_area_icon VARCHAR(20)
+);
+
+-- customer_id is given by the customer registry of customers.py, so it is the same in every output
+CREATE TABLE Customer (
+    customer_id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255),
+    country VARCHAR(50)
+);
+
+CREATE TABLE Invoice (
+    invoice_number VARCHAR(100) PRIMARY KEY,
+    issue_date DATE,
+    fob DECIMAL(10,2),
+    destination_port VARCHAR(255),
+    customer_id INT,
+    FOREIGN KEY (customer_id) REFERENCES Customer(customer_id)
+);
+
+CREATE TABLE InvoiceItem (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    invoice_number VARCHAR(100),
+    product_code VARCHAR(10),
+    sqm DECIMAL(10,2),
+    unit_price DECIMAL(10,2),
+    total_price DECIMAL(10,2),
+    currency VARCHAR(30),
+    FOREIGN KEY (invoice_number) REFERENCES Invoice(invoice_number),
+    FOREIGN KEY (product_code) REFERENCES Product(product_code),
+    UNIQUE (invoice_number, product_code)
+);
+
+-- Last synchronization of each source file by insert_into_db.py (content hash and latest issue date sent)
+CREATE TABLE sync_watermark (
+    source VARCHAR(255) PRIMARY KEY,
+    source_hash VARCHAR(64),
+    max_issue_date DATE,
+    synced_at TIMESTAMP
+);
+
+-- Monthly totals per customer and product, for the dashboards; insert_into_db.py rebuilds the months it changes
+CREATE TABLE InvoiceMonthlySummary (
+    month DATE,
+    customer_id INT,
+    product_code VARCHAR(10),
+    invoices INT,
+    sqm DECIMAL(14,2),
+    total_price DECIMAL(14,2),
+    PRIMARY KEY (month, customer_id, product_code)
+);
+
+-- Indexes of the joins and date filters of the reports and of the synchronization
+-- (lookups of InvoiceItem by invoice_number use its UNIQUE (invoice_number, product_code) key)
+CREATE INDEX idx_customer_name ON Customer (name);
+CREATE INDEX idx_invoice_customer_id ON Invoice (customer_id);
+CREATE INDEX idx_invoice_issue_date ON Invoice (issue_date);
+CREATE INDEX idx_invoiceitem_product_code ON InvoiceItem (product_code);
+CREATE INDEX idx_summary_customer_id ON InvoiceMonthlySummary (customer_id);
+CREATE INDEX idx_summary_product_code ON InvoiceMonthlySummary (product_code);
+
+-- @block
+SELECT * FROM product
+
+-- @block
+SELECT COUNT(*) FROM invoiceitem;
+
+
+
+-- @block
+DROP TABLE IF EXISTS InvoiceMonthlySummary;
+DROP TABLE IF EXISTS sync_watermark;
+DROP TABLE IF EXISTS InvoiceItem;
+DROP TABLE IF EXISTS Invoice;
+DROP TABLE IF EXISTS Product;
+DROP TABLE IF EXISTS Customer;
+
+
+
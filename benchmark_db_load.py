@@ -0,0 +1,120 @@
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from db_loader import create_database_engine, bulk_load
+
+
+BENCHMARK_TABLE = 'invoiceitem_benchmark'
+
+
+def make_invoice_items(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Generates synthetic rows shaped like the 'invoiceitem' table.
+
+    Parameters:
+    rows (int): Number of rows.
+    seed (int, optional): Seed of the random generator. Default is 0.
+
+    Returns:
+    pd.DataFrame: The rows.
+    """
+
+    rng = np.random.default_rng(seed)
+    sqm = rng.uniform(10, 2000, rows).round(2)
+    unit_price = rng.uniform(3, 30, rows).round(2)
+
+    return pd.DataFrame({
+        'invoice_number': (rng.integers(1, rows // 5 + 2, rows)).astype(str),
+        'product_code': rng.integers(10000, 99999, rows).astype(str),
+        'sqm': sqm,
+        'unit_price': unit_price,
+        'total_price': (sqm * unit_price).round(2),
+        'currency': rng.choice(['USD', 'EUR'], rows),
+    })
+
+
+def _time_load(engine, df: pd.DataFrame, method: str, chunk_size: int or None) -> float:
+    """
+    Loads the rows into a fresh benchmark table and returns the elapsed time.
+
+    Parameters:
+    engine: A SQLAlchemy engine.
+    df (pd.DataFrame): The rows.
+    method (str): 'to_sql' for a plain 'DataFrame.to_sql', or a 'bulk_load' method.
+    chunk_size (int or None): Number of rows per statement.
+
+    Returns:
+    float: Seconds spent loading, commit included.
+    """
+
+    with engine.begin() as connection:
+        connection.execute(text(f'DROP TABLE IF EXISTS {BENCHMARK_TABLE}'))
+        df.head(0).to_sql(BENCHMARK_TABLE, con=connection, index=False)
+
+    start = time.perf_counter()
+    if method == 'to_sql':
+        df.to_sql(BENCHMARK_TABLE, con=engine, index=False, if_exists='append')
+    else:
+        with engine.begin() as connection:
+            bulk_load(df, BENCHMARK_TABLE, connection, chunk_size, method)
+    elapsed = time.perf_counter() - start
+
+    with engine.connect() as connection:
+        loaded = connection.execute(text(f'SELECT COUNT(*) FROM {BENCHMARK_TABLE}')).scalar()
+    if loaded != len(df):
+        raise RuntimeError(f'{method}: {loaded} rows loaded instead of {len(df)}')
+
+    return elapsed
+
+
+def main(database_url: str or None = None, rows: int = 100000, chunk_sizes: list[int] = (100, 1000, 5000)) -> pd.DataFrame:
+    """
+    Measures the load speed of plain 'to_sql' against the load methods of 'db_loader', on a
+    scratch table. Without a database URL, a temporary SQLite database is used, so no server is needed.
+
+    Parameters:
+    database_url (str or None): The SQLAlchemy URL of the database (e.g. a local MySQL-compatible server).
+    rows (int): Number of rows loaded by each run. Default is 100000.
+    chunk_sizes (list[int]): Chunk sizes tried with each load method.
+
+    Returns:
+    pd.DataFrame: Time and rows per second of every run.
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        if database_url is None:
+            database_url = 'sqlite:///' + os.path.join(directory, 'benchmark.sqlite')
+        engine = create_database_engine(database_url)
+
+        runs = [('to_sql', None)]
+        runs += [(method, chunk_size) for method in ['executemany', 'multi'] for chunk_size in chunk_sizes]
+        if engine.dialect.name in ('mysql', 'mariadb'):
+            runs += [('native', chunk_size) for chunk_size in chunk_sizes]
+
+        df = make_invoice_items(rows)
+        results = []
+        try:
+            for method, chunk_size in runs:
+                seconds = _time_load(engine, df, method, chunk_size)
+                results.append({'method': method, 'chunk_size': chunk_size, 'seconds': seconds, 'rows_per_second': rows / seconds})
+                print(f'{method:>11} chunk_size={chunk_size}: {seconds:.2f}s ({rows / seconds:,.0f} rows/s)')
+        finally:
+            with engine.begin() as connection:
+                connection.execute(text(f'DROP TABLE IF EXISTS {BENCHMARK_TABLE}'))
+            engine.dispose()
+
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the database load paths of db_loader.')
+    parser.add_argument('--url', default=None, help='SQLAlchemy database URL (default: a temporary SQLite database)')
+    parser.add_argument('--rows', type=int, default=100000, help='rows per run (default: 100000)')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[100, 1000, 5000], help='chunk sizes to try')
+    args = parser.parse_args()
+
+    main(database_url=args.url, rows=args.rows, chunk_sizes=args.chunk_sizes)
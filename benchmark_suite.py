@@ -0,0 +1,402 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+from synthetic_corpus import (SYNTHETIC_DIR_PATH, SYNTHETIC_PDFs_DIR_PATH, SYNTHETIC_CATALOGS_DIR_PATH, GROUND_TRUTH_PATH,
+                              generate_corpus, load_ground_truth, format_amount)
+from utils import to_float, to_fixed_point, to_decimal_amounts
+from columnar_store import read_table
+from reorder_suggestion import INVOICES_COLUMNS, compute_reorder_suggestions
+import post_processing
+from invoice_processing import ENGINES
+from setup import GENERATED_FILES_DIR_PATH
+
+
+BENCHMARK_REPORT_PATH = GENERATED_FILES_DIR_PATH + 'benchmark_report.json'
+
+# Settings of the extraction run on the synthetic corpus, so it never touches the real invoices
+SYNTHETIC_DOCS_DIR_PATH = SYNTHETIC_DIR_PATH + 'Invoices-docx/'
+SYNTHETIC_GENERATED_DIR_PATH = SYNTHETIC_DIR_PATH + 'generated_files/'
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+AMOUNT_COLUMNS = ['Sqm', 'Unit_price', 'Total_price']
+HEADER_COLUMNS = ['Client', 'Date', 'Currency', 'Destination', 'FOB']
+
+# Minimum number of amounts parsed by the 'to_float' benchmark
+PARSED_AMOUNTS = 100000
+
+
+def corpus_environment() -> dict:
+    """
+    Environment of the scripts run on the synthetic corpus: every path setting points into 'SYNTHETIC_DIR_PATH'
+    (see setup.py). The layouts file is left out, so only the built-in layouts are used.
+
+    Returns:
+    dict: The environment variables.
+    """
+
+    env = dict(os.environ)
+    env.update({
+        'ORBIS_PDFS_DIR_PATH': SYNTHETIC_PDFs_DIR_PATH,
+        'ORBIS_CATALOGS_DIR_PATH': SYNTHETIC_CATALOGS_DIR_PATH,
+        'ORBIS_DOCS_DIR_PATH': SYNTHETIC_DOCS_DIR_PATH,
+        'ORBIS_GENERATED_FILES_DIR_PATH': SYNTHETIC_GENERATED_DIR_PATH,
+        'ORBIS_OUTPUT_DIR_PATH': SYNTHETIC_DIR_PATH,
+        'ORBIS_LAYOUTS_FILE_PATH': SYNTHETIC_DIR_PATH + 'layouts.json',
+    })
+
+    return env
+
+
+def prepare_corpus(count: int, seed: int, spanish_share: float, workers: int) -> tuple[pd.DataFrame, float or None]:
+    """
+    Generates the synthetic corpus, unless the one on disk was generated with the same arguments.
+
+    Returns:
+    tuple[pd.DataFrame, float or None]: The ground truth and the generation time in seconds (None if reused).
+    """
+
+    parameters = {'count': count, 'seed': seed, 'spanish_share': spanish_share}
+    if os.path.isfile(GROUND_TRUTH_PATH + '.json'):
+        with open(GROUND_TRUTH_PATH + '.json', encoding='utf-8') as file:
+            if json.load(file) == parameters:
+                return load_ground_truth(), None
+
+    start = time.perf_counter()
+    generate_corpus(count, seed=seed, spanish_share=spanish_share, workers=workers)
+    return load_ground_truth(), time.perf_counter() - start
+
+
+def run_extraction(workers: int = 1, engine: str = 'docx', cold: bool = True) -> dict:
+    """
+    Runs invoice_processing.py on the synthetic corpus in its own process, as in production, and reads back the
+    performance report of the run.
+
+    Parameters:
+    workers (int, optional): Number of worker processes. Default is 1.
+    engine (str, optional): Extraction engine. Default is 'docx'.
+    cold (bool, optional): Whether to clear the converted documents and caches first. Default is True.
+
+    Returns:
+    dict: The wall time of the run and the totals of every measured step.
+    """
+
+    if cold:
+        for directory in (SYNTHETIC_DOCS_DIR_PATH, SYNTHETIC_GENERATED_DIR_PATH):
+            shutil.rmtree(directory, ignore_errors=True)
+    for directory in (SYNTHETIC_DOCS_DIR_PATH, SYNTHETIC_GENERATED_DIR_PATH):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    command = [sys.executable, os.path.join(SCRIPTS_DIR, 'invoice_processing.py'), '--no-manifest',
+               '--workers', str(workers), '--engine', engine]
+    log_path = SYNTHETIC_GENERATED_DIR_PATH + 'benchmark_extraction.log'
+
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.run(command, cwd=SCRIPTS_DIR, env=corpus_environment(), stdout=log, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f'invoice_processing.py failed with exit code {process.returncode}, see {log_path}')
+
+    with open(SYNTHETIC_GENERATED_DIR_PATH + 'performance_report.json', encoding='utf-8') as file:
+        performance = json.load(file)
+
+    return {
+        'wall_s': round(seconds, 3),
+        'peak_memory_mb': performance['peak_memory_mb'],
+        'steps': {step: {'count': totals['count'], 'wall_s': totals['wall_s'], 'mean_wall_s': totals['mean_wall_s']}
+                  for step, totals in performance['steps'].items()},
+    }
+
+
+def extraction_accuracy(truth: pd.DataFrame, extracted: pd.DataFrame) -> dict:
+    """
+    Compares the extracted invoices with the ground truth. Amounts are compared as exact cents. A product line
+    is found when an extracted line of the same invoice has its code, quantity, unit price and total; flagged
+    and failed invoices are not in the output, so their lines count as missed.
+
+    Parameters:
+    truth (pd.DataFrame): The ground truth (see 'synthetic_corpus.load_ground_truth').
+    extracted (pd.DataFrame): The rows of invoices.csv, read as text.
+
+    Returns:
+    dict: Invoice recall, header field accuracy, product line precision and recall, and catalog name accuracy.
+    """
+
+    extracted = extracted.copy()
+    for column in AMOUNT_COLUMNS + ['FOB']:
+        extracted[column] = to_fixed_point(extracted[column], errors='coerce')
+    keys = ['Invoice_number', 'Product_code'] + AMOUNT_COLUMNS
+
+    lines = truth.merge(extracted.drop_duplicates(subset=keys), on=keys, how='left', suffixes=('', '_extracted'),
+                        indicator=True)
+    found = lines['_merge'] == 'both'
+    names = (lines['Product_name'] == lines['Product_name_extracted']) & (lines['Size'].str.lower() == lines['Size_extracted'].str.lower())
+
+    invoices = truth.drop_duplicates('Invoice_number').merge(extracted.drop_duplicates('Invoice_number'), on='Invoice_number',
+                                                             how='inner', suffixes=('', '_extracted'))
+    headers = {column: round(float((invoices[column].astype(str) == invoices[column + '_extracted'].astype(str)).mean()), 4)
+               if len(invoices) else None for column in HEADER_COLUMNS}
+
+    truth_invoices = truth['Invoice_number'].nunique()
+    missing = sorted(set(truth['Invoice_number']) - set(extracted['Invoice_number']))
+
+    return {
+        'invoices': truth_invoices,
+        'invoices_extracted': truth_invoices - len(missing),
+        'invoice_recall': round((truth_invoices - len(missing)) / truth_invoices, 4),
+        'missing_invoices': missing[:20],
+        'header_accuracy': headers,
+        'line_recall': round(float(found.mean()), 4),
+        'line_precision': round(int(found.sum()) / len(extracted), 4) if len(extracted) else None,
+        'product_name_accuracy': round(float(names[found].mean()), 4) if found.any() else None,
+    }
+
+
+def benchmark_amount_parsing(truth: pd.DataFrame, minimum: int = PARSED_AMOUNTS) -> dict:
+    """
+    Times 'utils.to_float', value by value, against the vectorized 'utils.to_fixed_point' on the amounts as printed
+    on the invoices (English and Spanish separators), and checks that they agree.
+
+    Returns:
+    dict: Values per second of each, and the number of values on which they disagree.
+    """
+
+    printed = pd.Series([format_amount(value, language) for column in AMOUNT_COLUMNS
+                         for value, language in zip(truth[column], truth['Language'])])
+    values = pd.Series(np.resize(printed.to_numpy(), max(minimum, len(printed))))
+
+    start = time.perf_counter()
+    decimals = [to_float(value) for value in values]
+    to_float_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cents = to_fixed_point(values)
+    to_fixed_point_s = time.perf_counter() - start
+
+    disagreements = int((pd.Series([int(value.scaleb(2)) for value in decimals]) != cents.to_numpy()).sum())
+
+    return {
+        'values': len(values),
+        'to_float_values_per_second': round(len(values) / to_float_s),
+        'to_fixed_point_values_per_second': round(len(values) / to_fixed_point_s),
+        'disagreements': disagreements,
+    }
+
+
+def revised_invoices(truth: pd.DataFrame, extracted: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turns the extracted invoices into a revised sheet like the ones people maintain, where amounts are typed as
+    printed on each invoice or entered as numbers: the amounts of the English invoices are rewritten with English
+    separators ('1,234.50'), those of the Spanish ones keep the Spanish separators ('1.234,50'), and every third
+    invoice has numeric cells instead, with a third decimal on Sqm (12.344) and Total_price computed as
+    Sqm x Unit_price wherever that rounds to the extracted total.
+
+    Parameters:
+    truth (pd.DataFrame): The ground truth, giving the language of every invoice.
+    extracted (pd.DataFrame): The rows of invoices.csv, read as text.
+
+    Returns:
+    pd.DataFrame: The revised invoices.
+    """
+
+    revised = extracted.copy()
+    languages = truth.drop_duplicates('Invoice_number').set_index('Invoice_number')['Language']
+    invoice_numbers = revised['Invoice_number'].drop_duplicates()
+    numeric = revised['Invoice_number'].isin(invoice_numbers.iloc[::3]).to_numpy()
+    english = (revised['Invoice_number'].map(languages) == 'english').to_numpy() & ~numeric
+
+    cents = {column: to_fixed_point(revised[column], errors='coerce') for column in AMOUNT_COLUMNS + ['FOB']}
+    for column in AMOUNT_COLUMNS + ['FOB']:
+        revised[column] = revised[column].astype(object)
+        revised.loc[english, column] = [format_amount(value, 'english') if pd.notna(value) else None
+                                        for value in cents[column][english]]
+
+    # Numeric cells, as entered or computed in a spreadsheet: the extra decimal of Sqm rounds away, and the
+    # float product of Sqm and Unit_price rounds half up to the total unless the invoice rounded otherwise
+    amounts = {column: cents[column][numeric].astype('float64') / 100 for column in AMOUNT_COLUMNS + ['FOB']}
+    sqm = amounts['Sqm'] + np.copysign(0.004, amounts['Sqm'])
+    products = amounts['Sqm'] * amounts['Unit_price']
+    rounded = pd.array([None if value is None else int(value.scaleb(2)) for value in to_decimal_amounts(products)],
+                       dtype='Int64')
+    computed = (rounded == cents['Total_price'][numeric].array).fillna(False).to_numpy(dtype=bool)
+    totals = products.where(computed, amounts['Total_price'])
+    for column, values in [('Sqm', sqm), ('Unit_price', amounts['Unit_price']), ('Total_price', totals),
+                           ('FOB', amounts['FOB'])]:
+        revised.loc[numeric, column] = [None if pd.isna(value) else float(value) for value in values]
+
+    return revised
+
+
+def downstream_accuracy(truth: pd.DataFrame, parquet_path: str) -> dict:
+    """
+    Compares the revised invoices written by post_processing.py with the ground truth: amounts as exact cents and
+    dates as days. Lines are matched on invoice number and product code; lines missing from the file count as
+    wrong.
+
+    Parameters:
+    truth (pd.DataFrame): The ground truth.
+    parquet_path (str): The path of the Parquet file written by post_processing.py.
+
+    Returns:
+    dict: The share of lines found, of every field right and of lines with all fields right.
+    """
+
+    stored = read_table(parquet_path, ['Invoice_number', 'Product_code', 'Date'] + AMOUNT_COLUMNS + ['FOB'],
+                        decimals_as_float=False)
+    for column in AMOUNT_COLUMNS + ['FOB']:
+        stored[column] = to_fixed_point(stored[column], errors='coerce')
+    stored['Date'] = pd.to_datetime(stored['Date'], errors='coerce')
+
+    expected = truth.assign(Date=pd.to_datetime(truth['Issue_date']))
+    keys = ['Invoice_number', 'Product_code']
+    lines = expected.merge(stored.drop_duplicates(subset=keys), on=keys, how='left', suffixes=('', '_stored'),
+                           indicator=True)
+
+    right = pd.DataFrame({column: (lines[column] == lines[column + '_stored']).fillna(False).astype(bool)
+                          for column in AMOUNT_COLUMNS + ['FOB', 'Date']})
+
+    return {
+        'line_recall': round(float((lines['_merge'] == 'both').mean()), 4),
+        'field_accuracy': {column: round(float(right[column].mean()), 4) for column in right.columns},
+        'line_accuracy': round(float(right.all(axis=1).mean()), 4),
+    }
+
+
+def benchmark_downstream(truth: pd.DataFrame, extracted: pd.DataFrame) -> dict:
+    """
+    Times post_processing.py on a revised sheet made from the extracted invoices (see 'revised_invoices') and
+    checks its output against the ground truth, then times the reorder suggestions computed from that output at
+    the end of every month of the corpus (a backfill).
+
+    Parameters:
+    truth (pd.DataFrame): The ground truth.
+    extracted (pd.DataFrame): The rows of invoices.csv, read as text.
+
+    Returns:
+    dict: The time of each step in seconds, the accuracy of the revised invoices and the number of suggestion rows.
+    """
+
+    revised_path = SYNTHETIC_GENERATED_DIR_PATH + 'invoices_revised.xlsx'
+    parquet_path = SYNTHETIC_GENERATED_DIR_PATH + 'invoices_revised.parquet'
+    revised_invoices(truth, extracted).to_excel(revised_path, index=False)
+
+    start = time.perf_counter()
+    post_processing.main(input_path=revised_path, output_path=parquet_path)
+    post_processing_s = time.perf_counter() - start
+
+    invoices_df = read_table(parquet_path, INVOICES_COLUMNS)
+    dates = pd.to_datetime(invoices_df['Date'], errors='coerce').dropna()
+    as_of = pd.date_range(dates.min(), dates.max() + pd.offsets.MonthEnd(0), freq='ME') if len(dates) else []
+
+    start = time.perf_counter()
+    suggestions = compute_reorder_suggestions(invoices_df, as_of)
+    reorder_s = time.perf_counter() - start
+
+    return {
+        'post_processing_s': round(post_processing_s, 3),
+        'accuracy': downstream_accuracy(truth, parquet_path),
+        'reorder_suggestion_s': round(reorder_s, 3),
+        'reorder_as_of_dates': len(as_of),
+        'reorder_rows': len(suggestions),
+    }
+
+
+def _print_comparison(report: dict, previous: dict) -> None:
+    """
+    Prints the throughput and stage times of a run next to those of the previous run.
+    """
+
+    def change(new, old):
+        return f'{old:.4g} -> {new:.4g} ({(new - old) / old:+.1%})' if old else f'{new:.4g}'
+
+    print(f'invoices/s: {change(report["invoices_per_second"], previous.get("invoices_per_second"))}')
+    old_steps = previous.get('extraction', {}).get('steps', {})
+    for step, totals in report['extraction']['steps'].items():
+        print(f'  {step:<20} {change(totals["wall_s"], old_steps.get(step, {}).get("wall_s"))} s')
+    for key in ('post_processing_s', 'reorder_suggestion_s'):
+        print(f'  {key:<20} {change(report["downstream"][key], previous.get("downstream", {}).get(key))}')
+
+
+def main(count: int = 200, seed: int = 0, spanish_share: float = 0.3, workers: int = 1, engine: str = 'docx',
+         cold: bool = True, report_path: str = BENCHMARK_REPORT_PATH) -> dict:
+    """
+    Benchmarks the pipeline on a synthetic corpus with known content: invoices per second and time of every step
+    of the extraction, extraction accuracy against the ground truth, amount parsing, post-processing with the
+    accuracy of its output, and reorder suggestions. The report is compared with the previous one, then replaces it.
+
+    Parameters:
+    count (int): Number of invoices of the corpus. Default is 200.
+    seed (int): Seed of the corpus. Default is 0.
+    spanish_share (float): Share of Spanish invoices. Default is 0.3.
+    workers (int): Number of worker processes, for generation and extraction. Default is 1.
+    engine (str): Extraction engine. Default is 'docx'.
+    cold (bool): Whether to clear the converted documents and caches before extracting. Default is True.
+    report_path (str): The path of the JSON report. Default is 'BENCHMARK_REPORT_PATH'.
+
+    Returns:
+    dict: The report.
+    """
+
+    truth, generation_s = prepare_corpus(count, seed, spanish_share, workers)
+    extraction = run_extraction(workers, engine, cold)
+
+    invoices_path = SYNTHETIC_DIR_PATH + 'invoices.csv'
+    extracted = pd.read_csv(invoices_path, dtype=str)
+
+    report = {
+        'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'corpus': {'count': count, 'seed': seed, 'spanish_share': spanish_share, 'lines': len(truth),
+                   'generation_s': round(generation_s, 3) if generation_s is not None else None},
+        'settings': {'workers': workers, 'engine': engine, 'cold': cold},
+        'invoices_per_second': round(count / extraction['wall_s'], 3),
+        'extraction': extraction,
+        'accuracy': extraction_accuracy(truth, extracted),
+        'amount_parsing': benchmark_amount_parsing(truth),
+        'downstream': benchmark_downstream(truth, extracted),
+    }
+
+    previous = None
+    if os.path.isfile(report_path):
+        with open(report_path, encoding='utf-8') as file:
+            previous = json.load(file)
+        if previous.get('corpus', {}).get('count') != count or previous.get('settings') != report['settings']:
+            print('The previous report used another corpus or other settings; not compared')
+            previous = None
+
+    accuracy = report['accuracy']
+    print(f'{count} invoices in {extraction["wall_s"]} s: {report["invoices_per_second"]} invoices/s')
+    print(f'invoice recall {accuracy["invoice_recall"]:.2%}, line recall {accuracy["line_recall"]:.2%}, '
+          f'line precision {accuracy["line_precision"] or 0:.2%}; '
+          f'revised lines right after post-processing {report["downstream"]["accuracy"]["line_accuracy"]:.2%}')
+    if previous is not None:
+        _print_comparison(report, previous)
+
+    directory = os.path.dirname(report_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=1)
+    print(f'Benchmark report: {report_path}')
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmarks the extraction pipeline on a synthetic invoice corpus.')
+    parser.add_argument('--count', type=int, default=200, help='number of invoices (default: 200)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the corpus (default: 0)')
+    parser.add_argument('--spanish-share', type=float, default=0.3, help='share of Spanish invoices (default: 0.3)')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--engine', choices=ENGINES, default='docx', help='extraction engine (default: docx)')
+    parser.add_argument('--warm', action='store_true', help='keep the converted documents and caches of the previous run')
+    args = parser.parse_args()
+
+    main(count=args.count, seed=args.seed, spanish_share=args.spanish_share, workers=args.workers, engine=args.engine,
+         cold=not args.warm)
@@ -0,0 +1,204 @@
+import os
+import glob
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+from utils import file_hash, source_version
+from setup import CATALOGS_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+# Every '<Factory>_catalog.csv' file in 'CATALOGS_DIR_PATH' is compiled into the index
+CATALOG_FILE_SUFFIX = '_catalog.csv'
+CATALOG_INDEX_PATH = GENERATED_FILES_DIR_PATH + 'catalog_index.pkl'
+
+# Columns of a compiled catalog, and the product columns they are looked up into
+CATALOG_COLUMNS = ['COD', 'REFERÊNCIA', 'TAMANHO', 'FACTORY']
+LOOKUP_COLUMNS = ['Product_name', 'Size', 'Factory']
+
+
+def normalize_codes(codes: pd.Series) -> pd.Series:
+    """
+    Normalizes raw catalog codes to the product codes printed on the invoices, vectorized: keeps the digits only,
+    drops the trailing check digit and pads to 5 characters.
+
+    Parameters:
+    codes (pd.Series): The raw 'COD' column.
+
+    Returns:
+    pd.Series: The normalized codes. Missing codes stay missing.
+    """
+
+    normalized = codes.astype(str).str.replace(r'\D', '', regex=True).str[:-1].str.zfill(5)
+    return normalized.where(codes.notna())
+
+
+def read_factory_catalog(file_path: str) -> pd.DataFrame:
+    """
+    Reads one factory catalog and normalizes its codes. The factory name is taken from the file name.
+
+    Parameters:
+    file_path (str): The path of a '<Factory>_catalog.csv' file.
+
+    Returns:
+    pd.DataFrame: The catalog with the 'CATALOG_COLUMNS' columns.
+    """
+
+    catalog = pd.read_csv(file_path, dtype={'COD': str})
+    catalog['COD'] = normalize_codes(catalog['COD'])
+    catalog['FACTORY'] = os.path.basename(file_path)[:-len(CATALOG_FILE_SUFFIX)]
+
+    return catalog.reindex(columns=CATALOG_COLUMNS)
+
+
+def get_compiler_version() -> str:
+    """
+    Version of the code that compiles the catalogs. Any change to it invalidates the cached artifact.
+
+    Returns:
+    str: The version string.
+    """
+
+    return source_version(normalize_codes, read_factory_catalog)
+
+
+class CatalogIndex:
+    """
+    All factory catalogs compiled into one frame plus a prebuilt code -> (name, size, factory) dictionary,
+    so matching the products of an invoice is a dictionary lookup per row. When two rows share a code, the first
+    one wins (factories in file name order).
+
+    Usage:
+    catalog = load_catalog_index()
+    products[LOOKUP_COLUMNS] = catalog.lookup(products['Product_code'])
+    """
+
+    def __init__(self, frame: pd.DataFrame, sources: dict) -> None:
+        """
+        Builds the index of a compiled catalog frame.
+
+        Parameters:
+        frame (pd.DataFrame): The compiled catalogs, with the 'CATALOG_COLUMNS' columns.
+        sources (dict): Size, modification time and SHA-256 of every catalog file, by file name.
+        """
+
+        self.frame = frame
+        self.sources = sources
+
+        unique = frame.dropna(subset=['COD']).drop_duplicates(subset='COD', keep='first')
+        self.duplicates = int(frame['COD'].notna().sum()) - len(unique)
+        self.entries = dict(zip(unique['COD'], zip(unique['REFERÊNCIA'], unique['TAMANHO'], unique['FACTORY'])))
+
+        # Changes with the content of the catalogs or with the code that compiles them, not with modification times
+        self.code_version = get_compiler_version()
+        digest = hashlib.sha256(self.code_version.encode('utf-8'))
+        for name in sorted(sources):
+            digest.update(f"{name}:{sources[name]['hash']}".encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+
+    def lookup(self, codes: pd.Series) -> pd.DataFrame:
+        """
+        Finds the catalog entry of every product code.
+
+        Parameters:
+        codes (pd.Series): Product codes, as strings.
+
+        Returns:
+        pd.DataFrame: The 'LOOKUP_COLUMNS' of each code (NaN when not in the catalog), with the index of 'codes'.
+        """
+
+        missing = (np.nan, np.nan, np.nan)
+        rows = [self.entries.get(code, missing) for code in codes]
+
+        return pd.DataFrame(rows, columns=LOOKUP_COLUMNS, index=codes.index)
+
+
+def _save_catalog_index(index: CatalogIndex, index_path: str) -> None:
+    """
+    Writes the catalog index artifact atomically.
+
+    Parameters:
+    index (CatalogIndex): The catalog index.
+    index_path (str): The path of the artifact.
+    """
+
+    directory = os.path.dirname(index_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, index_path)
+
+
+def _scan_catalog_files(directory_path: str) -> list[str]:
+    """
+    Lists the catalog files of a directory.
+
+    Parameters:
+    directory_path (str): The directory of the catalog files.
+
+    Returns:
+    list[str]: The paths of the catalog files, sorted.
+    """
+
+    return sorted(glob.glob(os.path.join(directory_path, '*' + CATALOG_FILE_SUFFIX)))
+
+
+def load_catalog_index(directory_path: str = CATALOGS_DIR_PATH, index_path: str = CATALOG_INDEX_PATH) -> CatalogIndex:
+    """
+    Loads the compiled catalog index, compiling it again only when needed. The cached artifact is reused when
+    the set of catalog files is the same and each file has the same size and modification time, or failing
+    that, the same content hash.
+
+    Parameters:
+    directory_path (str, optional): The directory of the catalog files. Default is 'CATALOGS_DIR_PATH'.
+    index_path (str, optional): The path of the cached artifact. Default is 'CATALOG_INDEX_PATH'.
+
+    Returns:
+    CatalogIndex: The catalog index.
+    """
+
+    file_paths = _scan_catalog_files(directory_path)
+    if not file_paths:
+        raise FileNotFoundError(f'No *{CATALOG_FILE_SUFFIX} files in {directory_path}')
+
+    cached = None
+    if os.path.isfile(index_path):
+        try:
+            with open(index_path, 'rb') as file:
+                cached = pickle.load(file)
+        except Exception as e:
+            print(f'Catalog index could not be read, compiling it again: {type(e).__name__}: {str(e)}')
+
+    sources = {}
+    stale = (cached is None or cached.code_version != get_compiler_version()
+             or set(cached.sources) != {os.path.basename(path) for path in file_paths})
+    for file_path in file_paths:
+        name = os.path.basename(file_path)
+        stat = os.stat(file_path)
+        known = None if cached is None else cached.sources.get(name)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            sources[name] = known
+            continue
+
+        sources[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': file_hash(file_path)}
+        stale = stale or known is None or known['hash'] != sources[name]['hash']
+
+    if not stale:
+        if cached.sources != sources:
+            # Only modification times changed: keep the compiled index and remember the new times
+            cached.sources = sources
+            _save_catalog_index(cached, index_path)
+        return cached
+
+    frame = pd.concat([read_factory_catalog(path) for path in file_paths], ignore_index=True)
+    index = CatalogIndex(frame, sources)
+    print(f'Catalog index compiled: {len(frame)} rows from {len(file_paths)} catalogs')
+    if index.duplicates:
+        print(f'Catalog index: {index.duplicates} duplicated codes, the first occurrence is used')
+    _save_catalog_index(index, index_path)
+
+    return index
+
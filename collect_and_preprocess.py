@@ -1,299 +1,581 @@
-import os
-import shutil
-from docx import Document
-from text_extraction import *
-
-from setup import SOURCE_DIR, PDFs_DIR_PATH
-
-
-def copy_pdf_files(src_dir: str, dest_dir: str) -> None:
-    """
-    Copies all PDF files from a source directory (including its subdirectories)
-    to a destination directory. It creates the destination directory if it does not already exist.
-    It also avoids overwritting . 
-
-    Parameters:
-    src_dir (str): Source path where we take the pdfs.
-    dest_dir (str): Destination path where we send the pdfs.
-    """
-
-    if not os.path.exists(dest_dir):
-        os.makedirs(dest_dir)
-
-    # Iterate through the source directory, including all subdirectories
-    for root, dirs, files in os.walk(src_dir):
-        for file_name in files:
-            if file_name.endswith('.pdf'):
-                source = os.path.join(root, file_name)
-                destination = os.path.join(dest_dir, file_name)
-
-                counter = 0
-                while os.path.exists(destination):
-                    counter += 1
-                    base_name, extension = os.path.splitext(file_name)
-                    destination = os.path.join(dest_dir, f'{base_name}_{counter}{extension}')
-
-                shutil.copy2(source, destination)
-                print(f'Copied {source} to {destination}')
-
-
-def keep_invoices_only() -> None:
-    """
-    This function iterates through all files in the 'PDFs_DIR_PATH' directory, identifies PDF files that are 
-    either English or Spanish invoices based on specific keywords, and counts them. Files that are not identified 
-    as invoices are deleted from the directory.
-    """
-
-    files = [f for f in os.listdir(PDFs_DIR_PATH) if os.path.isfile(os.path.join(PDFs_DIR_PATH, f))]
-
-    invoice_english_counter = 0
-    invoice_spanish_counter = 0
-    others_counter = 0
-    counter = 0
-    for f in files:
-        pdf_text = get_text_from_pdf(f)
-        lines_pdf = re.split('\n', pdf_text)
-        # Remove all whitespaces from all strings
-        lines_pdf = [''.join(l.split()) for l in lines_pdf]
-
-        isInvoice1 = any('commercialinvoice' in l.lower() for l in lines_pdf)
-        isInvoice2 = any('paymentconditions' in l.lower() for l in lines_pdf)
-        isInvoice3 = any('facturacomercial' in l.lower() for l in lines_pdf)
-        isInvoice4 = any('condicionesdepago' in l.lower() for l in lines_pdf)
-
-        if isInvoice1 and isInvoice2:
-            invoice_english_counter += 1
-        elif isInvoice3 and isInvoice4:
-            invoice_spanish_counter += 1
-        else:
-            others_counter += 1
-            file_path = PDFs_DIR_PATH + f
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f'{file_path} has been deleted!')
-            else:
-                print(f'The file {file_path} does not exist!')
-
-        counter += 1
-        print(f'[{counter}/{len(files)}] - file analyzed')
-
-    print(f'Invoices English: {invoice_english_counter}')
-    print(f'Invoices Spanish: {invoice_spanish_counter}')
-    print(f'Others {others_counter}')
-
-
-def preprocess_pdf(pdf_file_name: str) -> None:
-    """
-    Preprocesses a given PDF file. It looks for pages containing key phrases in English and Spanish. 
-    If these phrases are found in the first page, the original PDF is kept as is. 
-    If found in subsequent pages, only the page where these are found and the following pages 
-    are retained in a new PDF. The processed PDF is saved with the same name in the same directory.
-
-    Parameters:
-    pdf_file_name (str): The name of the PDF file.
-    """
-
-    pdf_file_path = PDFs_DIR_PATH + pdf_file_name
-    output_pdf_file_path = pdf_file_path
-
-    try:
-        with open(pdf_file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            writer = PyPDF2.PdfWriter()
-
-            # Iterate through the pages to find the target page
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                text = page.extract_text().lower()  # Get the text content in lower case
-                text = ''.join(text.split())  # Remove all whitespaces
-
-                # Check if both "commercial invoice" and "payment conditions" are present
-                is_english = 'commercialinvoice' in text and 'paymentconditions' in text
-                is_spanish = 'facturacomercial' in text and 'condicionesdepago' in text
-                if is_english or is_spanish:
-                    # If found in the first page, just save the original PDF
-                    if page_num == 0:
-                        writer = reader
-                        return
-                    else:
-                        # If found in other pages, add the current and following pages to the new PDF
-                        for remaining_page_num in range(page_num, len(reader.pages)):
-                            writer.add_page(reader.pages[remaining_page_num])
-                    break
-
-            with open(output_pdf_file_path, 'wb') as output_file:
-                writer.write(output_file)
-
-            print(f"Processed file saved to {output_pdf_file_path}")
-
-    except FileNotFoundError:
-        print(f'The file {pdf_file_path} does not exist.')
-    except Exception as e:
-        print(f'An unexpected error with the file {pdf_file_path} occurred: {str(e)}')
-
-
-def rename_files() -> None:
-    """
-    Assures file names consistency by renaming certain files
-    """
-
-    for file in os.listdir(PDFs_DIR_PATH):
-        filepath = os.path.join(PDFs_DIR_PATH, file)
-
-        if os.path.isfile(filepath):
-            # Replace whitespaces with underscores in the filename
-            s = file.replace(' ', '-')
-            new_filename = s
-            if s.count('.') > 1:
-                s_without_periods = s.replace('.', '')
-                last_period_position = s.rfind('.')
-                new_filename = s_without_periods[:last_period_position] + '.' + s_without_periods[last_period_position:]
-
-            if new_filename.endswith('p.df'):
-                new_filename = new_filename[:-4] + '.pdf'
-            new_filepath = os.path.join(PDFs_DIR_PATH, new_filename)
-
-            os.rename(filepath, new_filepath)
-            print(f'Renamed file {filepath} - {new_filepath}')
-
-    print('Finished renaming files')
-
-
-def find_pds_with_multiple_invoices(directory_path: str) -> list[str]:
-    """
-    Searches for PDF files within the specified directory that contain multiple occurrences of 
-    certain keywords related to invoices. These keywords are 'commercial invoice', 'factura comercial',
-    'payment conditions', 'condiciones de pago', and 'FOB'. A PDF is considered a match if it contains 
-    at least two occurrences of each of these terms.
-
-    Parameters:
-    directory_path (str): The file path of the directory.
-
-    Returns:
-    list[str]: A list of file paths for the PDFs.
-    """
-
-    matching_pdfs = []
-
-    for filename in os.listdir(directory_path):
-        filepath = os.path.join(directory_path, filename)
-
-        if os.path.isfile(filepath) and filename.lower().endswith('.pdf'):
-            with open(filepath, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                occurrences_commercialinvoice = 0
-                occurrences_paymentconditions = 0
-                occurrences_fob = 0
-
-                for page_num in range(len(pdf_reader.pages)):
-                    text = pdf_reader.pages[page_num].extract_text()
-                    text = text.replace(' ', '').lower()
-                    occurrences_commercialinvoice += text.count('commercialinvoice') + text.count('facturacomercial')
-                    occurrences_paymentconditions += text.count('paymentconditions') + text.count('condicionesdepago')
-                    occurrences_fob += text.count('fob')
-
-                if occurrences_commercialinvoice >= 2 and occurrences_paymentconditions >= 2 and occurrences_fob >= 2:
-                    matching_pdfs.append(filepath)
-
-    return matching_pdfs
-
-
-def get_cell_content(docx_path: str, table_index: int, row_index: int, col_index: int) -> str:
-    """
-    Gets the content of a specific cell from a table in a DOCX document. The table, row, 
-    and column are specified by their indices.
-
-    Parameters:
-    docx_path (str): The file path of the DOCX document.
-    table_index (int): The index of the table within the document.
-    row_index (int): The row index within the table.
-    col_index (int): The column index within the row.
-
-    Returns:
-    str: The text content of the specified cell. 
-    """
-
-    doc = Document(docx_path)
-
-    if table_index >= len(doc.tables):
-        return "Table index out of range!"
-
-    table = doc.tables[table_index]
-
-    if row_index >= len(table.rows) or col_index >= len(table.columns):
-        return "Row or Column index out of range!"
-
-    cell = table.cell(row_index, col_index)
-    return cell.text.strip()
-
-
-def find_cell_with_exact_content(docx_path: str, target_string: str) -> list[int] or None:
-    """
-    Searches through (case-insensitive) all tables in a DOCX document to find a cell that exactly matches the given target string.
-
-    Parameters:
-    docx_path (str): The file path of the DOCX document.
-    target_string (str): The string to search for.
-
-    Returns:
-    list[int] or None: A list containing the indices of the table, row, and column of the matching cell, if found.
-    Returns None if no matching cell is found.
-    """
-
-    doc = Document(docx_path)
-
-    for table_num, table in enumerate(doc.tables):
-        for row_num, row in enumerate(table.rows):
-            for col_num, cell in enumerate(row.cells):
-                cell_content = cell.text.strip()  
-                if cell_content.lower() == target_string.lower():
-                    return [table_num, row_num, col_num]
-
-    return None
-
-
-def merge_row_cells_with_below(docx_path: str, table_index: int, row_index: int, save_path: str = None) -> str or None:
-    """
-    Merges each cell in a specified row of a table with the cell directly below it in a DOCX document. 
-
-    Parameters:
-    docx_path (str): The file path of the DOCX document.
-    table_index (int): The index of the table within the document.
-    row_index (int): The index of the row within the table to merge with the row below.
-    save_path (str): The file path to save the modified document. If None, the document is not saved.
-
-    Returns:
-    str or None: Returns an error message if the table or row indices are out of range, or None if the operation is successful.
-    """
-
-    doc = Document(docx_path)
-
-    if table_index >= len(doc.tables):
-        return "Table index out of range!"
-
-    table = doc.tables[table_index]
-
-    if row_index >= len(table.rows) - 1:
-        return "Row index out of range!"
-
-    for col_index in range(len(table.columns)):
-        cell = table.cell(row_index, col_index)
-        cell_below = table.cell(row_index + 1, col_index)
-
-        try:
-            cell.merge(cell_below)
-        except:
-            continue
-
-    if save_path:
-        doc.save(save_path)
-        print(f'Cells merged in {save_path}')
-
-
-
-
-
-
-
-
-
+import os
+import io
+import json
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from docx import Document
+from text_extraction import *
+from utils import file_hash
+
+from setup import SOURCE_DIR, PDFs_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+TRIAGE_PATH = GENERATED_FILES_DIR_PATH + 'triage.json'
+SYNC_STATE_PATH = GENERATED_FILES_DIR_PATH + 'sync_state.json'
+
+# Title and payment-conditions keywords of each invoice language (lower case, without whitespaces)
+INVOICE_KEYWORDS = {
+    'english': ('commercialinvoice', 'paymentconditions'),
+    'spanish': ('facturacomercial', 'condicionesdepago'),
+}
+
+
+def copy_pdf_files(src_dir: str, dest_dir: str) -> None:
+    """
+    Copies all PDF files from a source directory (including its subdirectories)
+    to a destination directory. It creates the destination directory if it does not already exist.
+    It also avoids overwritting . 
+
+    Parameters:
+    src_dir (str): Source path where we take the pdfs.
+    dest_dir (str): Destination path where we send the pdfs.
+    """
+
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+
+    # Iterate through the source directory, including all subdirectories
+    for root, dirs, files in os.walk(src_dir):
+        for file_name in files:
+            if file_name.endswith('.pdf'):
+                source = os.path.join(root, file_name)
+                destination = os.path.join(dest_dir, file_name)
+
+                counter = 0
+                while os.path.exists(destination):
+                    counter += 1
+                    base_name, extension = os.path.splitext(file_name)
+                    destination = os.path.join(dest_dir, f'{base_name}_{counter}{extension}')
+
+                shutil.copy2(source, destination)
+                print(f'Copied {source} to {destination}')
+
+
+def _place_file(source: str, destination: str, link: bool) -> str:
+    """
+    Puts a copy of a file at the destination, as a hard link when allowed and possible
+    (same filesystem), otherwise as a regular copy.
+
+    Parameters:
+    source (str): The path of the source file.
+    destination (str): The path of the destination file.
+    link (bool): Whether hard links may be used.
+
+    Returns:
+    str: 'linked' or 'copied'.
+    """
+
+    if link:
+        try:
+            os.link(source, destination)
+            return 'linked'
+        except OSError:
+            pass
+
+    shutil.copy2(source, destination)
+    return 'copied'
+
+
+def sync_pdf_files(src_dir: str = SOURCE_DIR, dest_dir: str = PDFs_DIR_PATH, workers: int = 8, link: bool = True,
+                   state_path: str = SYNC_STATE_PATH) -> dict:
+    """
+    Incremental, deduplicating version of 'copy_pdf_files'. The size, modification time and content hash of
+    every source PDF are remembered between runs, so:
+    - sources that did not change since the last sync are skipped without being read;
+    - a PDF whose content is already in the destination (e.g. the same invoice sent twice) is not stored again;
+    - only new content is placed in the destination, keeping the '_1', '_2' naming on name collisions.
+    Hashing and copying run in a thread pool. When source and destination are on the same filesystem, files are
+    hard-linked instead of copied.
+
+    Parameters:
+    src_dir (str, optional): Source path where we take the pdfs. Default is 'SOURCE_DIR'.
+    dest_dir (str, optional): Destination path where we send the pdfs. Default is 'PDFs_DIR_PATH'.
+    workers (int, optional): Number of threads. Default is 8.
+    link (bool, optional): Whether to hard-link instead of copying when possible. Default is True.
+    state_path (str, optional): Path of the JSON file with the sync state. Default is 'SYNC_STATE_PATH'.
+
+    Returns:
+    dict: Number of unchanged, duplicate, copied and linked files.
+    """
+
+    if not os.path.exists(dest_dir):
+        os.makedirs(dest_dir)
+
+    state = {'sources': {}, 'contents': {}}
+    if os.path.isfile(state_path):
+        with open(state_path, 'r', encoding='utf-8') as file:
+            state = json.load(file)
+    sources, contents = state['sources'], state['contents']
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # On the first sync, the PDFs already in the destination count as stored content
+        if not contents:
+            existing = [os.path.join(dest_dir, f) for f in sorted(os.listdir(dest_dir)) if f.endswith('.pdf')]
+            for destination, digest in zip(existing, executor.map(file_hash, existing)):
+                contents.setdefault(digest, destination)
+
+        # Iterate through the source directory, including all subdirectories
+        candidates = []
+        stats = {'unchanged': 0, 'duplicate': 0, 'copied': 0, 'linked': 0}
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
+            for file_name in sorted(files):
+                if not file_name.endswith('.pdf'):
+                    continue
+
+                source = os.path.join(root, file_name)
+                stat = os.stat(source)
+                known = sources.get(source)
+                if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                    stats['unchanged'] += 1
+                    continue
+                candidates.append((source, stat))
+
+        to_place = []
+        reserved = set()
+        digests = executor.map(file_hash, [source for source, _ in candidates])
+        for (source, stat), digest in zip(candidates, digests):
+            # Known content is skipped even if its copy was renamed or deleted by a later preprocessing step
+            destination = contents.get(digest)
+            if destination is not None:
+                stats['duplicate'] += 1
+                print(f'Skipped {source} - same content as {destination}')
+            else:
+                file_name = os.path.basename(source)
+                destination = os.path.join(dest_dir, file_name)
+
+                counter = 0
+                while os.path.exists(destination) or destination in reserved:
+                    counter += 1
+                    base_name, extension = os.path.splitext(file_name)
+                    destination = os.path.join(dest_dir, f'{base_name}_{counter}{extension}')
+
+                to_place.append((source, destination))
+                reserved.add(destination)
+                contents[digest] = destination
+
+            sources[source] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': digest, 'destination': destination}
+
+        placed = executor.map(lambda item: _place_file(item[0], item[1], link), to_place)
+        for (source, destination), how in zip(to_place, placed):
+            stats[how] += 1
+            print(f'{how.capitalize()} {source} to {destination}')
+
+    state_directory = os.path.dirname(state_path)
+    if state_directory and not os.path.exists(state_directory):
+        os.makedirs(state_directory)
+    with open(state_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+
+    print(f'Sync: {stats}')
+    return stats
+
+
+def triage_pdf(file_path: str, count_invoices: bool = True) -> dict:
+    """
+    Reads the text of every page of a PDF once and reports, in a single pass, what the preprocessing steps need:
+    - language: 'english' or 'spanish' when the document contains both the title and the payment-conditions
+      keywords of that language anywhere, None when it is not an invoice (as in 'keep_invoices_only');
+    - start_page: the first page containing both keywords of a language (as in 'preprocess_pdf');
+    - invoices and page_ranges: every such page starts a new invoice, which runs until the next one;
+    - multiple_invoices: at least two occurrences of the title, payment-conditions and FOB keywords
+      (as in 'find_pds_with_multiple_invoices').
+
+    Parameters:
+    file_path (str): The path of the PDF file.
+    count_invoices (bool, optional): If False, reading stops at the first invoice page, leaving the page count,
+    invoices, page_ranges and multiple_invoices unknown (None). Default is True.
+
+    If a page cannot be read, 'error' is set; language and start_page are those of the pages read before it,
+    and the counts are unknown.
+
+    Returns:
+    dict: The triage result.
+    """
+
+    result = {'file': os.path.basename(file_path), 'pages': None, 'language': None, 'start_page': None,
+              'invoices': None, 'page_ranges': None, 'multiple_invoices': None, 'error': None}
+
+    found = {keyword: False for keywords in INVOICE_KEYWORDS.values() for keyword in keywords}
+    occurrences = {'title': 0, 'conditions': 0, 'fob': 0}
+    start_pages = []
+    page_num = -1
+    try:
+        for page_num, text in enumerate(iter_page_texts_from_pdf(file_path)):
+            text = ''.join(text.split()).lower()  # Remove all whitespaces
+
+            for keyword in found:
+                found[keyword] = found[keyword] or keyword in text
+
+            if any(title in text and conditions in text for title, conditions in INVOICE_KEYWORDS.values()):
+                start_pages.append(page_num)
+                if not count_invoices:
+                    break
+
+            for title, conditions in INVOICE_KEYWORDS.values():
+                occurrences['title'] += text.count(title)
+                occurrences['conditions'] += text.count(conditions)
+            occurrences['fob'] += text.count('fob')
+
+    except Exception as e:
+        # The language and first invoice page are still known from the pages read before the error
+        result['error'] = f'{type(e).__name__}: {str(e)}'
+
+    for language, (title, conditions) in INVOICE_KEYWORDS.items():
+        if found[title] and found[conditions]:
+            result['language'] = language
+            break
+
+    result['start_page'] = start_pages[0] if start_pages else None
+    if count_invoices and result['error'] is None:
+        result['pages'] = page_num + 1
+        result['invoices'] = len(start_pages)
+        result['page_ranges'] = [[start, end - 1] for start, end in zip(start_pages, start_pages[1:] + [page_num + 1])]
+        result['multiple_invoices'] = all(count >= 2 for count in occurrences.values())
+
+    return result
+
+
+def triage_documents(directory_path: str = PDFs_DIR_PATH, workers: int = 4, save_path: str = TRIAGE_PATH) -> list[dict]:
+    """
+    Triages every PDF of a directory in parallel and saves the results, so later stages can reuse them.
+    Files whose size and modification time did not change since the saved triage are not read again.
+
+    Parameters:
+    directory_path (str, optional): The path of the directory. Default is 'PDFs_DIR_PATH'.
+    workers (int, optional): Number of worker processes. Default is 4.
+    save_path (str, optional): Path of the JSON file with the results. Default is 'TRIAGE_PATH'.
+
+    Returns:
+    list[dict]: One triage result per PDF file (see 'triage_pdf'), with the file size and modification time.
+    """
+
+    previous = {result['file']: result for result in load_triage(directory_path, save_path)}
+
+    results = {}
+    to_triage = []
+    for filename in sorted(os.listdir(directory_path)):
+        filepath = os.path.join(directory_path, filename)
+        if not (os.path.isfile(filepath) and filename.lower().endswith('.pdf')):
+            continue
+
+        stat = os.stat(filepath)
+        known = previous.get(filename)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime and not known['error']:
+            results[filename] = known
+        else:
+            to_triage.append((filename, filepath, stat))
+
+    filepaths = [filepath for _, filepath, _ in to_triage]
+    if workers <= 1:
+        triaged = map(triage_pdf, filepaths)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        triaged = executor.map(triage_pdf, filepaths, chunksize=8)
+
+    for (filename, _, stat), result in zip(to_triage, triaged):
+        result['size'] = stat.st_size
+        result['mtime'] = stat.st_mtime
+        results[filename] = result
+
+    if workers > 1:
+        executor.shutdown()
+
+    results = [results[filename] for filename in sorted(results)]
+    print(f'Triage: {len(to_triage)} files read, {len(results) - len(to_triage)} reused')
+
+    save_directory = os.path.dirname(save_path)
+    if save_directory and not os.path.exists(save_directory):
+        os.makedirs(save_directory)
+    with open(save_path, 'w', encoding='utf-8') as file:
+        json.dump({'directory': directory_path, 'results': results}, file, indent=1)
+
+    return results
+
+
+def load_triage(directory_path: str = PDFs_DIR_PATH, save_path: str = TRIAGE_PATH) -> list[dict]:
+    """
+    Loads the results saved by 'triage_documents' for a directory.
+
+    Parameters:
+    directory_path (str, optional): The path of the triaged directory. Default is 'PDFs_DIR_PATH'.
+    save_path (str, optional): Path of the JSON file with the results. Default is 'TRIAGE_PATH'.
+
+    Returns:
+    list[dict]: The triage results, or an empty list if there are none for this directory.
+    """
+
+    if not os.path.isfile(save_path):
+        return []
+
+    with open(save_path, 'r', encoding='utf-8') as file:
+        saved = json.load(file)
+
+    if saved['directory'] != directory_path:
+        return []
+    return saved['results']
+
+
+def keep_invoices_only(triage_results: list[dict] or None = None) -> None:
+    """
+    This function goes through the triage of all files in the 'PDFs_DIR_PATH' directory, identifies PDF files that are 
+    either English or Spanish invoices based on specific keywords, and counts them. Files that are not identified 
+    as invoices are deleted from the directory; files that could not be read completely are kept.
+
+    Parameters:
+    triage_results (list[dict] or None): Results of 'triage_documents'. If None, the directory is triaged first.
+    """
+
+    if triage_results is None:
+        triage_results = triage_documents()
+
+    invoice_english_counter = 0
+    invoice_spanish_counter = 0
+    others_counter = 0
+    errors_counter = 0
+    counter = 0
+    for result in triage_results:
+        f = result['file']
+        if result['language'] is None and result['error']:
+            # A file that could not be read completely is never deleted
+            errors_counter += 1
+            print(f'{PDFs_DIR_PATH + f} kept - could not be read: {result["error"]}')
+        elif result['language'] == 'english':
+            invoice_english_counter += 1
+        elif result['language'] == 'spanish':
+            invoice_spanish_counter += 1
+        else:
+            others_counter += 1
+            file_path = PDFs_DIR_PATH + f
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                print(f'{file_path} has been deleted!')
+            else:
+                print(f'The file {file_path} does not exist!')
+
+        counter += 1
+        print(f'[{counter}/{len(triage_results)}] - file analyzed')
+
+    print(f'Invoices English: {invoice_english_counter}')
+    print(f'Invoices Spanish: {invoice_spanish_counter}')
+    print(f'Others {others_counter}')
+    print(f'Unreadable (kept): {errors_counter}')
+
+
+def preprocess_pdf(pdf_file_name: str, start_page: int or None = None) -> None:
+    """
+    Preprocesses a given PDF file. It looks for pages containing key phrases in English and Spanish. 
+    If these phrases are found in the first page, the original PDF is kept as is. 
+    If found in subsequent pages, only the page where these are found and the following pages 
+    are retained in a new PDF. The processed PDF is saved with the same name in the same directory.
+
+    Parameters:
+    pdf_file_name (str): The name of the PDF file.
+    start_page (int or None): The first invoice page, as found by 'triage_pdf'. If None, the file is triaged
+    first, stopping at the first invoice page.
+    """
+
+    pdf_file_path = PDFs_DIR_PATH + pdf_file_name
+    output_pdf_file_path = pdf_file_path
+
+    try:
+        if start_page is None:
+            start_page = triage_pdf(pdf_file_path, count_invoices=False)['start_page']
+
+        # If found in the first page (or not found at all), just keep the original PDF
+        if not start_page:
+            return
+
+        with open(pdf_file_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(io.BytesIO(file.read()))
+
+        # Add the invoice page and the following pages to the new PDF
+        writer = PyPDF2.PdfWriter()
+        for remaining_page_num in range(start_page, len(reader.pages)):
+            writer.add_page(reader.pages[remaining_page_num])
+
+        # Written aside and moved into place, so a hard-linked source (see 'sync_pdf_files') is never modified
+        with open(output_pdf_file_path + '.tmp', 'wb') as output_file:
+            writer.write(output_file)
+        os.replace(output_pdf_file_path + '.tmp', output_pdf_file_path)
+
+        print(f"Processed file saved to {output_pdf_file_path}")
+
+    except FileNotFoundError:
+        print(f'The file {pdf_file_path} does not exist.')
+    except Exception as e:
+        print(f'An unexpected error with the file {pdf_file_path} occurred: {str(e)}')
+
+
+def rename_files() -> None:
+    """
+    Assures file names consistency by renaming certain files
+    """
+
+    for file in os.listdir(PDFs_DIR_PATH):
+        filepath = os.path.join(PDFs_DIR_PATH, file)
+
+        if os.path.isfile(filepath):
+            # Replace whitespaces with underscores in the filename
+            s = file.replace(' ', '-')
+            new_filename = s
+            if s.count('.') > 1:
+                s_without_periods = s.replace('.', '')
+                last_period_position = s.rfind('.')
+                new_filename = s_without_periods[:last_period_position] + '.' + s_without_periods[last_period_position:]
+
+            if new_filename.endswith('p.df'):
+                new_filename = new_filename[:-4] + '.pdf'
+            new_filepath = os.path.join(PDFs_DIR_PATH, new_filename)
+
+            os.rename(filepath, new_filepath)
+            print(f'Renamed file {filepath} - {new_filepath}')
+
+    print('Finished renaming files')
+
+
+def find_pds_with_multiple_invoices(directory_path: str, triage_results: list[dict] or None = None) -> list[str]:
+    """
+    Searches for PDF files within the specified directory that contain multiple occurrences of 
+    certain keywords related to invoices. These keywords are 'commercial invoice', 'factura comercial',
+    'payment conditions', 'condiciones de pago', and 'FOB'. A PDF is considered a match if it contains 
+    at least two occurrences of each of these terms.
+
+    Parameters:
+    directory_path (str): The file path of the directory.
+    triage_results (list[dict] or None): Results of 'triage_documents' for this directory. If None, the directory is triaged first.
+
+    Returns:
+    list[str]: A list of file paths for the PDFs.
+    """
+
+    if triage_results is None:
+        triage_results = triage_documents(directory_path)
+
+    return [os.path.join(directory_path, result['file']) for result in triage_results if result['multiple_invoices']]
+
+
+def get_cell_content(docx_path: str, table_index: int, row_index: int, col_index: int) -> str:
+    """
+    Gets the content of a specific cell from a table in a DOCX document. The table, row, 
+    and column are specified by their indices.
+
+    Parameters:
+    docx_path (str): The file path of the DOCX document.
+    table_index (int): The index of the table within the document.
+    row_index (int): The row index within the table.
+    col_index (int): The column index within the row.
+
+    Returns:
+    str: The text content of the specified cell. 
+    """
+
+    doc = Document(docx_path)
+
+    if table_index >= len(doc.tables):
+        return "Table index out of range!"
+
+    table = doc.tables[table_index]
+
+    if row_index >= len(table.rows) or col_index >= len(table.columns):
+        return "Row or Column index out of range!"
+
+    cell = table.cell(row_index, col_index)
+    return cell.text.strip()
+
+
+def find_cell_with_exact_content(docx_path: str, target_string: str) -> list[int] or None:
+    """
+    Searches through (case-insensitive) all tables in a DOCX document to find a cell that exactly matches the given target string.
+
+    Parameters:
+    docx_path (str): The file path of the DOCX document.
+    target_string (str): The string to search for.
+
+    Returns:
+    list[int] or None: A list containing the indices of the table, row, and column of the matching cell, if found.
+    Returns None if no matching cell is found.
+    """
+
+    doc = Document(docx_path)
+
+    for table_num, table in enumerate(doc.tables):
+        for row_num, row in enumerate(table.rows):
+            for col_num, cell in enumerate(row.cells):
+                cell_content = cell.text.strip()  
+                if cell_content.lower() == target_string.lower():
+                    return [table_num, row_num, col_num]
+
+    return None
+
+
+def merge_row_cells_with_below(docx_path: str, table_index: int, row_index: int, save_path: str = None) -> str or None:
+    """
+    Merges each cell in a specified row of a table with the cell directly below it in a DOCX document. 
+
+    Parameters:
+    docx_path (str): The file path of the DOCX document.
+    table_index (int): The index of the table within the document.
+    row_index (int): The index of the row within the table to merge with the row below.
+    save_path (str): The file path to save the modified document. If None, the document is not saved.
+
+    Returns:
+    str or None: Returns an error message if the table or row indices are out of range, or None if the operation is successful.
+    """
+
+    doc = Document(docx_path)
+
+    if table_index >= len(doc.tables):
+        return "Table index out of range!"
+
+    table = doc.tables[table_index]
+
+    if row_index >= len(table.rows) - 1:
+        return "Row index out of range!"
+
+    for col_index in range(len(table.columns)):
+        cell = table.cell(row_index, col_index)
+        cell_below = table.cell(row_index + 1, col_index)
+
+        try:
+            cell.merge(cell_below)
+        except:
+            continue
+
+    if save_path:
+        doc.save(save_path)
+        print(f'Cells merged in {save_path}')
+
+
+def main(src_dir: str = SOURCE_DIR, workers: int = 4) -> None:
+    """
+    Collects the PDFs and prepares them for extraction: new source files are synced into 'PDFs_DIR_PATH', file
+    names are made consistent, files that are not invoices are deleted and invoices starting after the first page
+    are cut to their invoice pages. Files holding several invoices are listed for review.
+
+    Parameters:
+    src_dir (str, optional): Source path where we take the pdfs. Default is 'SOURCE_DIR'.
+    workers (int, optional): Number of worker processes of the triage. Default is 4.
+    """
+
+    sync_pdf_files(src_dir, PDFs_DIR_PATH)
+    rename_files()
+
+    triage_results = triage_documents(PDFs_DIR_PATH, workers)
+    keep_invoices_only(triage_results)
+
+    for result in triage_results:
+        if result['language'] is not None and result['start_page']:
+            preprocess_pdf(result['file'], result['start_page'])
+
+    for file_path in find_pds_with_multiple_invoices(PDFs_DIR_PATH, triage_results):
+        print(f'Multiple invoices: {file_path}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Collects the PDFs of SOURCE_DIR into PDFs_DIR_PATH and prepares them for extraction.')
+    parser.add_argument('--workers', type=int, default=4, help='number of worker processes of the triage (default: 4)')
+    args = parser.parse_args()
+
+    main(workers=args.workers)
@@ -0,0 +1,130 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils import to_decimal_amounts
+from setup import GENERATED_FILES_DIR_PATH
+
+
+# Hand-off between post_processing.py and the scripts reading the revised invoices
+REVISED_INVOICES_PATH = GENERATED_FILES_DIR_PATH + 'invoices_revised-2_0.parquet'
+REVISED_INVOICES_EXCEL_PATH = GENERATED_FILES_DIR_PATH + 'invoices_revised-2_0.xlsx'
+
+# Column types of the revised invoices: codes and numbers identifying things are strings (e.g. product code '00990'),
+# amounts are exact decimals and dates have no time
+REVISED_INVOICES_SCHEMA = pa.schema([
+    ('Product_code', pa.string()),
+    ('Product_name', pa.string()),
+    ('Size', pa.string()),
+    ('Sqm', pa.decimal128(12, 2)),
+    ('Unit_price', pa.decimal128(12, 2)),
+    ('Total_price', pa.decimal128(14, 2)),
+    ('Invoice_number', pa.string()),
+    ('Client', pa.string()),
+    ('Country', pa.string()),
+    ('Date', pa.date32()),
+    ('Currency', pa.string()),
+    ('Destination', pa.string()),
+    ('FOB', pa.decimal128(14, 2)),
+])
+
+
+def _to_arrow(values: pd.Series, data_type: pa.DataType) -> pa.Array:
+    """
+    Converts a column to the type of its schema field.
+
+    Parameters:
+    values (pd.Series): The column.
+    data_type (pa.DataType): The type of the field.
+
+    Returns:
+    pa.Array: The typed column. Values that cannot be converted are stored as nulls.
+    """
+
+    if pa.types.is_decimal(data_type):
+        # Numeric cells are rounded as they are (12.345 is 12.35); only text amounts go through the separator rules
+        decimals = to_decimal_amounts(values, precision=data_type.scale)
+        return pa.array(decimals, type=data_type, from_pandas=True)
+
+    if pa.types.is_date(data_type):
+        dates = pd.to_datetime(values, errors='coerce').astype('datetime64[ns]')
+        return pa.array(dates, type=pa.timestamp('ns'), from_pandas=True).cast(data_type)
+
+    if pa.types.is_string(data_type):
+        # Whole numbers read as floats (e.g. product codes next to empty cells) are written without '.0'
+        if pd.api.types.is_float_dtype(values) and np.all(np.mod(values.dropna(), 1) == 0):
+            values = values.astype('Int64')
+        strings = values.astype('string').str.strip()
+        return pa.array(strings, type=pa.string(), from_pandas=True)
+
+    return pa.array(values, type=data_type, from_pandas=True)
+
+
+def write_table(df: pd.DataFrame, path: str, schema: pa.Schema = REVISED_INVOICES_SCHEMA) -> None:
+    """
+    Writes a DataFrame to a Parquet file with explicit column types. The file is replaced atomically, so readers
+    never see a partial file.
+
+    Parameters:
+    df (pd.DataFrame): The rows. Its columns found in 'schema' are converted to their types; the others are
+    written with the types inferred by pyarrow.
+    path (str): The path of the Parquet file.
+    schema (pa.Schema, optional): The column types. Default is 'REVISED_INVOICES_SCHEMA'.
+    """
+
+    fields, arrays = [], []
+    for column in df.columns:
+        if column in schema.names:
+            field = schema.field(column)
+            arrays.append(_to_arrow(df[column], field.type))
+        else:
+            arrays.append(pa.array(df[column], from_pandas=True))
+            field = pa.field(column, arrays[-1].type)
+        fields.append(field)
+    table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    pq.write_table(table, temp_path, compression='zstd')
+    os.replace(temp_path, path)
+
+
+def read_table(path: str, columns: list[str] or None = None, decimals_as_float: bool = True) -> pd.DataFrame:
+    """
+    Reads a Parquet file written by 'write_table'. The file is memory-mapped and only the requested columns are read.
+
+    Parameters:
+    path (str): The path of the Parquet file.
+    columns (list[str] or None, optional): The columns to read. Default is all of them.
+    decimals_as_float (bool, optional): Whether decimal columns are returned as floats, which every database
+    driver accepts, instead of Decimals. Default is True.
+
+    Returns:
+    pd.DataFrame: The rows, with dates as datetimes.
+    """
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+
+    if decimals_as_float:
+        for index, field in enumerate(table.schema):
+            if pa.types.is_decimal(field.type):
+                table = table.set_column(index, field.name, table.column(index).cast(pa.float64()))
+
+    return table.to_pandas(date_as_object=False)
+
+
+def export_excel(path: str, excel_path: str, columns: list[str] or None = None) -> None:
+    """
+    Exports a Parquet file to Excel, for people reviewing the data. No script reads the export.
+
+    Parameters:
+    path (str): The path of the Parquet file.
+    excel_path (str): The path of the Excel file.
+    columns (list[str] or None, optional): The columns to export. Default is all of them.
+    """
+
+    read_table(path, columns).to_excel(excel_path, index=False, engine='openpyxl')
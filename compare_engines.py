@@ -0,0 +1,129 @@
+import os
+import re
+import time
+import argparse
+import tempfile
+import pandas as pd
+from text_extraction import InvoiceDocument
+from invoice_processing import Invoice, ENGINES
+from catalog import CatalogIndex, load_catalog_index
+from setup import PDFs_DIR_PATH, DOCS_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+# Invoice attributes compared between the engines
+COMPARED_FIELDS = ['invoice_number', 'issue_date', 'client_name', 'currency', 'destination_port',
+                   'sub_total_amount', 'fumigation', 'fob']
+COMPARED_PRODUCT_COLUMNS = ['Product_code', 'Sqm', 'Unit_price', 'Total_price']
+
+
+def products_agree(products_a: pd.DataFrame, products_b: pd.DataFrame) -> bool:
+    """
+    Checks whether two invoices extracted the same product rows.
+
+    Parameters:
+    products_a (pd.DataFrame): Products of the first invoice.
+    products_b (pd.DataFrame): Products of the second invoice.
+
+    Returns:
+    bool: True if the product codes, quantities and prices are equal row by row.
+    """
+
+    if products_a.empty or products_b.empty:
+        return products_a.empty and products_b.empty
+
+    a = products_a[COMPARED_PRODUCT_COLUMNS].reset_index(drop=True).astype(str)
+    b = products_b[COMPARED_PRODUCT_COLUMNS].reset_index(drop=True).astype(str)
+    return a.equals(b)
+
+
+def compare_file(file_name: str, catalog: CatalogIndex, docx_dir_path: str) -> dict:
+    """
+    Extracts one invoice with both engines and compares the results.
+
+    The DOCX engine reuses any DOCX already present in 'DOCS_DIR_PATH'. In that case the pdf2docx conversion
+    is timed separately into 'docx_dir_path', so the comparison stays fair.
+
+    Parameters:
+    file_name (str): Name of the file (without extension).
+    catalog (CatalogIndex): The catalog index.
+    docx_dir_path (str): Scratch directory for the timed conversion.
+
+    Returns:
+    dict: Timings and per-field agreement for the file.
+    """
+
+    row = {'file': file_name, 'docx_cached': os.path.isfile(DOCS_DIR_PATH + file_name + '.docx')}
+    invoices = {}
+    for engine in ENGINES:
+        start = time.perf_counter()
+        try:
+            invoices[engine] = Invoice(file_name, catalog, engine)
+        except Exception as e:
+            invoices[engine] = None
+            row[f'{engine}_error'] = f'{type(e).__name__}: {str(e)}'
+        row[f'{engine}_seconds'] = time.perf_counter() - start
+
+    row['conversion_seconds'] = 0.0
+    if row['docx_cached']:
+        start = time.perf_counter()
+        with InvoiceDocument(file_name + '.pdf', docx_dir_path=docx_dir_path) as document:
+            document.convert_to_docx()
+        row['conversion_seconds'] = time.perf_counter() - start
+
+    docx_invoice, native_invoice = invoices['docx'], invoices['native']
+    for field in COMPARED_FIELDS:
+        row[field] = (docx_invoice is not None and native_invoice is not None
+                      and getattr(docx_invoice, field) == getattr(native_invoice, field))
+    row['products'] = (docx_invoice is not None and native_invoice is not None
+                       and products_agree(docx_invoice.products, native_invoice.products))
+
+    return row
+
+
+def main(limit: int or None = None, output_path: str = GENERATED_FILES_DIR_PATH + 'engine_comparison.csv') -> pd.DataFrame:
+    """
+    Runs both extraction engines over the PDFs in 'PDFs_DIR_PATH', then reports their speed and how often
+    they agree on every header field and on the product rows. The per-file results are saved to a CSV file.
+
+    Parameters:
+    limit (int or None): Maximum number of files to compare. None compares every file.
+    output_path (str): Path of the CSV report.
+
+    Returns:
+    pd.DataFrame: The per-file report.
+    """
+
+    catalog = load_catalog_index()
+    files = sorted(f for f in os.listdir(PDFs_DIR_PATH) if os.path.isfile(os.path.join(PDFs_DIR_PATH, f)))
+    files = [re.sub(r'\..*', '', file) for file in files][:limit]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as docx_dir_path:
+        for i, file in enumerate(files):
+            rows.append(compare_file(file, catalog, docx_dir_path + os.sep))
+            print(f'[{i + 1} / {len(files)}] - {file} compared')
+
+    report = pd.DataFrame(rows)
+    report.to_csv(output_path, index=False)
+
+    docx_seconds = report['docx_seconds'].sum()
+    conversion_seconds = report['conversion_seconds'].sum()
+    native_seconds = report['native_seconds'].sum()
+    print(f'\nFiles compared: {len(report)}')
+    print(f'DOCX engine: {docx_seconds + conversion_seconds:.2f}s ({conversion_seconds:.2f}s of it timed separately for cached DOCX files)')
+    print(f'Native engine: {native_seconds:.2f}s')
+    if native_seconds > 0:
+        print(f'Speed-up: {(docx_seconds + conversion_seconds) / native_seconds:.1f}x')
+    print('\nAgreement with the DOCX engine:')
+    for column in COMPARED_FIELDS + ['products']:
+        print(f'{column}: {report[column].mean():.1%}')
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compares the docx and native extraction engines.')
+    parser.add_argument('--limit', type=int, default=None, help='maximum number of files to compare')
+    args = parser.parse_args()
+
+    main(limit=args.limit)
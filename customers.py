@@ -1,16 +1,172 @@
-import pandas as pd
-
-
-# Code for masking client names (replacing them with unique numbers)
-DIR_PATH = 'C:/All/PyProjects/Orbis/'
-FILE_NAME = 'invoices.csv'
-
-df = pd.read_csv(DIR_PATH + FILE_NAME)
-
-unique_customers = df['Client'].unique()
-
-df_customers = pd.DataFrame({'name': unique_customers})
-
-df_customers['customer_id'] = range(1, len(df_customers) + 1)
-
-df_customers.to_csv(DIR_PATH + 'customers.csv', index=False)
\ No newline at end of file
+import os
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+from setup import OUTPUT_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+# Code for masking client names (replacing them with unique numbers)
+DIR_PATH = OUTPUT_DIR_PATH
+FILE_NAME = 'invoices.csv'
+
+# Every customer ever seen, with its ID; rows are only ever appended
+CUSTOMER_REGISTRY_PATH = GENERATED_FILES_DIR_PATH + 'customer_registry.csv'
+REGISTRY_COLUMNS = ['customer_id', 'name', 'key']
+
+
+# Punctuation, dropped from the keys, and whitespaces, collapsed into single spaces
+NAME_PUNCTUATION = re.compile(r'[^\w\s]')
+NAME_WHITESPACES = re.compile(r'[\s_]+')
+
+
+def normalize_name(name) -> str or None:
+    """
+    Key identifying a customer whatever the spelling of its name on each invoice: accents and punctuation removed,
+    case folded and whitespaces collapsed (e.g. 'Cerámica  S.A.' and 'CERAMICA SA' -> 'ceramica sa').
+
+    Parameters:
+    name: The name.
+
+    Returns:
+    str or None: The key, None for missing or blank names.
+    """
+
+    if pd.isna(name):
+        return None
+
+    name = ''.join(char for char in unicodedata.normalize('NFKD', str(name)) if not unicodedata.combining(char))
+    key = NAME_WHITESPACES.sub(' ', NAME_PUNCTUATION.sub('', name.casefold())).strip()
+
+    return key or None
+
+
+class CustomerRegistry:
+    """
+    Persistent, append-only dictionary of customer IDs, shared by every script that identifies customers
+    (customers.py, insert_into_db.py and reorder_suggestion.py). A customer keeps the ID it was first given,
+    whatever the run or the file it appears in; new customers get the next IDs.
+
+    Usage:
+    registry = CustomerRegistry()
+    df['customer_id'] = registry.assign(df['Client'])
+    registry.save()
+    """
+
+    def __init__(self, path: str = CUSTOMER_REGISTRY_PATH) -> None:
+        """
+        Loads the registry.
+
+        Parameters:
+        path (str, optional): The path of the registry CSV file. Default is 'CUSTOMER_REGISTRY_PATH'.
+        """
+
+        self.path = path
+        if os.path.exists(path):
+            self.customers = pd.read_csv(path, dtype={'customer_id': 'int64', 'name': str, 'key': str},
+                                         keep_default_na=False)
+        else:
+            self.customers = pd.DataFrame({'customer_id': pd.Series(dtype='int64'), 'name': pd.Series(dtype=str),
+                                           'key': pd.Series(dtype=str)})
+        self._keys = pd.Index(self.customers['key'])
+        self._saved = len(self.customers)
+
+    def __len__(self) -> int:
+        return len(self.customers)
+
+    def _ids(self, names, register: bool) -> pd.Series:
+        """
+        Looks up the ID of every name: only the distinct names are normalized and looked up, and the IDs are
+        spread back over the column through its factorized (categorical) codes, in one vectorized 'take'.
+        """
+
+        names = pd.Series(names)
+        codes, uniques = pd.factorize(names)
+        keys = pd.Series([normalize_name(name) for name in uniques], dtype=object)
+        positions = self._keys.get_indexer(keys)
+
+        missing = (positions == -1) & keys.notna().to_numpy()
+        if register and missing.any():
+            new = pd.DataFrame({'name': pd.Series(uniques, dtype=object)[missing].astype(str).str.strip().to_numpy(),
+                                'key': keys[missing].to_numpy()}).drop_duplicates(subset='key')
+            first_id = int(self.customers['customer_id'].max()) + 1 if len(self.customers) else 1
+            new.insert(0, 'customer_id', np.arange(first_id, first_id + len(new)))
+
+            self.customers = pd.concat([self.customers, new], ignore_index=True)
+            self._keys = pd.Index(self.customers['key'])
+            positions = self._keys.get_indexer(keys)
+
+        found = positions >= 0
+        unique_ids = pd.array(np.zeros(len(positions), dtype='int64'), dtype='Int64')
+        unique_ids[found] = self.customers['customer_id'].to_numpy()[positions[found]]
+        unique_ids[~found] = pd.NA
+
+        return pd.Series(pd.api.extensions.take(unique_ids, codes, allow_fill=True), index=names.index)
+
+    def assign(self, names) -> pd.Series:
+        """
+        Returns the ID of every name, registering the customers not seen before. Call 'save' to keep them.
+
+        Parameters:
+        names (pd.Series or array-like): The customer names (a categorical column is looked up by category).
+
+        Returns:
+        pd.Series: The IDs ('Int64', missing for missing or blank names), with the index of 'names'.
+        """
+
+        return self._ids(names, register=True)
+
+    def lookup(self, names) -> pd.Series:
+        """
+        Returns the ID of every name, missing for the customers not registered.
+
+        Parameters:
+        names (pd.Series or array-like): The customer names.
+
+        Returns:
+        pd.Series: The IDs ('Int64'), with the index of 'names'.
+        """
+
+        return self._ids(names, register=False)
+
+    def save(self) -> int:
+        """
+        Appends the customers registered since the registry was loaded (or last saved) to its file.
+
+        Returns:
+        int: Number of customers appended.
+        """
+
+        new = self.customers.iloc[self._saved:]
+        if not os.path.exists(self.path):
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.customers.head(0)[REGISTRY_COLUMNS].to_csv(self.path, index=False)
+
+        new[REGISTRY_COLUMNS].to_csv(self.path, mode='a', header=False, index=False)
+        self._saved = len(self.customers)
+
+        return len(new)
+
+
+def main(file_path: str = DIR_PATH + FILE_NAME, output_path: str = DIR_PATH + 'customers.csv') -> None:
+    """
+    Registers the clients of the extracted invoices and writes the ID of every registered customer.
+
+    Parameters:
+    file_path (str): The path of the extracted invoices. Default is 'invoices.csv' in 'DIR_PATH'.
+    output_path (str): The path of the CSV file written. Default is 'customers.csv' in 'DIR_PATH'.
+    """
+
+    df = pd.read_csv(file_path, usecols=['Client'], dtype={'Client': 'category'})
+
+    registry = CustomerRegistry()
+    registry.assign(df['Client'])
+    print(f'New customers registered: {registry.save()}')
+
+    registry.customers[['name', 'customer_id']].to_csv(output_path, index=False)
+
+
+if __name__ == "__main__":
+    main()
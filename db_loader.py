@@ -0,0 +1,129 @@
+import os
+import tempfile
+import pandas as pd
+from sqlalchemy import create_engine, text
+from instrumentation import get_logger
+
+
+logger = get_logger('db_loader')
+
+
+# Rows per statement execution (or per file for the native bulk path)
+DEFAULT_CHUNK_SIZE = 1000
+
+# Maximum number of bound parameters in one SQLite statement
+SQLITE_MAX_VARIABLES = 32766
+
+LOAD_METHODS = ['auto', 'executemany', 'multi', 'native']
+
+
+def create_database_engine(database_url: str):
+    """
+    Creates a SQLAlchemy engine. With mysql-connector, the client side of 'LOAD DATA LOCAL INFILE' is enabled.
+
+    Parameters:
+    database_url (str): The SQLAlchemy database URL.
+
+    Returns:
+    The engine.
+    """
+
+    connect_args = {'allow_local_infile': True} if database_url.startswith('mysql+mysqlconnector') else {}
+    return create_engine(database_url, connect_args=connect_args)
+
+
+def _load_data_local_infile(df: pd.DataFrame, table: str, connection) -> None:
+    """
+    Loads a DataFrame into a MySQL table with 'LOAD DATA LOCAL INFILE', through a temporary CSV file.
+    The server must have 'local_infile' enabled. Missing values are written as the unquoted word NULL, which
+    MySQL reads as NULL when fields have no escape character.
+
+    Parameters:
+    df (pd.DataFrame): The rows to load.
+    table (str): The name of the table.
+    connection: An open SQLAlchemy connection.
+    """
+
+    columns = ', '.join(f'`{column}`' for column in df.columns)
+    with tempfile.TemporaryDirectory() as directory:
+        file_path = os.path.join(directory, f'{table}.csv').replace('\\', '/')
+        df.to_csv(file_path, index=False, header=False, na_rep='NULL', lineterminator='\n', encoding='utf-8')
+        connection.execute(text(
+            f"LOAD DATA LOCAL INFILE '{file_path}' INTO TABLE `{table}` CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({columns})"))
+
+
+def bulk_load(df: pd.DataFrame, table: str, connection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              method: str = 'auto') -> int:
+    """
+    Appends a DataFrame to a table with the fastest path available, inside the caller's transaction.
+
+    Parameters:
+    df (pd.DataFrame): The rows to load. Its columns must exist in the table.
+    table (str): The name of the table.
+    connection: An open SQLAlchemy connection (e.g. from 'engine.begin()').
+    chunk_size (int, optional): Number of rows per statement. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): One of 'LOAD_METHODS'. 'executemany' sends each chunk as one batched statement
+    execution (SQLAlchemy groups the rows into multi-row INSERTs where the driver supports it), 'multi' builds
+    one multi-row INSERT statement per chunk in pandas, 'native' uses the bulk path of the database
+    ('LOAD DATA LOCAL INFILE' on MySQL), and 'auto' the native path when the dialect has one, falling back to
+    'executemany' if the server refuses it. Default is 'auto'.
+
+    Returns:
+    int: Number of rows loaded.
+    """
+
+    if method not in LOAD_METHODS:
+        raise ValueError(f'Unknown load method: {method}')
+
+    if df.empty:
+        return 0
+
+    dialect = connection.dialect.name
+    if method in ('auto', 'native') and dialect in ('mysql', 'mariadb'):
+        for start in range(0, len(df), chunk_size):
+            try:
+                _load_data_local_infile(df.iloc[start:start + chunk_size], table, connection)
+            except Exception as e:
+                # Falling back is only safe while nothing was loaded yet
+                if method == 'native' or start > 0:
+                    raise
+                logger.warning(f'LOAD DATA LOCAL INFILE not available for {table}, using batched inserts: {type(e).__name__}')
+                break
+        else:
+            return len(df)
+    elif method == 'native':
+        raise ValueError(f'No native bulk load for dialect: {dialect}')
+
+    if method == 'multi':
+        if dialect == 'sqlite':
+            chunk_size = max(1, min(chunk_size, SQLITE_MAX_VARIABLES // len(df.columns)))
+        df.to_sql(table, con=connection, index=False, if_exists='append', method='multi', chunksize=chunk_size)
+    else:
+        df.to_sql(table, con=connection, index=False, if_exists='append', chunksize=chunk_size)
+
+    return len(df)
+
+
+def load_tables(engine, tables: list[tuple], chunk_size: int = DEFAULT_CHUNK_SIZE, method: str = 'auto') -> dict:
+    """
+    Loads several DataFrames in a single transaction: either every table is loaded or, if anything fails,
+    the whole load is rolled back.
+
+    Parameters:
+    engine: A SQLAlchemy engine.
+    tables (list[tuple]): (table name, DataFrame) pairs, in load order.
+    chunk_size (int, optional): Number of rows per statement. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): One of 'LOAD_METHODS' (see 'bulk_load'). Default is 'auto'.
+
+    Returns:
+    dict: Number of rows loaded into each table.
+    """
+
+    counts = {}
+    with engine.begin() as connection:
+        for table, df in tables:
+            counts[table] = counts.get(table, 0) + bulk_load(df, table, connection, chunk_size, method)
+
+    return counts
@@ -0,0 +1,397 @@
+import pandas as pd
+from sqlalchemy import text, bindparam
+from db_loader import DEFAULT_CHUNK_SIZE, bulk_load
+
+
+WATERMARK_TABLE = 'sync_watermark'
+
+# Dialects with a set-based upsert
+UPSERT_DIALECTS = ['mysql', 'mariadb', 'sqlite', 'postgresql']
+
+
+def _null_safe_equal(dialect: str, left: str, right: str) -> str:
+    """
+    SQL condition that is true when two expressions are equal, NULLs included.
+    """
+
+    if dialect in ('mysql', 'mariadb'):
+        return f'{left} <=> {right}'
+    if dialect == 'sqlite':
+        return f'{left} IS {right}'
+    return f'{left} IS NOT DISTINCT FROM {right}'
+
+
+def stage(df: pd.DataFrame, table: str, connection, chunk_size: int = DEFAULT_CHUNK_SIZE, method: str = 'auto') -> str:
+    """
+    Loads a DataFrame into a temporary staging table with the columns (and types) of a target table.
+    Temporary tables are private to the connection and do not end the transaction on MySQL.
+
+    Parameters:
+    df (pd.DataFrame): The rows. Its columns must exist in the target table.
+    table (str): The name of the target table.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of rows per statement. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): Load method (see 'db_loader.bulk_load'). Default is 'auto'.
+
+    Returns:
+    str: The name of the staging table.
+    """
+
+    dialect = connection.dialect.name
+    if dialect not in UPSERT_DIALECTS:
+        raise ValueError(f'No staging support for dialect: {dialect}')
+
+    staging = f'{table}_staging'
+    drop_staging(staging, connection)
+    columns = ', '.join(df.columns)
+    temporary = 'TEMP' if dialect == 'sqlite' else 'TEMPORARY'
+    connection.execute(text(f'CREATE {temporary} TABLE {staging} AS SELECT {columns} FROM {table} WHERE 1 = 0'))
+    bulk_load(df, staging, connection, chunk_size, method)
+
+    return staging
+
+
+def drop_staging(staging: str, connection) -> None:
+    """
+    Drops a staging table created by 'stage', if it exists.
+
+    Parameters:
+    staging (str): The name of the staging table.
+    connection: An open SQLAlchemy connection.
+    """
+
+    dialect = connection.dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        connection.execute(text(f'DROP TEMPORARY TABLE IF EXISTS {staging}'))
+    elif dialect == 'sqlite':
+        connection.execute(text(f'DROP TABLE IF EXISTS temp.{staging}'))
+    else:
+        connection.execute(text(f'DROP TABLE IF EXISTS {staging}'))
+
+
+def insert_missing(df: pd.DataFrame, table: str, key_columns: list[str], connection,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE, method: str = 'auto') -> int:
+    """
+    Inserts the rows whose key is not in the table yet, with a set-based anti-join against a staging table.
+    Rows already in the table are left untouched.
+
+    Parameters:
+    df (pd.DataFrame): The rows. Rows with the same key are inserted once.
+    table (str): The name of the table.
+    key_columns (list[str]): The columns identifying a row.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of rows per statement when staging. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): Load method of the staging table (see 'db_loader.bulk_load'). Default is 'auto'.
+
+    Returns:
+    int: Number of rows inserted.
+    """
+
+    if df.empty:
+        return 0
+
+    staging = stage(df.drop_duplicates(subset=key_columns), table, connection, chunk_size, method)
+    columns = ', '.join(df.columns)
+    join = ' AND '.join(f't.{column} = s.{column}' for column in key_columns)
+    result = connection.execute(text(f'''
+        INSERT INTO {table} ({columns})
+        SELECT {', '.join(f's.{column}' for column in df.columns)}
+        FROM {staging} s
+        LEFT JOIN {table} t ON {join}
+        WHERE t.{key_columns[0]} IS NULL
+    '''))
+    drop_staging(staging, connection)
+
+    return result.rowcount
+
+
+def _removed_rows(table: str, staging: str, key_columns: list[str], replace_column: str) -> str:
+    """
+    SQL condition on 'table' selecting the rows with one of the bound ':values' in 'replace_column' whose key is not
+    in the staging table. The values are bound rather than read from the staging table: MySQL cannot open a
+    temporary table twice in one statement.
+    """
+
+    staged = ' AND '.join(f's.{column} = {table}.{column}' for column in key_columns)
+    return f'{replace_column} IN :values AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE {staged})'
+
+
+def upsert(df: pd.DataFrame, table: str, key_columns: list[str], connection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+           method: str = 'auto', source_join: str = '', replace_column: str or None = None) -> dict:
+    """
+    Writes only the new and changed rows of a DataFrame, through a staging table and one set-based statement:
+    'INSERT ... ON DUPLICATE KEY UPDATE' on MySQL, 'INSERT ... ON CONFLICT DO UPDATE' on SQLite and PostgreSQL.
+    The key columns must be the primary key or a unique key of the table.
+
+    Parameters:
+    df (pd.DataFrame): The rows. With repeated keys, the last row wins.
+    table (str): The name of the table.
+    key_columns (list[str]): The columns of the unique key.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of rows per statement when staging. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): Load method of the staging table (see 'db_loader.bulk_load'). Default is 'auto'.
+    source_join (str, optional): SQL joined to the staging table (aliased 's') to restrict the rows written,
+    e.g. 'JOIN product p ON p.product_code = s.product_code'. Default is no restriction.
+    replace_column (str or None, optional): A key column whose values are replaced as a whole: the rows of the
+    table with one of the values of 'df' in this column, but whose key is not in 'df', are deleted (e.g. the
+    lines removed from a corrected invoice, with 'invoice_number'). Default is None, nothing is deleted.
+
+    Returns:
+    dict: Number of rows inserted, updated and deleted.
+    """
+
+    if df.empty:
+        return {'inserted': 0, 'updated': 0, 'deleted': 0}
+
+    dialect = connection.dialect.name
+    staging = stage(df.drop_duplicates(subset=key_columns, keep='last'), table, connection, chunk_size, method)
+
+    value_columns = [column for column in df.columns if column not in key_columns]
+    key_join = ' AND '.join(f't.{column} = s.{column}' for column in key_columns)
+    unchanged = ' AND '.join(_null_safe_equal(dialect, f't.{column}', f's.{column}') for column in value_columns) or '1 = 1'
+    source = f'{staging} s {source_join}'
+
+    counts = connection.execute(text(f'''
+        SELECT
+            SUM(CASE WHEN t.{key_columns[0]} IS NULL THEN 1 ELSE 0 END),
+            SUM(CASE WHEN t.{key_columns[0]} IS NOT NULL AND NOT ({unchanged}) THEN 1 ELSE 0 END)
+        FROM {source}
+        LEFT JOIN {table} t ON {key_join}
+    ''')).one()
+
+    columns = ', '.join(df.columns)
+    select = f"SELECT {', '.join(f's.{column}' for column in df.columns)} FROM {source}"
+    if dialect in ('mysql', 'mariadb'):
+        updates = ', '.join(f'{column} = s.{column}' for column in value_columns) or f'{key_columns[0]} = {key_columns[0]}'
+        statement = f'INSERT INTO {table} ({columns}) {select} ON DUPLICATE KEY UPDATE {updates}'
+    else:
+        # 'WHERE true' keeps SQLite from reading ON CONFLICT as part of a join
+        if value_columns:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in value_columns)
+            changed = ' OR '.join(f'NOT ({_null_safe_equal(dialect, f"{table}.{column}", f"excluded.{column}")})'
+                                  for column in value_columns)
+            action = f'DO UPDATE SET {updates} WHERE {changed}'
+        else:
+            action = 'DO NOTHING'
+        statement = f"INSERT INTO {table} ({columns}) {select} WHERE true ON CONFLICT ({', '.join(key_columns)}) {action}"
+
+    connection.execute(text(statement))
+
+    deleted = 0
+    if replace_column is not None:
+        delete = text(f'DELETE FROM {table} WHERE {_removed_rows(table, staging, key_columns, replace_column)}')
+        delete = delete.bindparams(bindparam('values', expanding=True))
+        values = df[replace_column].dropna().astype(str).unique().tolist()
+        for start in range(0, len(values), chunk_size):
+            deleted += connection.execute(delete, {'values': values[start:start + chunk_size]}).rowcount
+
+    drop_staging(staging, connection)
+
+    return {'inserted': int(counts[0] or 0), 'updated': int(counts[1] or 0), 'deleted': deleted}
+
+
+def changed_keys(df: pd.DataFrame, table: str, key_columns: list[str], connection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 method: str = 'auto', source_join: str = '', replace_column: str or None = None) -> pd.DataFrame:
+    """
+    Finds the rows 'upsert' would insert, update or delete, without writing them: the rows whose key is not in the
+    table or whose values differ from the stored ones, and with 'replace_column' the stored rows missing from 'df'.
+
+    Parameters:
+    df (pd.DataFrame): The rows. With repeated keys, the last row wins.
+    table (str): The name of the table.
+    key_columns (list[str]): The columns of the unique key.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of rows per statement when staging. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): Load method of the staging table (see 'db_loader.bulk_load'). Default is 'auto'.
+    source_join (str, optional): SQL joined to the staging table (aliased 's') to restrict the rows compared, as in
+    'upsert'. Default is no restriction.
+    replace_column (str or None, optional): A key column whose values are replaced as a whole, as in 'upsert'.
+    Default is None.
+
+    Returns:
+    pd.DataFrame: The key columns of the new, changed and removed rows.
+    """
+
+    if df.empty:
+        return pd.DataFrame(columns=key_columns)
+
+    dialect = connection.dialect.name
+    staging = stage(df.drop_duplicates(subset=key_columns, keep='last'), table, connection, chunk_size, method)
+
+    value_columns = [column for column in df.columns if column not in key_columns]
+    key_join = ' AND '.join(f't.{column} = s.{column}' for column in key_columns)
+    unchanged = ' AND '.join(_null_safe_equal(dialect, f't.{column}', f's.{column}') for column in value_columns) or '1 = 1'
+    rows = connection.execute(text(f'''
+        SELECT {', '.join(f's.{column}' for column in key_columns)}
+        FROM {staging} s {source_join}
+        LEFT JOIN {table} t ON {key_join}
+        WHERE t.{key_columns[0]} IS NULL OR NOT ({unchanged})
+    ''')).all()
+
+    if replace_column is not None:
+        removed = text(f"SELECT {', '.join(key_columns)} FROM {table} WHERE {_removed_rows(table, staging, key_columns, replace_column)}")
+        removed = removed.bindparams(bindparam('values', expanding=True))
+        values = df[replace_column].dropna().astype(str).unique().tolist()
+        for start in range(0, len(values), chunk_size):
+            rows += connection.execute(removed, {'values': values[start:start + chunk_size]}).all()
+
+    drop_staging(staging, connection)
+
+    return pd.DataFrame(rows, columns=key_columns)
+
+
+def create_watermark_table(engine) -> None:
+    """
+    Creates the table keeping the watermark of every synchronized source, if it does not exist yet.
+    Run outside the load transaction, since DDL ends a transaction on MySQL.
+
+    Parameters:
+    engine: A SQLAlchemy engine.
+    """
+
+    with engine.begin() as connection:
+        connection.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+                source VARCHAR(255) PRIMARY KEY,
+                source_hash VARCHAR(64),
+                max_issue_date DATE,
+                synced_at TIMESTAMP
+            )
+        '''))
+
+
+def read_watermark(source: str, connection) -> dict or None:
+    """
+    Reads the watermark left by the last synchronization of a source.
+
+    Parameters:
+    source (str): The name of the source (e.g. the file name).
+    connection: An open SQLAlchemy connection.
+
+    Returns:
+    dict or None: The 'source_hash' and 'max_issue_date' of the last synchronization, or None if there was none.
+    """
+
+    row = connection.execute(text(f'SELECT source_hash, max_issue_date FROM {WATERMARK_TABLE} WHERE source = :source'),
+                             {'source': source}).one_or_none()
+    if row is None:
+        return None
+
+    return {'source_hash': row[0], 'max_issue_date': pd.to_datetime(row[1]) if row[1] is not None else None}
+
+
+def write_watermark(source: str, source_hash: str, max_issue_date, connection) -> None:
+    """
+    Records the watermark of a source, in the same transaction as the data it describes.
+
+    Parameters:
+    source (str): The name of the source.
+    source_hash (str): The content hash of the source.
+    max_issue_date: The latest issue date synchronized (a date, or None).
+    connection: An open SQLAlchemy connection.
+    """
+
+    watermark = pd.DataFrame([{
+        'source': source,
+        'source_hash': source_hash,
+        'max_issue_date': None if pd.isna(max_issue_date) else pd.Timestamp(max_issue_date).date(),
+        'synced_at': pd.Timestamp.now().to_pydatetime(),
+    }])
+    upsert(watermark, WATERMARK_TABLE, ['source'], connection, method='executemany')
+
+
+SUMMARY_TABLE = 'invoicemonthlysummary'
+
+
+def _month_start(dialect: str, column: str) -> str:
+    """
+    SQL expression of the first day of the month of a date column.
+    """
+
+    if dialect in ('mysql', 'mariadb'):
+        return f"CAST(DATE_FORMAT({column}, '%Y-%m-01') AS DATE)"
+    if dialect == 'sqlite':
+        return f"date({column}, 'start of month')"
+    return f"CAST(date_trunc('month', {column}) AS DATE)"
+
+
+def create_summary_table(engine) -> None:
+    """
+    Creates the monthly summary table (see 'all.sql'), if it does not exist yet. Run outside the load transaction,
+    since DDL ends a transaction on MySQL.
+
+    Parameters:
+    engine: A SQLAlchemy engine.
+    """
+
+    with engine.begin() as connection:
+        connection.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+                month DATE,
+                customer_id INT,
+                product_code VARCHAR(10),
+                invoices INT,
+                sqm DECIMAL(14,2),
+                total_price DECIMAL(14,2),
+                PRIMARY KEY (month, customer_id, product_code)
+            )
+        '''))
+
+
+def affected_months(invoice_df: pd.DataFrame, connection, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Finds the months whose summary changes when a batch of invoices is written: the months of the new issue dates,
+    plus the months the same invoices are currently stored under (in case their date changed).
+    Call it before the invoices are written.
+
+    Parameters:
+    invoice_df (pd.DataFrame): The invoices about to be written, with 'invoice_number' and 'issue_date' columns.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of invoice numbers per lookup query. Default is 'DEFAULT_CHUNK_SIZE'.
+
+    Returns:
+    list: The first day of every affected month, sorted.
+    """
+
+    dates = [pd.to_datetime(invoice_df['issue_date'], errors='coerce')]
+    numbers = invoice_df['invoice_number'].dropna().astype(str).unique().tolist()
+    query = text('SELECT issue_date FROM invoice WHERE invoice_number IN :numbers').bindparams(bindparam('numbers', expanding=True))
+    for start in range(0, len(numbers), chunk_size):
+        stored = connection.execute(query, {'numbers': numbers[start:start + chunk_size]}).scalars().all()
+        dates.append(pd.to_datetime(pd.Series(stored, dtype=object), errors='coerce'))
+
+    months = pd.concat(dates).dropna().dt.to_period('M').unique()
+    return sorted(month.to_timestamp() for month in months)
+
+
+def refresh_monthly_summary(months: list, connection) -> int:
+    """
+    Rebuilds the rows of the monthly summary table (month x customer x product) for the given months only, from
+    the invoice and invoice item tables. Each month is rebuilt with a range condition on the issue date, so the
+    index on 'issue_date' is used.
+
+    Parameters:
+    months (list): The first day of every month to rebuild.
+    connection: An open SQLAlchemy connection.
+
+    Returns:
+    int: Number of summary rows written.
+    """
+
+    month = _month_start(connection.dialect.name, 'i.issue_date')
+    rows = 0
+    for start in months:
+        start = pd.Timestamp(start)
+        bounds = {'start': start.date(), 'end': (start + pd.offsets.MonthBegin(1)).date()}
+        connection.execute(text(f'DELETE FROM {SUMMARY_TABLE} WHERE month >= :start AND month < :end'), bounds)
+        result = connection.execute(text(f'''
+            INSERT INTO {SUMMARY_TABLE} (month, customer_id, product_code, invoices, sqm, total_price)
+            SELECT {month}, i.customer_id, ii.product_code, COUNT(DISTINCT i.invoice_number), SUM(ii.sqm), SUM(ii.total_price)
+            FROM invoice i
+            JOIN invoiceitem ii ON ii.invoice_number = i.invoice_number
+            WHERE i.issue_date >= :start AND i.issue_date < :end
+            GROUP BY {month}, i.customer_id, ii.product_code
+        '''), bounds)
+        rows += result.rowcount
+
+    return rows
@@ -1,58 +1,196 @@
-import pandas as pd
-from sqlalchemy import create_engine
-
-
-CATALOG_PATH = 'Catalogs/catalog_ready-2_0.xlsx'
-DATA_PATH = 'generated_files/invoices_revised-2_0.xlsx'
-
-# Database connection
-engine = create_engine('mysql+mysqlconnector://<username>:<password>4@<host/ip>/<servername>')
-
-# Read data 
-df_catalog = pd.read_excel(CATALOG_PATH, sheet_name='CONSOLIDADA', engine='openpyxl')
-df_invoice = pd.read_excel(DATA_PATH, engine='openpyxl')
-
-# Process Invoice Item data
-invoice_items_df = df_invoice[['Product_code', 'Sqm', 'Unit_price', 'Total_price', 'Currency', 'Invoice_number']]
-invoice_items_df = invoice_items_df.rename(columns={
-    'Product_code': 'product_code', 'Sqm': 'sqm', 
-    'Unit_price': 'unit_price', 'Total_price': 'total_price', 
-    'Currency': 'currency'
-})
-
-# Filter product catalog to exclude existing product codes
-existing_product_codes = pd.read_sql("SELECT product_code FROM product", con=engine)['product_code'].tolist()
-df_catalog_filtered = df_catalog[~df_catalog['product_code'].isin(existing_product_codes)]
-
-# Insert new product data 
-if not df_catalog_filtered.empty:
-    df_catalog_filtered.to_sql('product', con=engine, index=False, if_exists='append')
-    print('New product data inserted')
-
-# Insert Customer data
-customers_df = df_invoice[['Client', 'Country']].drop_duplicates().rename(columns={'Client': 'name', 'Country': 'country'})
-customers_df.to_sql('customer', con=engine, index=False, if_exists='append')
-print('Customer data inserted')
-
-# Insert Invoice data 
-customer_ids = pd.read_sql("SELECT customer_id, name FROM customer", con=engine)
-invoice_df = df_invoice.merge(customer_ids, left_on='Client', right_on='name')
-invoice_df = invoice_df[['Invoice_number', 'Date', 'FOB', 'Destination', 'customer_id']]
-invoice_df = invoice_df.drop_duplicates(subset='Invoice_number')
-invoice_df = invoice_df.rename(columns={'Date': 'issue_date', 'Destination': 'destination_port', 'FOB': 'fob'})
-invoice_df.to_sql('invoice', con=engine, index=False, if_exists='append')
-print('Invoice data inserted')
-
-# Insert InvoiceItem data
-invoice_items_df['product_code'] = invoice_items_df['product_code'].astype(str)
-existing_product_codes = pd.read_sql("SELECT product_code FROM product", con=engine)['product_code'].tolist()
-filtered_invoice_items_df = invoice_items_df[invoice_items_df['product_code'].isin(existing_product_codes)]
-# Drop duplicates
-filtered_invoice_items_df = filtered_invoice_items_df.drop_duplicates(subset=['Invoice_number', 'product_code'])
-
-print("Rows in filtered_invoice_items_df after filtering and dropping duplicates:", len(filtered_invoice_items_df))
-
-# Insert filtered InvoiceItem data
-if not filtered_invoice_items_df.empty:
-    filtered_invoice_items_df.to_sql('invoiceitem', con=engine, index=False, if_exists='append')
-    print('Invoice item data inserted')
+import os
+import argparse
+import pandas as pd
+from db_loader import DEFAULT_CHUNK_SIZE, LOAD_METHODS, create_database_engine
+from db_sync import insert_missing, upsert, changed_keys, create_watermark_table, read_watermark, write_watermark
+from db_sync import create_summary_table, affected_months, refresh_monthly_summary
+from columnar_store import REVISED_INVOICES_PATH, read_table
+from customers import CustomerRegistry
+from utils import file_hash
+from instrumentation import get_logger, get_recorder, measure
+from setup import DATABASE_URL, GENERATED_FILES_DIR_PATH
+
+
+logger = get_logger('insert_into_db')
+
+
+CATALOG_PATH = 'Catalogs/catalog_ready-2_0.xlsx'
+DATA_PATH = REVISED_INVOICES_PATH
+DATA_COLUMNS = ['Product_code', 'Sqm', 'Unit_price', 'Total_price', 'Currency', 'Invoice_number', 'Client', 'Country',
+                'Date', 'FOB', 'Destination']
+
+LOAD_PERFORMANCE_REPORT_PATH = GENERATED_FILES_DIR_PATH + 'load_performance_report.json'
+
+# Invoices issued this many days before the watermark are sent again, to pick up late corrections
+WATERMARK_LOOKBACK_DAYS = 31
+
+# Invoice items are only written for the products of the catalog
+CATALOG_PRODUCTS_JOIN = 'JOIN product p ON p.product_code = s.product_code'
+
+
+def invoice_rows(df_invoice: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows of the 'invoice' table: one per invoice number, for the invoices with a customer ID.
+
+    Parameters:
+    df_invoice (pd.DataFrame): The revised invoices, with a 'customer_id' column.
+
+    Returns:
+    pd.DataFrame: The invoices.
+    """
+
+    invoice_df = df_invoice.dropna(subset=['customer_id'])
+    invoice_df = invoice_df[['Invoice_number', 'Date', 'FOB', 'Destination', 'customer_id']]
+    invoice_df = invoice_df.drop_duplicates(subset='Invoice_number')
+    return invoice_df.rename(columns={'Invoice_number': 'invoice_number', 'Date': 'issue_date', 'Destination': 'destination_port', 'FOB': 'fob'})
+
+
+def invoice_item_rows(df_invoice: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows of the 'invoiceitem' table: one per invoice number and product code.
+
+    Parameters:
+    df_invoice (pd.DataFrame): The revised invoices.
+
+    Returns:
+    pd.DataFrame: The invoice items.
+    """
+
+    invoice_items_df = df_invoice[['Product_code', 'Sqm', 'Unit_price', 'Total_price', 'Currency', 'Invoice_number']]
+    invoice_items_df = invoice_items_df.rename(columns={
+        'Product_code': 'product_code', 'Sqm': 'sqm', 
+        'Unit_price': 'unit_price', 'Total_price': 'total_price', 
+        'Currency': 'currency', 'Invoice_number': 'invoice_number'
+    })
+    invoice_items_df['product_code'] = invoice_items_df['product_code'].astype(str)
+    return invoice_items_df.drop_duplicates(subset=['invoice_number', 'product_code'])
+
+
+def corrected_invoices(df_invoice: pd.DataFrame, connection, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       method: str = 'auto') -> set:
+    """
+    Finds the invoices that are new or differ from the database, in the invoice or in any of its items, added,
+    changed or removed (e.g. a late correction to an invoice issued before the watermark lookback).
+
+    Parameters:
+    df_invoice (pd.DataFrame): The revised invoices, with a 'customer_id' column.
+    connection: An open SQLAlchemy connection.
+    chunk_size (int, optional): Number of rows per statement when staging. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str, optional): Load method of the staging tables (see 'db_loader.bulk_load'). Default is 'auto'.
+
+    Returns:
+    set: The invoice numbers.
+    """
+
+    invoices = changed_keys(invoice_rows(df_invoice), 'invoice', ['invoice_number'], connection, chunk_size, method)
+    items = changed_keys(invoice_item_rows(df_invoice), 'invoiceitem', ['invoice_number', 'product_code'], connection,
+                         chunk_size, method, source_join=CATALOG_PRODUCTS_JOIN, replace_column='invoice_number')
+
+    return set(invoices['invoice_number'].astype(str)) | set(items['invoice_number'].astype(str))
+
+
+def main(database_url: str = DATABASE_URL, chunk_size: int = DEFAULT_CHUNK_SIZE, method: str = 'auto',
+         full: bool = False) -> None:
+    """
+    Synchronizes the product catalog and the revised invoices with the database. Only the delta is written:
+    new products and customers are inserted with anti-joins (customers with the IDs of the customer registry),
+    invoices and invoice items are upserted from staging tables, so rows already loaded are neither duplicated
+    nor rewritten unless they changed, and the items removed from a sent invoice are deleted. A watermark records
+    the content hash and latest issue date of the invoices file: an unchanged file is skipped, and otherwise only
+    invoices issued from 'WATERMARK_LOOKBACK_DAYS' before the watermark on are sent, with the older invoices that
+    differ from the database (late corrections). The monthly summary table
+    is then rebuilt for the months touched by the sent invoices only. The whole synchronization runs
+    in a single transaction, so a failure leaves the database as it was. The time and memory of every step
+    are written to 'LOAD_PERFORMANCE_REPORT_PATH'.
+
+    Parameters:
+    database_url (str): The SQLAlchemy database URL. Default is 'DATABASE_URL'.
+    chunk_size (int): Number of rows per statement execution. Default is 'DEFAULT_CHUNK_SIZE'.
+    method (str): Load method of the staging tables, one of 'LOAD_METHODS' (see 'db_loader.bulk_load'). Default is 'auto'.
+    full (bool): Whether to ignore the watermark and send every invoice. Default is False.
+    """
+
+    # Database connection
+    engine = create_database_engine(database_url)
+    create_watermark_table(engine)
+    create_summary_table(engine)
+
+    # Read data 
+    with measure('read_catalog', file=CATALOG_PATH):
+        df_catalog = pd.read_excel(CATALOG_PATH, sheet_name='CONSOLIDADA', dtype={'product_code': str}, engine='openpyxl')
+    with measure('read_invoices', file=DATA_PATH):
+        df_invoice = read_table(DATA_PATH, DATA_COLUMNS)
+    source = os.path.basename(DATA_PATH)
+    source_hash = file_hash(DATA_PATH)
+    max_issue_date = pd.to_datetime(df_invoice['Date'], errors='coerce').max()
+
+    registry = CustomerRegistry()
+    df_invoice['customer_id'] = registry.assign(df_invoice['Client'])
+
+    with engine.begin() as connection:
+        watermark = None if full else read_watermark(source, connection)
+        if watermark is not None and watermark['source_hash'] == source_hash:
+            logger.info(f'{source} is already synchronized')
+            get_recorder().write_report(LOAD_PERFORMANCE_REPORT_PATH)
+            return
+
+        if watermark is not None and watermark['max_issue_date'] is not None:
+            since = watermark['max_issue_date'] - pd.Timedelta(days=WATERMARK_LOOKBACK_DAYS)
+            dates = pd.to_datetime(df_invoice['Date'], errors='coerce')
+            recent = (dates >= since) | dates.isna()
+            with measure('corrections'):
+                corrected = corrected_invoices(df_invoice[~recent], connection, chunk_size, method)
+            logger.info(f'Invoices issued since {since.date()}: {df_invoice.loc[recent, "Invoice_number"].nunique()}; '
+                        f'older invoices new or corrected: {len(corrected)} of {df_invoice.loc[~recent, "Invoice_number"].nunique()} '
+                        f'(--full sends every invoice)')
+            df_invoice = df_invoice[recent | df_invoice['Invoice_number'].astype(str).isin(corrected)]
+
+        invoice_items_df = invoice_item_rows(df_invoice)
+
+        # Insert new product data 
+        with measure('products'):
+            inserted = insert_missing(df_catalog, 'product', ['product_code'], connection, chunk_size, method)
+        logger.info(f'New product data inserted: {inserted}')
+
+        # Insert new Customer data, with the IDs of the customer registry
+        customers_df = df_invoice[['customer_id', 'Country']].dropna(subset=['customer_id']).drop_duplicates(subset='customer_id')
+        customers_df = customers_df.rename(columns={'Country': 'country'})
+        customers_df.insert(1, 'name', customers_df['customer_id'].map(registry.customers.set_index('customer_id')['name']))
+        with measure('customers'):
+            inserted = insert_missing(customers_df, 'customer', ['customer_id'], connection, chunk_size, method)
+        logger.info(f'New customer data inserted: {inserted}')
+
+        # Upsert Invoice data 
+        invoice_df = invoice_rows(df_invoice)
+        months = affected_months(invoice_df, connection, chunk_size)
+        with measure('invoices'):
+            counts = upsert(invoice_df, 'invoice', ['invoice_number'], connection, chunk_size, method)
+        logger.info(f'Invoice data: {counts}')
+
+        # Upsert InvoiceItem data of the products in the catalog; the items removed from a sent invoice are deleted
+        with measure('invoice_items'):
+            counts = upsert(invoice_items_df, 'invoiceitem', ['invoice_number', 'product_code'], connection, chunk_size,
+                            method, source_join=CATALOG_PRODUCTS_JOIN, replace_column='invoice_number')
+        logger.info(f'Invoice item data: {counts}')
+
+        # Rebuild the monthly summary of the months changed
+        with measure('monthly_summary'):
+            rows = refresh_monthly_summary(months, connection)
+        logger.info(f'Monthly summary rebuilt for {len(months)} month(s): {rows} rows')
+
+        write_watermark(source, source_hash, max_issue_date, connection)
+
+    # The new IDs are only kept once the database has them
+    logger.info(f'New customers registered: {registry.save()}')
+
+    get_recorder().write_report(LOAD_PERFORMANCE_REPORT_PATH)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Synchronizes the catalog and the revised invoices with the database.')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help=f'rows per statement execution (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--method', choices=LOAD_METHODS, default='auto', help='load method of the staging tables (default: auto)')
+    parser.add_argument('--full', action='store_true', help='ignore the watermark and send every invoice')
+    args = parser.parse_args()
+
+    main(chunk_size=args.chunk_size, method=args.method, full=args.full)
@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import time
+import logging
+import functools
+from contextlib import contextmanager
+from setup import GENERATED_FILES_DIR_PATH, LOG_LEVEL
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+PERFORMANCE_REPORT_PATH = GENERATED_FILES_DIR_PATH + 'performance_report.json'
+
+# Number of files and measurements listed in the report
+REPORT_TOP = 20
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger of a module. Every logger writes to stdout, at the level set by 'LOG_LEVEL'
+    (e.g. ORBIS_LOG_LEVEL=DEBUG shows the extracted amounts of every invoice).
+
+    Parameters:
+    name (str): The name of the module.
+
+    Returns:
+    logging.Logger: The logger, named 'orbis.<name>'.
+    """
+
+    root = logging.getLogger('orbis')
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL.upper())
+        root.propagate = False
+
+    return root.getChild(name)
+
+
+def peak_memory_mb() -> float or None:
+    """
+    Peak resident memory of the process so far, in MiB; None where it cannot be read.
+    """
+
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+    except (ImportError, AttributeError):
+        return None
+
+
+class Recorder:
+    """
+    Collects the wall time, CPU time and peak memory of the measured steps of a run. A measurement costs a few
+    clock reads, so steps can be measured on every invoice.
+
+    Memory is the peak resident memory of the process at the end of the step, and the growth of that peak
+    during the step, which points to the step (and file) that drove it.
+
+    Usage:
+    with measure('docx_conversion', file='invoice'):
+        ...
+    get_recorder().write_report()
+    """
+
+    def __init__(self) -> None:
+        self.records = []
+        self._files = []
+
+    @contextmanager
+    def measure(self, step: str, file: str or None = None):
+        """
+        Measures the code run inside the context. Steps measured inside another one inherit its file.
+
+        Parameters:
+        step (str): The name of the step.
+        file (str or None, optional): The file the step works on. Default is the file of the enclosing step.
+        """
+
+        file = file if file is not None else (self._files[-1] if self._files else None)
+        self._files.append(file)
+        peak_before = peak_memory_mb()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = peak_memory_mb()
+            self._files.pop()
+            self.records.append({
+                'step': step,
+                'file': file,
+                'wall_s': round(wall, 6),
+                'cpu_s': round(cpu, 6),
+                'peak_memory_mb': round(peak, 1) if peak is not None else None,
+                'memory_growth_mb': round(peak - peak_before, 1) if peak is not None else None,
+            })
+
+    def drain(self) -> list[dict]:
+        """
+        Returns the measurements and forgets them (e.g. to send those of a worker process back to the parent).
+
+        Returns:
+        list[dict]: The measurements.
+        """
+
+        records, self.records = self.records, []
+        return records
+
+    def extend(self, records: list[dict]) -> None:
+        """
+        Adds measurements taken elsewhere (e.g. in a worker process).
+
+        Parameters:
+        records (list[dict]): The measurements.
+        """
+
+        self.records.extend(records)
+
+    def summary(self, top: int = REPORT_TOP) -> dict:
+        """
+        Summarizes the measurements: totals per step, the slowest files and the slowest single measurements.
+        Steps can be nested (e.g. 'docx_conversion' inside 'invoice'), so the step totals overlap.
+
+        Parameters:
+        top (int, optional): Number of files and measurements listed. Default is 'REPORT_TOP'.
+
+        Returns:
+        dict: The summary.
+        """
+
+        steps = {}
+        for record in self.records:
+            totals = steps.setdefault(record['step'], {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'max_wall_s': 0.0})
+            totals['count'] += 1
+            totals['wall_s'] += record['wall_s']
+            totals['cpu_s'] += record['cpu_s']
+            totals['max_wall_s'] = max(totals['max_wall_s'], record['wall_s'])
+        for totals in steps.values():
+            totals['mean_wall_s'] = totals['wall_s'] / totals['count']
+            for key in totals:
+                totals[key] = round(totals[key], 6)
+
+        # A file's time is that of its longest step, the outermost one (e.g. 'invoice'), so nested steps are not
+        # counted twice
+        files = {}
+        for record in self.records:
+            if record['file'] is not None:
+                entry = files.setdefault(record['file'], {'file': record['file'], 'steps': {}})
+                entry['steps'][record['step']] = round(entry['steps'].get(record['step'], 0.0) + record['wall_s'], 6)
+        for entry in files.values():
+            entry['wall_s'] = max(entry['steps'].values())
+        slowest_files = sorted(files.values(), key=lambda entry: entry['wall_s'], reverse=True)[:top]
+
+        return {
+            'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'measurements': len(self.records),
+            'peak_memory_mb': max((r['peak_memory_mb'] for r in self.records if r['peak_memory_mb'] is not None), default=None),
+            'steps': dict(sorted(steps.items(), key=lambda item: item[1]['wall_s'], reverse=True)),
+            'slowest_files': slowest_files,
+            'slowest_steps': sorted(self.records, key=lambda record: record['wall_s'], reverse=True)[:top],
+        }
+
+    def write_report(self, path: str = PERFORMANCE_REPORT_PATH, top: int = REPORT_TOP) -> dict:
+        """
+        Writes the summary of the measurements to a JSON file.
+
+        Parameters:
+        path (str, optional): The path of the JSON file. Default is 'PERFORMANCE_REPORT_PATH'.
+        top (int, optional): Number of files and measurements listed. Default is 'REPORT_TOP'.
+
+        Returns:
+        dict: The summary written.
+        """
+
+        summary = self.summary(top)
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=1)
+
+        return summary
+
+
+# Recorder of this process (created on first use)
+_recorder = None
+
+
+def get_recorder() -> Recorder:
+    """
+    Returns the recorder of this process.
+
+    Returns:
+    Recorder: The recorder.
+    """
+
+    global _recorder
+    if _recorder is None:
+        _recorder = Recorder()
+    return _recorder
+
+
+def measure(step: str, file: str or None = None):
+    """
+    Measures the code run inside the context with the recorder of this process (see 'Recorder.measure').
+
+    Parameters:
+    step (str): The name of the step.
+    file (str or None, optional): The file the step works on. Default is the file of the enclosing step.
+    """
+
+    return get_recorder().measure(step, file)
+
+
+def measured(step: str):
+    """
+    Decorator measuring every call of a function or method as a step.
+
+    Parameters:
+    step (str): The name of the step.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measure(step):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -1,285 +1,627 @@
-import pandas as pd
-import re
-from text_extraction import *
-from collect_and_preprocess import find_cell_with_exact_content, merge_row_cells_with_below
-from utils import read_and_preprocess_catalog, to_float
-
-
-class Invoice:
-    def __init__(self, file_name, catalog) -> None:
-        """
-        Initializes an Invoice instance.
-
-        Processesing both PDF and DOCX versions of an invoice, extracting text, identifying key data points
-        like invoice number, issue date, client name, etc., from the extracted text. It also processes product data,
-        calculates amounts, and sets a flag for any discrepancies.
-    
-        Parameters:
-        file_name (str): Name of the file.
-        catalog (DataFrame): A catalog DataFrame.
-        """
-
-        self.pdf_file_name = file_name + '.pdf'
-        self.docx_file_name = file_name + '.docx'
-
-        self.text_pdf = get_text_from_pdf(self.pdf_file_name)
-        self.lines_pdf = re.split('\n', self.text_pdf)
-
-        docx_path = convert_pdf_to_docx(self.pdf_file_name)
-        # self._preprocess_docx(docx_path)
-        if docx_path:
-            self.text_docx = extract_text_from_docx(docx_path)
-        self.lines_docx = re.split('\n', self.text_docx)
-
-        self.text_list_docx = extract_table_data_from_docx(self.docx_file_name)
-        self.text_list_pdf = extract_table_data_from_pdf(self.pdf_file_name)
-
-        self.invoice_number = self._get_data_based_on_keyword(['invoice number', 'invoice nr'], self.text_list_docx)
-        self.issue_date = self._get_data_based_on_keyword(['issue date', 'fecha'], self.text_list_docx)
-        self.client_name = self._get_data_based_on_keyword(['bill to', 'importador'], self.text_list_docx)
-        self.currency = self._get_data_based_on_keyword(['currency', 'moneda'], self.text_list_docx)
-        self.destination_port = self._get_data_based_on_keyword(['destination port', 'puerto de destino'], self.text_list_docx)
-        self.products = self._get_products()
-        self.products = self._get_product_names_and_sizes(catalog)
-
-        self.sub_total_amount = 0
-        self.fumigation = 0
-        self.fob = 0
-        self._get_amounts(['sub-total amount', 'sub-total', 'valor sub-total'])
-        self.flag = False
-
-    def _preprocess_docx(self, docx_path):
-        """
-        Preprocesses a DOCX file by merging cells with specific content in a table.
-    
-        Used to modify the table structure in a DOCX file, based on the presence of 
-        specific content (e.g., 'Sqm', 'M2') in the table cells.
-    
-        Parameters:
-        docx_path (str): The file path of the DOCX document.
-        """
-
-        locations = find_cell_with_exact_content(docx_path, target_string='Sqm')
-        if locations == None:
-            locations = find_cell_with_exact_content(docx_path, target_string='M2')
-
-        if locations != None and len(locations) >= 2:
-            merge_row_cells_with_below(docx_path, locations[0], locations[1], save_path=docx_path)
-
-    def _get_data_based_on_keyword(self, keywords, list_text):
-        """
-        Extracts data based on a list of keywords from a given text list.
-        Searches for each keyword in the text list and returns the text immediately following the 
-        first occurrence of any of the keywords.
-    
-        Parameters:
-        keywords (list): A list of keywords to search for in the text.
-        list_text (list): The list of text lines to search through.
-    
-        Returns:
-        str: The extracted data following the keyword or an empty string if not found.
-        """
-
-        for text in list_text:
-            for keyword in keywords:
-                if text.casefold().startswith(keyword):
-                    return text[len(keyword):].strip()
-
-        return ''
-
-    def _get_products(self):
-        """
-        Extracts product information from the invoice document.
-        Processes the document text to identify and extract product information such as product codes,
-        quantities, unit prices, and total prices. It returns this information in a DataFrame format.
-    
-        Returns:
-        DataFrame: A DataFrame containing product information extracted from the invoice.
-        """
-
-        lines = self.lines_docx
-        # Remove whitespaces from the beggining of each line
-        lines = [line.lstrip() for line in lines]
-
-        start_strings = ['description of goods', 'descripcion de las mercancias']
-        end_strings = ['signature', 'visto']
-
-        # Find lines within start_string and end_string
-        start_index = next(
-            (i for i, s in enumerate(lines) for start_string in start_strings if s.lower().startswith(start_string)),
-            None)
-        end_index = next(
-            (i for i, s in enumerate(lines) for end_string in end_strings if s.lower().startswith(end_string)), None)
-
-        if start_index is not None and end_index is not None:
-            lines = lines[start_index:end_index + 1]
-
-        # Extract product codes
-        code_list = [re.match(r'^(\d{5}|990).*', s).group(1) for s in lines if re.match(r'^(\d{5}|990).*', s)]
-
-        # Get extract containing square meter quantities, unit prices and total prices
-        sqm_extract = self._get_data_based_on_keyword(['sqm', 'm2'], self.text_list_docx)
-        unit_prices_extract = self._get_data_based_on_keyword(['unit.price', 'precio un', 'prieco un'], self.text_list_docx)
-        total_prices_extract = self._get_data_based_on_keyword(['total', 'importe'], self.text_list_docx)
-
-        # Split string into parts using pattern that matches anything not a digit, comma, or period
-        sqm_list = re.split(r'[^0-9.,]+', sqm_extract)
-        unit_prices_list = re.split(r'[^0-9.,]+', unit_prices_extract)
-        total_prices_list = re.split(r'[^0-9.,]+', total_prices_extract)
-
-        # Remove empty strings resulting from the split
-        sqm_list = [part for part in sqm_list if part]
-        unit_prices_list = [part for part in unit_prices_list if part]
-        total_prices_list = [part for part in total_prices_list if part]
-
-        try:
-            # Check if all lists have the same length
-            if len(set(map(len, [code_list, sqm_list, unit_prices_list, total_prices_list]))) != 1:
-                truncate_to_shortest(code_list, sqm_list, unit_prices_list, total_prices_list)
-
-            df = pd.DataFrame({
-                'Product_code': code_list,
-                'Sqm': sqm_list,
-                'Unit_price': unit_prices_list,
-                'Total_price': total_prices_list
-            })
-
-            return df
-
-        except ValueError as e:
-            print(f'{self.invoice_number}: {e}')
-            return pd.DataFrame()
-
-    def _get_product_names_and_sizes(self, catalog):
-        """
-        Merges product data with additional information from a catalog.
-        This method combines the extracted product data with a catalog to include additional details like product
-        names and sizes. It returns a DataFrame with the merged information.
-    
-        Parameters:
-        catalog (DataFrame): Product catalog dataframe.
-    
-        Returns:
-        DataFrame: A dataframe with product information.
-        """
-
-        df = self.products
-
-        df['Product_code'] = df['Product_code'].astype(str)
-
-        merged_df = pd.merge(df, catalog, left_on='Product_code', right_on='COD', how='left')
-        merged_df.rename(columns={'REFERÊNCIA': 'Product_name', 'TAMANHO': 'Size'}, inplace=True)
-
-        df = merged_df[list(df.columns) + ['Product_name', 'Size']]
-        cols_to_order = ['Product_code', 'Product_name', 'Size']
-        df = df[cols_to_order + (df.columns.drop(cols_to_order).tolist())]
-
-        return df
-
-    def _get_amounts(self, keywords):
-        """
-        Extracts various monetary amounts from the invoice text based on given keywords.
-        This method searches the text for specified keywords and extracts the monetary values that follow these
-        keywords. 
-    
-        Parameters:
-        keywords (list): A list of keywords to search for in the invoice text.
-        """
-
-        text = self.text_pdf
-        text = text.lower()
-        for keyword in keywords:
-            index = text.find(keyword)
-            if index != -1:
-                text = text[index + len(keyword):]
-                break
-
-        if index == -1:
-            return None
-
-        print(text)
-        if re.search(r'\.\d{1,3}\,', text):
-            # Matches numbers using "." for thousands and "," for decimals
-            pattern = r'(\d{1,3}(?:\.\d{3})*(?:,\d+)?)'
-        else:
-            # Matches numbers using "," for thousands and "." for decimals
-            pattern = r'(\d{1,3}(?:,\d{3})*(?:\.\d+)?)'
-
-        amounts = re.findall(pattern, text)
-        print(amounts)
-        self.sub_total_amount = amounts[0] if len(amounts) > 0 else None
-        self.fumigation = amounts[1] if len(amounts) > 2 else None
-        if len(amounts) == 2:
-            self.fob = amounts[1]
-        elif len(amounts) > 2:
-            self.fob = amounts[2]
-        else:
-            self.fob = None
-
-
-def main():
-    """
-    Reads and preprocesses a catalog; iterates through each PDF file in the specified directory;
-    processes each file as an invoice; Performs various calculation; 
-    Identifies discrepancies between calculated subtotals and the sum of product prices, flags these invoices, and then 
-    compiles the data from all processed invoices into a single DataFrame. This DataFrame is then saved to a CSV file.
-    """
-
-    catalog = read_and_preprocess_catalog()
-
-    files = [f for f in os.listdir(PDFs_DIR_PATH) if os.path.isfile(os.path.join(PDFs_DIR_PATH, f))]
-    invoices = []
-    invoice_numbers = []
-    flags = 0
-    broken_invoices = []
-    for i, file in enumerate(files):
-        file = re.sub(r'\..*', '', file)
-        print(f'Processing file: {file}')
-        invoices.append(Invoice(file, catalog))
-
-        df = invoices[i].products.copy()
-        df['Total_price'] = df['Total_price'].apply(to_float)
-        sub_total_amount = to_float(invoices[i].sub_total_amount)
-        price_sum = df['Total_price'].sum()
-        if sub_total_amount != price_sum:
-            df = df.drop_duplicates(subset='Product_code', keep='first')
-            price_sum = df['Total_price'].sum()
-            if sub_total_amount != price_sum:
-                flags += 1
-                broken_invoices.append(invoices[i])
-                invoices[i].flag = True
-                print(f'sub-total amount - {str(sub_total_amount)} is different then SUM of products - {str(price_sum)}')
-            else:
-                invoices[i].products = df
-
-        print(f'Done: {file}')
-        print(f'[{i} / {len(files)}] - done')
-
-    print(f'\nflags: {flags}')  
-
-    test = broken_invoices[0].fob
-
-    # Build final frame:
-    df = pd.DataFrame()
-    for invoice in invoices:
-        if invoice.flag:
-            continue
-        df_invoice = invoice.products
-        df_invoice['Invoice_number'] = invoice.invoice_number
-        df_invoice['Client'] = invoice.client_name
-        df_invoice['Date'] = invoice.issue_date
-        df_invoice['Currency'] = invoice.currency
-        df_invoice['Destination'] = invoice.destination_port
-        df_invoice['FOB'] = invoice.fob
-        df = pd.concat([df, df_invoice], axis=0).reset_index(drop=True)
-
-    df.to_csv('C:/All/PyProjects/Orbis/invoices.csv', index=False)
-
-if __name__ == "__main__":
-    main()
-
-   
-    
-
-
-
+import pandas as pd
+import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import text_extraction
+from text_extraction import *
+from collect_and_preprocess import find_cell_with_exact_content, merge_row_cells_with_below
+from manifest import Manifest
+from near_duplicates import find_near_duplicates, write_report, NEAR_DUPLICATES_REPORT_PATH
+from invoice_sink import InvoiceSink, SINK_FORMATS, OUTPUT_COLUMNS
+from reconciliation import ReconciliationReport, reconcile_batch, DEDUPLICATED, MISMATCH, FAILED
+from setup import OUTPUT_DIR_PATH
+from decimal import Decimal
+from catalog import LOOKUP_COLUMNS, load_catalog_index
+import layouts
+from layouts import LayoutTemplate, GENERIC_LAYOUT, get_layout_registry
+from utils import to_fixed_point, source_version, file_hash
+from instrumentation import get_logger, get_recorder, measure, PERFORMANCE_REPORT_PATH
+
+
+logger = get_logger('invoice_processing')
+
+# Extraction engines: 'docx' converts the PDF with pdf2docx, 'native' reads lines and cells with pdfplumber
+ENGINES = ['docx', 'native']
+
+# Header fields of an Invoice that are kept in the manifest
+MANIFEST_FIELDS = ['invoice_number', 'issue_date', 'client_name', 'currency', 'destination_port',
+                   'sub_total_amount', 'fumigation', 'fob']
+
+
+def extract_header_fields(list_text: list[str], layout: LayoutTemplate = GENERIC_LAYOUT) -> dict:
+    """
+    Extracts every header field from the table cells of an invoice in a single pass. Each cell is casefolded
+    once and matched against the keywords of all fields at the same time. A field takes the text following its
+    keyword in the first cell starting with one of its keywords (the earliest listed keyword if several match).
+
+    Parameters:
+    list_text (list[str]): The table cells of the invoice.
+    layout (LayoutTemplate, optional): Layout whose header keywords are used. Default is 'GENERIC_LAYOUT'.
+
+    Returns:
+    dict: The extracted text of each field, or an empty string if not found.
+    """
+
+    fields = layout.header_fields
+
+    header = {}
+    for text in list_text:
+        best = {}
+        for keyword, (field, rank) in layout.header_trie.match_prefixes(text.casefold()):
+            if field not in header and (field not in best or rank < best[field][1]):
+                best[field] = (keyword, rank)
+        for field, (keyword, _) in best.items():
+            header[field] = text[len(keyword):].strip()
+        if len(header) == len(fields):
+            break
+
+    return {field: header.get(field, '') for field in fields}
+
+
+class Invoice:
+    def __init__(self, file_name, catalog, engine='docx') -> None:
+        """
+        Initializes an Invoice instance.
+
+        Processesing both PDF and DOCX versions of an invoice, extracting text, identifying key data points
+        like invoice number, issue date, client name, etc., from the extracted text. It also processes product data,
+        calculates amounts, and sets a flag for any discrepancies.
+    
+        Parameters:
+        file_name (str): Name of the file.
+        catalog (CatalogIndex): The catalog index.
+        engine (str): Extraction engine, one of 'ENGINES'. Default is 'docx'.
+        """
+
+        if engine not in ENGINES:
+            raise ValueError(f'Unknown extraction engine: {engine}')
+
+        self.pdf_file_name = file_name + '.pdf'
+        self.docx_file_name = file_name + '.docx'
+
+        # Every extractor works from the same in-memory PDF and DOCX
+        with InvoiceDocument(self.pdf_file_name) as document:
+            self.text_pdf = document.get_text()
+            self.lines_pdf = re.split('\n', self.text_pdf)
+
+            # The native engine fills the DOCX attributes with equivalent structures read from the PDF
+            if engine == 'native':
+                self.text_docx = document.get_native_text()
+                self.text_list_docx = document.get_native_table_data()
+            else:
+                # self._preprocess_docx(document.convert_to_docx())
+                self.text_docx = document.get_docx_text()
+                self.text_list_docx = document.get_docx_table_data()
+            self.lines_docx = re.split('\n', self.text_docx)
+
+            self.text_list_pdf = document.get_table_data()
+
+        # Only the rules of the layout recognized from the PDF text are run
+        with measure('header'):
+            self.layout = get_layout_registry().select(self.text_pdf)
+            self.header = extract_header_fields(self.text_list_docx, self.layout)
+        self.invoice_number = self.header['invoice_number']
+        self.issue_date = self.header['issue_date']
+        self.client_name = self.header['client_name']
+        self.currency = self.header['currency']
+        self.destination_port = self.header['destination_port']
+        with measure('products'):
+            self.products = self._get_products()
+        # Kept so a cached invoice can be matched again against a newer catalog
+        self.raw_products = self.products.copy()
+        with measure('catalog_lookup'):
+            self.products = self._get_product_names_and_sizes(catalog)
+
+        self.sub_total_amount = 0
+        self.fumigation = 0
+        self.fob = 0
+        with measure('amounts'):
+            self._get_amounts(self.layout.amount_keywords)
+        self.flag = False
+
+    @classmethod
+    def from_manifest_entry(cls, file_name, entry, catalog, catalog_version):
+        """
+        Rebuilds an Invoice from a manifest entry without touching the PDF. The stored catalog matches are
+        reused when they were made with the same catalog version; otherwise the raw product rows are matched again.
+
+        Parameters:
+        file_name (str): Name of the file.
+        entry (dict): The manifest entry, as written by 'to_manifest_entry'.
+        catalog (CatalogIndex): The catalog index.
+        catalog_version (str): Version of 'catalog'.
+
+        Returns:
+        Invoice: The rebuilt invoice. Its text attributes are not available.
+        """
+
+        invoice = cls.__new__(cls)
+        invoice.pdf_file_name = file_name + '.pdf'
+        invoice.docx_file_name = file_name + '.docx'
+        for field in MANIFEST_FIELDS:
+            setattr(invoice, field, entry['fields'][field])
+
+        invoice.raw_products = pd.DataFrame(entry['raw_products'], columns=entry['raw_columns'])
+        if entry['catalog_version'] == catalog_version:
+            invoice.products = pd.DataFrame(entry['products'], columns=entry['columns'])
+        else:
+            invoice.products = invoice.raw_products.copy()
+            invoice.products = invoice._get_product_names_and_sizes(catalog)
+        invoice.flag = False
+
+        return invoice
+
+    def to_manifest_entry(self, extractor_version, catalog_version):
+        """
+        Serializes the extracted header fields and product rows for the manifest.
+
+        Parameters:
+        extractor_version (str): Version of the extraction code.
+        catalog_version (str): Version of the catalog the products were matched against.
+
+        Returns:
+        dict: The manifest entry.
+        """
+
+        return {
+            'file_name': self.pdf_file_name,
+            'extractor_version': extractor_version,
+            'catalog_version': catalog_version,
+            'fields': {field: getattr(self, field) for field in MANIFEST_FIELDS},
+            'raw_columns': list(self.raw_products.columns),
+            'raw_products': self.raw_products.values.tolist(),
+            'columns': list(self.products.columns),
+            'products': self.products.values.tolist(),
+        }
+
+    def _preprocess_docx(self, docx_path):
+        """
+        Preprocesses a DOCX file by merging cells with specific content in a table.
+    
+        Used to modify the table structure in a DOCX file, based on the presence of 
+        specific content (e.g., 'Sqm', 'M2') in the table cells.
+    
+        Parameters:
+        docx_path (str): The file path of the DOCX document.
+        """
+
+        locations = find_cell_with_exact_content(docx_path, target_string='Sqm')
+        if locations == None:
+            locations = find_cell_with_exact_content(docx_path, target_string='M2')
+
+        if locations != None and len(locations) >= 2:
+            merge_row_cells_with_below(docx_path, locations[0], locations[1], save_path=docx_path)
+
+    def _get_products(self):
+        """
+        Extracts product information from the invoice document.
+        Processes the document text to identify and extract product information such as product codes,
+        quantities, unit prices, and total prices. It returns this information in a DataFrame format.
+    
+        Returns:
+        DataFrame: A DataFrame containing product information extracted from the invoice.
+        """
+
+        lines = self.lines_docx
+        # Remove whitespaces from the beggining of each line
+        lines = [line.lstrip() for line in lines]
+
+        # Find lines within the start and end strings of the layout
+        start_index = next((i for i, s in enumerate(lines) if s.lower().startswith(self.layout.start_strings)), None)
+        end_index = next((i for i, s in enumerate(lines) if s.lower().startswith(self.layout.end_strings)), None)
+
+        if start_index is not None and end_index is not None:
+            lines = lines[start_index:end_index + 1]
+
+        # Extract product codes
+        matches = (self.layout.product_code_regex.match(s) for s in lines)
+        code_list = [match.group(1) for match in matches if match]
+
+        # Get extract containing square meter quantities, unit prices and total prices
+        sqm_extract = self.header['sqm']
+        unit_prices_extract = self.header['unit_price']
+        total_prices_extract = self.header['total_price']
+
+        # Split string into parts using pattern that matches anything not a digit, comma, or period
+        sqm_list = re.split(r'[^0-9.,]+', sqm_extract)
+        unit_prices_list = re.split(r'[^0-9.,]+', unit_prices_extract)
+        total_prices_list = re.split(r'[^0-9.,]+', total_prices_extract)
+
+        # Remove empty strings resulting from the split
+        sqm_list = [part for part in sqm_list if part]
+        unit_prices_list = [part for part in unit_prices_list if part]
+        total_prices_list = [part for part in total_prices_list if part]
+
+        try:
+            # Check if all lists have the same length
+            if len(set(map(len, [code_list, sqm_list, unit_prices_list, total_prices_list]))) != 1:
+                truncate_to_shortest(code_list, sqm_list, unit_prices_list, total_prices_list)
+
+            df = pd.DataFrame({
+                'Product_code': code_list,
+                'Sqm': sqm_list,
+                'Unit_price': unit_prices_list,
+                'Total_price': total_prices_list
+            })
+
+            return df
+
+        except ValueError as e:
+            logger.warning(f'{self.invoice_number}: {e}')
+            return pd.DataFrame()
+
+    def _get_product_names_and_sizes(self, catalog):
+        """
+        Adds the name, size and factory of every product, looked up by product code in the catalog index.
+    
+        Parameters:
+        catalog (CatalogIndex): The catalog index.
+    
+        Returns:
+        DataFrame: A dataframe with product information.
+        """
+
+        df = self.products
+
+        df['Product_code'] = df['Product_code'].astype(str)
+
+        df = df.reset_index(drop=True)
+        df = pd.concat([df, catalog.lookup(df['Product_code'])], axis=1)
+        cols_to_order = ['Product_code'] + LOOKUP_COLUMNS
+        df = df[cols_to_order + (df.columns.drop(cols_to_order).tolist())]
+
+        return df
+
+    def to_output_frame(self):
+        """
+        Builds the rows of this invoice for the final invoices frame: the products plus the invoice header fields.
+
+        Returns:
+        DataFrame: The invoice rows.
+        """
+
+        df_invoice = self.products.copy()
+        df_invoice['Invoice_number'] = self.invoice_number
+        df_invoice['Client'] = self.client_name
+        df_invoice['Date'] = self.issue_date
+        df_invoice['Currency'] = self.currency
+        df_invoice['Destination'] = self.destination_port
+        df_invoice['FOB'] = self.fob
+
+        return df_invoice
+
+    def _get_amounts(self, keywords):
+        """
+        Extracts various monetary amounts from the invoice text based on given keywords.
+        This method searches the text for specified keywords and extracts the monetary values that follow these
+        keywords. 
+    
+        Parameters:
+        keywords (list): A list of keywords to search for in the invoice text.
+        """
+
+        text = self.text_pdf
+        text = text.lower()
+        for keyword in keywords:
+            index = text.find(keyword)
+            if index != -1:
+                text = text[index + len(keyword):]
+                break
+
+        if index == -1:
+            return None
+
+        logger.debug('Amounts text of %s: %s', self.pdf_file_name, text)
+        if re.search(r'\.\d{1,3}\,', text):
+            # Matches numbers using "." for thousands and "," for decimals
+            pattern = r'(\d{1,3}(?:\.\d{3})*(?:,\d+)?)'
+        else:
+            # Matches numbers using "," for thousands and "." for decimals
+            pattern = r'(\d{1,3}(?:,\d{3})*(?:\.\d+)?)'
+
+        amounts = re.findall(pattern, text)
+        logger.debug('Amounts of %s: %s', self.pdf_file_name, amounts)
+        self.sub_total_amount = amounts[0] if len(amounts) > 0 else None
+        self.fumigation = amounts[1] if len(amounts) > 2 else None
+        if len(amounts) == 2:
+            self.fob = amounts[1]
+        elif len(amounts) > 2:
+            self.fob = amounts[2]
+        else:
+            self.fob = None
+
+
+# Any change to the extraction code invalidates the manifest entries built with it
+EXTRACTOR_VERSION = source_version(text_extraction, layouts, Invoice, extract_header_fields)
+
+# Catalog used by the invoices built in this process (loaded once per worker)
+_worker_catalog = None
+
+
+def get_extractor_version(engine: str) -> str:
+    """
+    Version of the extraction code for a given engine, used to key the manifest entries.
+
+    Parameters:
+    engine (str): Extraction engine.
+
+    Returns:
+    str: The version string.
+    """
+
+    config_hash = get_layout_registry().config_hash
+    return f'{EXTRACTOR_VERSION}-{config_hash}-{engine}' if config_hash else f'{EXTRACTOR_VERSION}-{engine}'
+
+
+def _init_worker() -> None:
+    """
+    Process pool initializer. Loads the compiled catalog index once for every worker process.
+    """
+
+    global _worker_catalog
+    _worker_catalog = load_catalog_index()
+
+
+def _process_file(file_name: str, engine: str = 'docx') -> tuple:
+    """
+    Builds the Invoice of a single file inside a worker process. Exceptions are returned instead of raised,
+    so a broken invoice does not take the whole batch down with it. The measurements of the extraction steps
+    are returned too, since the recorder of a worker process is not the one of the main process.
+
+    Parameters:
+    file_name (str): Name of the file (without extension).
+    engine (str): Extraction engine.
+
+    Returns:
+    tuple: (Invoice or None, error message or None, measurements).
+    """
+
+    try:
+        with measure('invoice', file=file_name):
+            invoice, error = Invoice(file_name, _worker_catalog, engine), None
+    except Exception as e:
+        invoice, error = None, f'{type(e).__name__}: {str(e)}'
+
+    return invoice, error, get_recorder().drain()
+
+
+def extract_invoices(file_names: list[str], workers: int = 1, engine: str = 'docx'):
+    """
+    Builds an Invoice for each file, either sequentially or spread across a process pool. Results are yielded
+    in the same order as 'file_names', whatever order the workers finish in.
+
+    If a worker process dies (e.g. a crash inside a native PDF library), the first unfinished file is rerun
+    alone in a fresh process and reported as failed if it crashes again; the rest of the batch carries on
+    in a new pool.
+
+    Parameters:
+    file_names (list[str]): Names of the files (without extension).
+    workers (int): Number of worker processes. 1 runs everything in the current process.
+    engine (str): Extraction engine.
+
+    Yields:
+    tuple: (file name, Invoice or None, error message or None).
+    """
+
+    if workers <= 1:
+        _init_worker()
+        for file_name in file_names:
+            logger.info(f'Processing file: {file_name}')
+            invoice, error, records = _process_file(file_name, engine)
+            get_recorder().extend(records)
+            yield file_name, invoice, error
+        return
+
+    results = {}
+    next_index = 0
+    isolate = False
+
+    def ready():
+        # Results are handed back in file order as soon as the prefix is complete
+        nonlocal next_index
+        while next_index in results:
+            invoice, error, records = results.pop(next_index)
+            get_recorder().extend(records)
+            yield file_names[next_index], invoice, error
+            next_index += 1
+
+    while next_index < len(file_names):
+        pending = [i for i in range(next_index, len(file_names)) if i not in results]
+
+        if isolate:
+            i = pending[0]
+            with ProcessPoolExecutor(max_workers=1, initializer=_init_worker) as executor:
+                try:
+                    results[i] = executor.submit(_process_file, file_names[i], engine).result()
+                except BrokenProcessPool:
+                    results[i] = (None, 'worker process terminated abruptly', [])
+            isolate = False
+            yield from ready()
+            continue
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            futures = {i: executor.submit(_process_file, file_names[i], engine) for i in pending}
+            for i in pending:
+                try:
+                    results[i] = futures[i].result()
+                except BrokenProcessPool:
+                    isolate = True
+                    break
+                yield from ready()
+
+        # Keep whatever finished before the pool broke
+        for i in pending:
+            if i not in results and futures[i].done() and futures[i].exception() is None:
+                results[i] = futures[i].result()
+        yield from ready()
+
+
+def collect_invoices(file_names: list[str], workers: int = 1, manifest: Manifest or None = None, engine: str = 'docx'):
+    """
+    Like 'extract_invoices', but takes invoices whose PDF content was already extracted by the same
+    extraction code from the manifest, and records the newly extracted ones in it.
+
+    Parameters:
+    file_names (list[str]): Names of the files (without extension).
+    workers (int): Number of worker processes used for the files that need extraction.
+    manifest (Manifest or None): The manifest. None extracts every file.
+    engine (str): Extraction engine. Entries are only reused for the engine that produced them.
+
+    Yields:
+    tuple: (file name, Invoice or None, error message or None), in the order of 'file_names'.
+    """
+
+    # Compiled here first, so the workers only have to load the cached artifact
+    catalog = load_catalog_index()
+    if manifest is None:
+        yield from extract_invoices(file_names, workers, engine)
+        return
+
+    extractor_version = get_extractor_version(engine)
+    catalog_version = catalog.version
+    hashes = {file_name: manifest.hash_file(PDFs_DIR_PATH + file_name + '.pdf') for file_name in file_names}
+    cached = {file_name for file_name in file_names if manifest.get(hashes[file_name], extractor_version)}
+    logger.info(f'Manifest: {len(cached)} cached, {len(file_names) - len(cached)} to extract')
+
+    extracted = extract_invoices([file_name for file_name in file_names if file_name not in cached], workers, engine)
+    for file_name in file_names:
+        content_hash = hashes[file_name]
+        if file_name in cached:
+            entry = manifest.get(content_hash, extractor_version)
+            invoice = Invoice.from_manifest_entry(file_name, entry, catalog, catalog_version)
+            if entry['catalog_version'] != catalog_version:
+                manifest.put(content_hash, invoice.to_manifest_entry(extractor_version, catalog_version))
+            yield file_name, invoice, None
+        else:
+            file_name, invoice, error = next(extracted)
+            if invoice is not None:
+                manifest.put(content_hash, invoice.to_manifest_entry(extractor_version, catalog_version))
+            yield file_name, invoice, error
+
+    manifest.save()
+
+
+def write_reconciled(batch: list[tuple], sink: InvoiceSink, report: ReconciliationReport) -> pd.DataFrame:
+    """
+    Reconciles a batch of invoices in a single pass (see 'reconcile_batch'), flags the mismatched ones and
+    writes the rows of the reconciled ones to the sink, in the order of the batch.
+
+    Parameters:
+    batch (list[tuple]): (file name, Invoice) of every invoice of the batch.
+    sink (InvoiceSink): The sink receiving the rows.
+    report (ReconciliationReport): The report the batch is appended to.
+
+    Returns:
+    pd.DataFrame: The reconciliation report of the batch.
+    """
+
+    invoices = pd.DataFrame([{'file': file_name, 'invoice_number': invoice.invoice_number,
+                              'sub_total_amount': invoice.sub_total_amount} for file_name, invoice in batch],
+                            columns=['file', 'invoice_number', 'sub_total_amount'])
+    frames = [invoice.to_output_frame().assign(File=file_name) for file_name, invoice in batch
+              if 'Total_price' in invoice.products.columns]
+    items = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=OUTPUT_COLUMNS + ['File'])
+
+    batch_report, keep = reconcile_batch(items, invoices)
+    no_products = ~invoices['file'].isin(items['File']).to_numpy() & (batch_report['status'] != FAILED).to_numpy()
+    batch_report.loc[no_products, ['status', 'error']] = [FAILED, 'no product rows']
+    keep &= ~items['File'].isin(invoices['file'][no_products])
+
+    # The prices of deduplicated invoices are written as the Decimals they were reconciled with
+    status = items['File'].map(batch_report.set_index('file')['status'])
+    deduplicated = keep & (status == DEDUPLICATED)
+    items['Total_price'] = items['Total_price'].astype(object)
+    items.loc[deduplicated, 'Total_price'] = to_fixed_point(items.loc[deduplicated, 'Total_price'], as_decimal=True)
+
+    for (file_name, invoice), row in zip(batch, batch_report.itertuples(index=False)):
+        if row.status == MISMATCH:
+            invoice.flag = True
+            logger.warning(f'{file_name}: sub-total amount - {Decimal(int(row.sub_total)).scaleb(-2)} is different then '
+                           f'SUM of products - {Decimal(int(row.sub_total - row.difference)).scaleb(-2)}')
+        elif row.status == FAILED:
+            logger.warning(f'Failed: {file_name} - {row.error}')
+
+    sink.write(items.loc[keep, OUTPUT_COLUMNS])
+    report.append(batch_report)
+
+    return batch_report
+
+
+def main(workers: int = 1, use_manifest: bool = True, engine: str = 'docx', output_format: str = 'csv',
+         batch_size: int = 100, skip_near_duplicates: bool = True):
+    """
+    Iterates through each PDF file in the specified directory; processes each file as an invoice; Performs various calculation; 
+    Identifies discrepancies between calculated subtotals and the sum of product prices and flags these invoices.
+    Near duplicates of other files (renamed copies, rescans) are skipped before extraction and listed in a report.
+    Invoices are reconciled in batches; the rows of every invoice that is not flagged are streamed to a part file,
+    which is then compacted into a CSV file, and the outcome of every invoice is saved to a reconciliation report.
+    The wall time, CPU time and memory of every step and invoice are written to a performance report.
+
+    Parameters:
+    workers (int): Number of worker processes used for invoice extraction. Default is 1 (no pool).
+    use_manifest (bool): Whether to reuse the invoices recorded in the manifest. Default is True.
+    engine (str): Extraction engine, one of 'ENGINES'. Default is 'docx'.
+    output_format (str): Format of the intermediate part file, one of 'SINK_FORMATS'. Default is 'csv'.
+    batch_size (int): Number of invoices reconciled together. Default is 100.
+    skip_near_duplicates (bool): Whether to skip the near duplicates of other files. Default is True.
+    """
+
+    files = sorted(f for f in os.listdir(PDFs_DIR_PATH) if os.path.isfile(os.path.join(PDFs_DIR_PATH, f)))
+    files = [re.sub(r'\..*', '', file) for file in files]
+    failed_files = []
+    manifest = Manifest() if use_manifest else None
+
+    if skip_near_duplicates:
+        with measure('near_duplicates'):
+            groups = find_near_duplicates(files, hash_file=manifest.hash_file if manifest else file_hash)
+        write_report(groups)
+        duplicates = {file for group in groups for file in group[1:]}
+        files = [file for file in files if file not in duplicates]
+        logger.info(f'near duplicates skipped: {len(duplicates)} ({NEAR_DUPLICATES_REPORT_PATH})')
+
+    report = ReconciliationReport()
+    with InvoiceSink(output_format) as sink:
+        batch = []
+        for i, (file, invoice, error) in enumerate(collect_invoices(files, workers, manifest, engine)):
+            if invoice is None:
+                failed_files.append(file)
+                logger.warning(f'Failed: {file} - {error}')
+                continue
+
+            batch.append((file, invoice))
+            logger.info(f'Done: {file} [{i} / {len(files)}]')
+
+            if len(batch) >= batch_size:
+                with measure('reconciliation'):
+                    write_reconciled(batch, sink, report)
+                batch = []
+
+        if batch:
+            with measure('reconciliation'):
+                write_reconciled(batch, sink, report)
+
+    logger.info(f'flags: {report.counts[MISMATCH]}')
+    logger.info(f'deduplicated: {report.counts[DEDUPLICATED]}')
+    logger.info(f'failed: {len(failed_files) + report.counts[FAILED]}')
+    logger.info(f'Reconciliation report: {report.path}')
+
+    with measure('compaction'):
+        sink.compact(OUTPUT_DIR_PATH + 'invoices.csv')
+
+    get_recorder().write_report()
+    logger.info(f'Performance report: {PERFORMANCE_REPORT_PATH}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extracts every invoice in PDFs_DIR_PATH into invoices.csv.')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes (default: 1)')
+    parser.add_argument('--no-manifest', action='store_true', help='extract every file again, ignoring the manifest')
+    parser.add_argument('--engine', choices=ENGINES, default='docx', help='extraction engine (default: docx)')
+    parser.add_argument('--output-format', choices=SINK_FORMATS, default='csv', help='format of the intermediate part file (default: csv)')
+    parser.add_argument('--batch-size', type=int, default=100, help='number of invoices reconciled together (default: 100)')
+    parser.add_argument('--keep-near-duplicates', action='store_true', help='extract the near duplicates of other files too')
+    args = parser.parse_args()
+
+    main(workers=args.workers, use_manifest=not args.no_manifest, engine=args.engine, output_format=args.output_format,
+         batch_size=args.batch_size, skip_near_duplicates=not args.keep_near_duplicates)
@@ -0,0 +1,112 @@
+import os
+import pandas as pd
+from setup import GENERATED_FILES_DIR_PATH
+
+
+# Column layout of invoices.csv
+OUTPUT_COLUMNS = ['Product_code', 'Product_name', 'Size', 'Sqm', 'Unit_price', 'Total_price',
+                  'Invoice_number', 'Client', 'Date', 'Currency', 'Destination', 'FOB']
+SINK_FORMATS = ['csv', 'parquet']
+
+
+class InvoiceSink:
+    """
+    Streaming writer for the final invoices frame. Rows are appended to a part file as soon as an invoice is
+    reconciled, so memory use does not grow with the batch and no frame is ever copied. 'compact' then
+    produces the final CSV with the usual layout.
+
+    Usage:
+    with InvoiceSink('parquet') as sink:
+        sink.write(df_invoice)
+    sink.compact(OUTPUT_DIR_PATH + 'invoices.csv')
+    """
+
+    def __init__(self, file_format: str = 'csv', part_dir_path: str = GENERATED_FILES_DIR_PATH) -> None:
+        """
+        Prepares an empty part file.
+
+        Parameters:
+        file_format (str, optional): Format of the part file, one of 'SINK_FORMATS'. Default is 'csv'.
+        part_dir_path (str, optional): Directory of the part file. Default is 'GENERATED_FILES_DIR_PATH'.
+        """
+
+        if file_format not in SINK_FORMATS:
+            raise ValueError(f'Unknown sink format: {file_format}')
+
+        if not os.path.exists(part_dir_path):
+            os.makedirs(part_dir_path)
+
+        self.file_format = file_format
+        self.part_path = part_dir_path + 'invoices.part.' + file_format
+        self.rows = 0
+        self._writer = None
+
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+        if file_format == 'csv':
+            pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(self.part_path, index=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        Appends the rows of one invoice.
+
+        Parameters:
+        df (pd.DataFrame): The invoice rows. Missing output columns are left empty.
+        """
+
+        df = df.reindex(columns=OUTPUT_COLUMNS)
+
+        if self.file_format == 'csv':
+            df.to_csv(self.part_path, mode='a', header=False, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema([(column, pa.string()) for column in OUTPUT_COLUMNS])
+            table = pa.Table.from_pandas(df.astype('string'), schema=schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.part_path, schema)
+            self._writer.write_table(table)
+
+        self.rows += len(df)
+
+    def close(self) -> None:
+        """
+        Flushes the part file.
+        """
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def compact(self, output_path: str, batch_size: int = 65536) -> None:
+        """
+        Produces the final CSV from the part file, in bounded memory. A CSV part file is simply moved into place;
+        a Parquet one is converted batch by batch and kept.
+
+        Parameters:
+        output_path (str): Path of the final CSV file.
+        batch_size (int, optional): Number of rows converted at a time. Default is 65536.
+        """
+
+        self.close()
+
+        if self.file_format == 'csv':
+            os.replace(self.part_path, output_path)
+            return
+
+        import pyarrow.parquet as pq
+
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(output_path, index=False)
+        if not os.path.exists(self.part_path):
+            return
+
+        for batch in pq.ParquetFile(self.part_path).iter_batches(batch_size=batch_size):
+            batch.to_pandas().to_csv(output_path, mode='a', header=False, index=False)
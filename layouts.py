@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import hashlib
+from utils import KeywordTrie
+from setup import LAYOUTS_FILE_PATH
+
+
+class LayoutTemplate:
+    """
+    Declarative description of one invoice layout (a factory and/or language): how to recognize it and where
+    its fields are. All patterns are compiled once, when the template is created.
+
+    Attributes:
+    name (str): Unique name of the layout.
+    fingerprint (list[str]): Keywords that must all appear in the text of the PDF (lower case, without
+    whitespaces) for the layout to be chosen. An empty fingerprint never matches; such a layout is only used
+    as the fallback.
+    header_fields (dict): Keywords that start the table cell holding each header field, in order of preference.
+    start_strings (list[str]): Lines starting the product rows (lower case).
+    end_strings (list[str]): Lines ending the product rows (lower case).
+    product_code_pattern (str): Regex matched at the start of a product line; group 1 is the product code.
+    amount_keywords (list[str]): Keywords preceding the sub-total, fumigation and FOB amounts, in order of preference.
+    """
+
+    def __init__(self, name: str, fingerprint: list[str], header_fields: dict, start_strings: list[str],
+                 end_strings: list[str], product_code_pattern: str, amount_keywords: list[str]) -> None:
+        self.name = name
+        self.fingerprint = [''.join(keyword.split()).lower() for keyword in fingerprint]
+        self.header_fields = header_fields
+        self.start_strings = tuple(start_strings)
+        self.end_strings = tuple(end_strings)
+        self.product_code_pattern = product_code_pattern
+        self.amount_keywords = list(amount_keywords)
+
+        self.product_code_regex = re.compile(product_code_pattern)
+        self.header_trie = KeywordTrie()
+        for field, keywords in header_fields.items():
+            for rank, keyword in enumerate(keywords):
+                self.header_trie.add(keyword, (field, rank))
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'fingerprint': self.fingerprint,
+            'header_fields': self.header_fields,
+            'start_strings': list(self.start_strings),
+            'end_strings': list(self.end_strings),
+            'product_code_pattern': self.product_code_pattern,
+            'amount_keywords': self.amount_keywords,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, base=None):
+        """
+        Creates a template from its configuration.
+
+        Parameters:
+        data (dict): The template configuration, with the arguments of the constructor as keys.
+        base (LayoutTemplate or None): Template whose settings are used for the keys missing in 'data'.
+        Missing 'header_fields' are merged field by field.
+
+        Returns:
+        LayoutTemplate: The template.
+        """
+
+        settings = base.to_dict() if base is not None else {}
+        header_fields = dict(settings.get('header_fields', {}))
+        header_fields.update(data.get('header_fields', {}))
+        settings.update({key: value for key, value in data.items() if key != 'extends'})
+        settings['header_fields'] = header_fields
+
+        return cls(**settings)
+
+
+# Fields shared by every layout
+HEADER_FIELD_NAMES = ['invoice_number', 'issue_date', 'client_name', 'currency', 'destination_port',
+                      'sqm', 'unit_price', 'total_price']
+PRODUCT_CODE_PATTERN = r'^(\d{5}|990)'
+
+ENGLISH_LAYOUT = LayoutTemplate(
+    name='english',
+    fingerprint=['commercial invoice', 'payment conditions'],
+    header_fields={
+        'invoice_number': ['invoice number', 'invoice nr'],
+        'issue_date': ['issue date'],
+        'client_name': ['bill to'],
+        'currency': ['currency'],
+        'destination_port': ['destination port'],
+        'sqm': ['sqm', 'm2'],
+        'unit_price': ['unit.price'],
+        'total_price': ['total'],
+    },
+    start_strings=['description of goods'],
+    end_strings=['signature'],
+    product_code_pattern=PRODUCT_CODE_PATTERN,
+    amount_keywords=['sub-total amount', 'sub-total'],
+)
+
+SPANISH_LAYOUT = LayoutTemplate(
+    name='spanish',
+    fingerprint=['factura comercial', 'condiciones de pago'],
+    header_fields={
+        'invoice_number': ['invoice number', 'invoice nr'],
+        'issue_date': ['fecha'],
+        'client_name': ['importador'],
+        'currency': ['moneda'],
+        'destination_port': ['puerto de destino'],
+        'sqm': ['sqm', 'm2'],
+        'unit_price': ['precio un', 'prieco un'],
+        'total_price': ['total', 'importe'],
+    },
+    start_strings=['descripcion de las mercancias'],
+    end_strings=['visto'],
+    product_code_pattern=PRODUCT_CODE_PATTERN,
+    amount_keywords=['sub-total', 'valor sub-total'],
+)
+
+# Every keyword of every language, used when no single layout is recognized
+GENERIC_LAYOUT = LayoutTemplate(
+    name='generic',
+    fingerprint=[],
+    header_fields={
+        'invoice_number': ['invoice number', 'invoice nr'],
+        'issue_date': ['issue date', 'fecha'],
+        'client_name': ['bill to', 'importador'],
+        'currency': ['currency', 'moneda'],
+        'destination_port': ['destination port', 'puerto de destino'],
+        'sqm': ['sqm', 'm2'],
+        'unit_price': ['unit.price', 'precio un', 'prieco un'],
+        'total_price': ['total', 'importe'],
+    },
+    start_strings=['description of goods', 'descripcion de las mercancias'],
+    end_strings=['signature', 'visto'],
+    product_code_pattern=PRODUCT_CODE_PATTERN,
+    amount_keywords=['sub-total amount', 'sub-total', 'valor sub-total'],
+)
+
+
+class LayoutRegistry:
+    """
+    The known layouts, and the fingerprint step choosing one of them for each document.
+
+    Usage:
+    registry = get_layout_registry()
+    layout = registry.select(text_pdf)
+    """
+
+    def __init__(self, templates: list[LayoutTemplate] = (ENGLISH_LAYOUT, SPANISH_LAYOUT),
+                 fallback: LayoutTemplate = GENERIC_LAYOUT) -> None:
+        """
+        Parameters:
+        templates (list[LayoutTemplate], optional): The layouts. Default is the English and Spanish layouts.
+        fallback (LayoutTemplate, optional): Layout used when no single layout is recognized. Default is 'GENERIC_LAYOUT'.
+        """
+
+        self.fallback = fallback
+        self.templates = {}
+        self.config_hash = ''
+        for template in templates:
+            self.register(template)
+
+    def register(self, template: LayoutTemplate) -> None:
+        """
+        Adds a layout, replacing any layout with the same name.
+
+        Parameters:
+        template (LayoutTemplate): The layout.
+        """
+
+        missing = [field for field in HEADER_FIELD_NAMES if field not in template.header_fields]
+        if missing:
+            raise ValueError(f'Layout {template.name} has no keywords for {missing}')
+
+        self.templates[template.name] = template
+
+    def get(self, name: str) -> LayoutTemplate:
+        if name == self.fallback.name:
+            return self.fallback
+        return self.templates[name]
+
+    def load_json(self, file_path: str) -> None:
+        """
+        Registers the layouts of a JSON file: a list of template configurations (see 'LayoutTemplate.from_dict').
+        A configuration may name a registered layout in 'extends' to only override some of its settings.
+
+        Parameters:
+        file_path (str): The path of the JSON file.
+        """
+
+        with open(file_path, 'rb') as file:
+            content = file.read()
+
+        for data in json.loads(content):
+            base = self.get(data['extends']) if 'extends' in data else None
+            self.register(LayoutTemplate.from_dict(data, base))
+
+        self.config_hash = hashlib.sha256(self.config_hash.encode('utf-8') + content).hexdigest()[:16]
+
+    def select(self, text: str) -> LayoutTemplate:
+        """
+        Chooses the layout of a document: the one with the longest fingerprint whose keywords all appear in
+        the text. When no layout matches, or several equally specific ones do (e.g. a bilingual document),
+        the fallback layout is used.
+
+        Parameters:
+        text (str): The text of the PDF.
+
+        Returns:
+        LayoutTemplate: The chosen layout.
+        """
+
+        text = ''.join(text.split()).lower()
+
+        candidates = [template for template in self.templates.values()
+                      if template.fingerprint and all(keyword in text for keyword in template.fingerprint)]
+        if not candidates:
+            return self.fallback
+
+        best = max(len(template.fingerprint) for template in candidates)
+        candidates = [template for template in candidates if len(template.fingerprint) == best]
+
+        return candidates[0] if len(candidates) == 1 else self.fallback
+
+
+# Registry used by the invoices built in this process (created on first use)
+_registry = None
+
+
+def get_layout_registry() -> LayoutRegistry:
+    """
+    Returns the layout registry of this process: the built-in layouts plus the ones in 'LAYOUTS_FILE_PATH',
+    if that file exists.
+
+    Returns:
+    LayoutRegistry: The registry.
+    """
+
+    global _registry
+    if _registry is None:
+        _registry = LayoutRegistry()
+        if os.path.isfile(LAYOUTS_FILE_PATH):
+            _registry.load_json(LAYOUTS_FILE_PATH)
+
+    return _registry
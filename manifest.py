@@ -0,0 +1,105 @@
+import os
+import json
+from utils import file_hash
+from setup import GENERATED_FILES_DIR_PATH
+
+
+MANIFEST_PATH = GENERATED_FILES_DIR_PATH + 'manifest.json'
+
+
+class Manifest:
+    """
+    Persistent record of already extracted invoices, keyed by the SHA-256 of the PDF content.
+
+    Every entry stores the extractor and catalog versions it was produced with, the header fields, the raw
+    product rows and the rows matched against the catalog. An entry is reused as long as the extractor
+    version matches; a different catalog version only requires re-matching the raw rows against the new catalog.
+    File size and modification time are remembered too, so unchanged files are not hashed again.
+    """
+
+    def __init__(self, path: str = MANIFEST_PATH) -> None:
+        """
+        Loads the manifest from disk, starting empty if it does not exist yet.
+
+        Parameters:
+        path (str, optional): The path of the manifest JSON file.
+        """
+
+        self.path = path
+        self.files = {}
+        self.entries = {}
+        self._unsaved = 0
+
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            self.files = data.get('files', {})
+            self.entries = data.get('entries', {})
+
+    def hash_file(self, file_path: str) -> str:
+        """
+        Returns the content hash of a file, reusing the stored one when size and modification time did not change.
+
+        Parameters:
+        file_path (str): The path of the file.
+
+        Returns:
+        str: The hexadecimal SHA-256 digest.
+        """
+
+        stat = os.stat(file_path)
+        name = os.path.basename(file_path)
+        known = self.files.get(name)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime:
+            return known['hash']
+
+        digest = file_hash(file_path)
+        self.files[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': digest}
+        return digest
+
+    def get(self, content_hash: str, extractor_version: str) -> dict or None:
+        """
+        Looks up the entry of a PDF content.
+
+        Parameters:
+        content_hash (str): The SHA-256 of the PDF file.
+        extractor_version (str): The current extractor version.
+
+        Returns:
+        dict or None: The stored entry, or None if there is none for this extractor version.
+        """
+
+        entry = self.entries.get(content_hash)
+        if entry is None or entry['extractor_version'] != extractor_version:
+            return None
+        return entry
+
+    def put(self, content_hash: str, entry: dict, autosave_every: int = 50) -> None:
+        """
+        Stores an entry, saving the manifest every few new entries so an interrupted run keeps its progress.
+
+        Parameters:
+        content_hash (str): The SHA-256 of the PDF file.
+        entry (dict): The entry to store.
+        autosave_every (int, optional): Number of new entries between automatic saves. Default is 50.
+        """
+
+        self.entries[content_hash] = entry
+        self._unsaved += 1
+        if self._unsaved >= autosave_every:
+            self.save()
+
+    def save(self) -> None:
+        """
+        Writes the manifest to disk atomically.
+        """
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump({'files': self.files, 'entries': self.entries}, file)
+        os.replace(temp_path, self.path)
+        self._unsaved = 0
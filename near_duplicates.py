@@ -0,0 +1,302 @@
+import os
+import re
+import zlib
+import pickle
+import argparse
+import unicodedata
+import numpy as np
+import pandas as pd
+from text_extraction import iter_page_texts_from_pdf
+from layouts import get_layout_registry
+from utils import file_hash
+from setup import PDFs_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+FINGERPRINTS_PATH = GENERATED_FILES_DIR_PATH + 'fingerprints.pkl'
+NEAR_DUPLICATES_REPORT_PATH = GENERATED_FILES_DIR_PATH + 'near_duplicates.csv'
+
+SHINGLE_SIZE = 5        # words per shingle
+NUM_PERMUTATIONS = 128  # MinHash values per signature
+BANDS = 16              # LSH bands of NUM_PERMUTATIONS / BANDS values each
+THRESHOLD = 0.9         # estimated Jaccard similarity of two near-duplicate invoices
+
+# Prime just above 2 ** 32: with multipliers below 2 ** 31, 'a * x + b' never overflows 64 bits
+HASH_PRIME = (1 << 32) + 15
+WORD_PATTERN = re.compile(r'\w+')
+
+
+def normalize_text(text: str) -> list[str]:
+    """
+    Words of a text with accents removed and case folded, so rescans and re-exports of the same invoice compare
+    equal despite differences in spacing, line breaks, case or punctuation.
+
+    Parameters:
+    text (str): The text.
+
+    Returns:
+    list[str]: The words.
+    """
+
+    text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return WORD_PATTERN.findall(text.casefold())
+
+
+def invoice_number_from_text(text: str) -> str or None:
+    """
+    Reads the invoice number from the text of a PDF: the word following the first 'invoice_number' keyword of its
+    layout. Invoices printed from the same template differ in little more than their number, so two files with
+    different numbers are never near duplicates, however similar their text.
+
+    Parameters:
+    text (str): The text of the PDF.
+
+    Returns:
+    str or None: The invoice number (case folded), None if no keyword is found.
+    """
+
+    layout = get_layout_registry().select(text)
+    for keyword in layout.header_fields['invoice_number']:
+        pattern = r'\s*'.join(re.escape(word) for word in keyword.split()) + r'\W*(\w[\w/-]*)'
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            return match.group(1).casefold()
+
+    return None
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    32-bit hashes of the distinct word shingles (runs of 'size' consecutive words) of a text. A text shorter
+    than a shingle is a single shingle.
+
+    Parameters:
+    text (str): The text.
+    size (int, optional): Number of words per shingle. Default is 'SHINGLE_SIZE'.
+
+    Returns:
+    np.ndarray: The hashes (uint64), empty for a text without words.
+    """
+
+    words = normalize_text(text)
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+
+    shingles = {' '.join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+
+
+class MinHasher:
+    """
+    MinHash signatures: for each of 'num_permutations' random hash functions 'h(x) = (a * x + b) mod p', the
+    minimum over the shingles of a text. The fraction of positions where two signatures agree estimates the
+    Jaccard similarity of the two sets of shingles.
+    """
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, shingle_size: int = SHINGLE_SIZE, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 31, num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_permutations, dtype=np.uint64)
+        self.shingle_size = shingle_size
+        # Signatures computed with other settings are not comparable
+        self.version = f'{num_permutations}-{shingle_size}-{seed}'
+
+    def signature(self, text: str) -> np.ndarray or None:
+        """
+        Computes the signature of a text, with one vectorized pass over its shingles.
+
+        Parameters:
+        text (str): The text.
+
+        Returns:
+        np.ndarray or None: The signature (uint64), None for a text without words (e.g. a scan without a text
+        layer), which cannot be compared.
+        """
+
+        hashes = shingle_hashes(text, self.shingle_size)
+        if hashes.size == 0:
+            return None
+
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % HASH_PRIME).min(axis=1)
+
+
+def _find(parents: list[int], i: int) -> int:
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+
+def group_near_duplicates(signatures: np.ndarray, threshold: float = THRESHOLD, bands: int = BANDS,
+                          labels: list or None = None) -> list[list[int]]:
+    """
+    Groups the near-duplicate signatures with locality-sensitive hashing, in roughly linear time instead of
+    comparing every pair. Each signature is cut into 'bands' bands, and signatures sharing a band fall in the same
+    bucket. Within a bucket, each signature joins the group of an earlier member when its estimated similarity
+    with the first signature of that group (the one kept) reaches 'threshold'. Groups are merged with a union-find
+    whose roots keep the label of their group, so a group never holds two different labels, even through
+    unlabeled signatures similar to both.
+
+    Parameters:
+    signatures (np.ndarray): One signature per row.
+    threshold (float, optional): Minimum estimated Jaccard similarity. Default is 'THRESHOLD'.
+    bands (int, optional): Number of bands; the number of values per signature must be a multiple of it.
+    Default is 'BANDS'.
+    labels (list or None, optional): A label per signature (e.g. the invoice number); signatures whose labels
+    are both known (not None) and different are never grouped. Default is no labels.
+
+    Returns:
+    list[list[int]]: The row numbers of every group of two or more signatures, each group sorted.
+    """
+
+    count, length = signatures.shape
+    if length % bands:
+        raise ValueError(f'{length} values per signature cannot be cut into {bands} bands')
+    rows = length // bands
+
+    parents = list(range(count))
+    # Known label of the group of every root
+    group_labels = [None] * count if labels is None else [None if pd.isna(label) else label for label in labels]
+
+    for band in range(bands):
+        values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        keys = values.view(np.dtype((np.void, values.dtype.itemsize * rows))).ravel()
+        _, buckets = np.unique(keys, return_inverse=True)
+
+        # Buckets of two or more signatures, members in row order
+        order = np.argsort(buckets, kind='stable')
+        starts = np.flatnonzero(np.r_[True, buckets[order][1:] != buckets[order][:-1]])
+        for members in np.split(order, starts[1:]):
+            if len(members) < 2:
+                continue
+
+            # Roots met in the bucket, by label: a labeled signature is only compared with the groups of its label
+            # and the unlabeled ones
+            roots = {}
+            for i in members.tolist():
+                root_i = _find(parents, i)
+                label_i = group_labels[root_i]
+                candidates = roots.get(label_i, []) + roots.get(None, []) if label_i is not None else \
+                    [root for label_roots in roots.values() for root in label_roots]
+                for root in candidates:
+                    root = _find(parents, root)
+                    if root == root_i:
+                        break
+                    label = group_labels[root]
+                    if label is not None and label_i is not None and label != label_i:
+                        continue
+                    if (signatures[root] == signatures[i]).mean() >= threshold:
+                        parent, child = min(root, root_i), max(root, root_i)
+                        parents[child] = parent
+                        group_labels[parent] = label if label is not None else label_i
+                        break
+                else:
+                    roots.setdefault(label_i, []).append(root_i)
+
+    groups = {}
+    for i in range(count):
+        groups.setdefault(_find(parents, i), []).append(i)
+
+    return [members for members in groups.values() if len(members) > 1]
+
+
+def _load_fingerprints(path: str, version: str) -> dict:
+    """
+    Signatures and invoice numbers computed by earlier runs, keyed by the content hash of the PDF; empty if the
+    MinHash settings or the layouts changed.
+    """
+
+    if os.path.isfile(path):
+        with open(path, 'rb') as file:
+            data = pickle.load(file)
+        if data.get('version') == version:
+            return data['signatures']
+
+    return {}
+
+
+def _save_fingerprints(path: str, version: str, signatures: dict) -> None:
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        pickle.dump({'version': version, 'signatures': signatures}, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+def find_near_duplicates(file_names: list[str], directory_path: str = PDFs_DIR_PATH, threshold: float = THRESHOLD,
+                         hasher: MinHasher or None = None, hash_file=file_hash,
+                         fingerprints_path: str = FINGERPRINTS_PATH) -> list[list[str]]:
+    """
+    Finds the groups of near-duplicate PDFs (renamed copies, rescans, re-exports with slightly different text)
+    from their text layer, which is much cheaper to read than a full extraction. Files with different invoice
+    numbers are never grouped. Signatures are cached by content hash, so only new or changed files are read.
+
+    Parameters:
+    file_names (list[str]): Names of the files (without extension).
+    directory_path (str, optional): The directory of the PDFs. Default is 'PDFs_DIR_PATH'.
+    threshold (float, optional): Minimum estimated Jaccard similarity of near duplicates. Default is 'THRESHOLD'.
+    hasher (MinHasher or None, optional): The signature settings. Default is a 'MinHasher' with default settings.
+    hash_file (callable, optional): Returns the content hash of a file path (e.g. 'Manifest.hash_file', which
+    remembers the hashes of unchanged files). Default is 'file_hash'.
+    fingerprints_path (str, optional): The path of the signature cache. Default is 'FINGERPRINTS_PATH'.
+
+    Returns:
+    list[list[str]]: Every group of near duplicates, in the order of 'file_names' (so the first file is the one kept).
+    """
+
+    hasher = hasher or MinHasher()
+    version = f'{hasher.version}-{get_layout_registry().config_hash}'
+    cached = _load_fingerprints(fingerprints_path, version)
+
+    signatures = {}
+    names, rows, numbers = [], [], []
+    for file_name in file_names:
+        file_path = os.path.join(directory_path, file_name + '.pdf')
+        try:
+            content_hash = hash_file(file_path)
+            if content_hash not in cached:
+                text = '\n'.join(iter_page_texts_from_pdf(file_path))
+                cached[content_hash] = (hasher.signature(text), invoice_number_from_text(text))
+        except Exception as e:
+            print(f'Fingerprint failed: {file_name} - {type(e).__name__}: {str(e)}')
+            continue
+
+        signatures[content_hash] = cached[content_hash]
+        signature, invoice_number = cached[content_hash]
+        if signature is not None:
+            names.append(file_name)
+            rows.append(signature)
+            numbers.append(invoice_number)
+
+    _save_fingerprints(fingerprints_path, version, signatures)
+    if len(names) < 2:
+        return []
+
+    groups = group_near_duplicates(np.vstack(rows), threshold, labels=numbers)
+    return [[names[i] for i in group] for group in groups]
+
+
+def write_report(groups: list[list[str]], path: str = NEAR_DUPLICATES_REPORT_PATH) -> None:
+    """
+    Writes the near-duplicate groups to a CSV file: one row per duplicate, with the file kept for it.
+
+    Parameters:
+    groups (list[list[str]]): The groups returned by 'find_near_duplicates'.
+    path (str, optional): The path of the CSV file. Default is 'NEAR_DUPLICATES_REPORT_PATH'.
+    """
+
+    rows = [{'file': file_name, 'kept_file': group[0]} for group in groups for file_name in group[1:]]
+    pd.DataFrame(rows, columns=['file', 'kept_file']).to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Finds near-duplicate invoices in PDFs_DIR_PATH.')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help=f'minimum estimated similarity (default: {THRESHOLD})')
+    args = parser.parse_args()
+
+    files = sorted(os.path.splitext(f)[0] for f in os.listdir(PDFs_DIR_PATH) if f.lower().endswith('.pdf'))
+    groups = find_near_duplicates(files, threshold=args.threshold)
+    write_report(groups)
+    print(f'{sum(len(group) - 1 for group in groups)} near duplicates in {len(groups)} groups: {NEAR_DUPLICATES_REPORT_PATH}')
@@ -0,0 +1,211 @@
+import os
+import time
+import sqlite3
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from text_extraction import iter_page_texts_from_pdf
+from utils import file_hash
+from setup import PDFs_DIR_PATH, GENERATED_FILES_DIR_PATH
+
+
+PAGE_INDEX_PATH = GENERATED_FILES_DIR_PATH + 'page_index.sqlite'
+
+
+def _extract_pages(file_path: str) -> tuple:
+    """
+    Extracts the text of every page of a PDF inside a worker process.
+
+    Parameters:
+    file_path (str): The path of the PDF file.
+
+    Returns:
+    tuple: (list of page texts, error message or None).
+    """
+
+    try:
+        return list(iter_page_texts_from_pdf(file_path)), None
+    except Exception as e:
+        return [], f'{type(e).__name__}: {str(e)}'
+
+
+class PageIndex:
+    """
+    Local SQLite FTS5 full-text index of the page texts of the PDF corpus. It is updated incrementally:
+    only files whose content changed are read again. Page numbers are 0-based, as in the triage results.
+
+    Usage:
+    with PageIndex() as index:
+        index.update()
+        matches = index.search('acme')
+    """
+
+    def __init__(self, path: str = PAGE_INDEX_PATH) -> None:
+        """
+        Opens the index, creating it if it does not exist yet.
+
+        Parameters:
+        path (str, optional): The path of the SQLite database. Default is 'PAGE_INDEX_PATH'.
+        """
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.connection = sqlite3.connect(path)
+        has_page_rows = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'page_rows'").fetchone() is not None
+        # 'page_rows' maps the rowids of the pages to their file: the 'file' column of an FTS5 table cannot be
+        # indexed, so deleting the pages of a file by it would scan the whole table
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime REAL,
+                hash TEXT,
+                pages INTEGER,
+                error TEXT
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+                file UNINDEXED,
+                page UNINDEXED,
+                text,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+            CREATE TABLE IF NOT EXISTS page_rows (
+                rowid INTEGER PRIMARY KEY,
+                file TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_page_rows_file ON page_rows (file);
+        ''')
+        if not has_page_rows:
+            # Index created before 'page_rows' existed
+            with self.connection:
+                self.connection.execute('INSERT INTO page_rows (rowid, file) SELECT rowid, file FROM pages')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _delete_pages(self, filename: str) -> None:
+        self.connection.execute('DELETE FROM pages WHERE rowid IN (SELECT rowid FROM page_rows WHERE file = ?)', (filename,))
+        self.connection.execute('DELETE FROM page_rows WHERE file = ?', (filename,))
+
+    def update(self, directory_path: str = PDFs_DIR_PATH, workers: int = 4) -> dict:
+        """
+        Brings the index up to date with a directory. Files with unchanged size and modification time are skipped,
+        files whose content hash did not change only get their size and modification time refreshed, and
+        files that disappeared are removed from the index.
+
+        Parameters:
+        directory_path (str, optional): The path of the directory. Default is 'PDFs_DIR_PATH'.
+        workers (int, optional): Number of worker processes extracting page texts. Default is 4.
+
+        Returns:
+        dict: Number of files added or changed, unchanged and removed.
+        """
+
+        known = {row[0]: row[1:] for row in self.connection.execute('SELECT file, size, mtime, hash FROM files')}
+
+        present = set()
+        to_index = []
+        unchanged = 0
+        for filename in sorted(os.listdir(directory_path)):
+            filepath = os.path.join(directory_path, filename)
+            if not (os.path.isfile(filepath) and filename.lower().endswith('.pdf')):
+                continue
+
+            present.add(filename)
+            stat = os.stat(filepath)
+            if filename in known and known[filename][:2] == (stat.st_size, stat.st_mtime):
+                unchanged += 1
+                continue
+
+            digest = file_hash(filepath)
+            if filename in known and known[filename][2] == digest:
+                self.connection.execute('UPDATE files SET size = ?, mtime = ? WHERE file = ?',
+                                        (stat.st_size, stat.st_mtime, filename))
+                unchanged += 1
+                continue
+
+            to_index.append((filename, filepath, stat, digest))
+
+        removed = [filename for filename in known if filename not in present]
+        with self.connection:
+            for filename in removed:
+                self._delete_pages(filename)
+                self.connection.execute('DELETE FROM files WHERE file = ?', (filename,))
+
+        filepaths = [filepath for _, filepath, _, _ in to_index]
+        with ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext() as executor:
+            extracted = executor.map(_extract_pages, filepaths, chunksize=8) if executor else map(_extract_pages, filepaths)
+
+            for i, ((filename, _, stat, digest), (texts, error)) in enumerate(zip(to_index, extracted)):
+                # Without size, modification time and hash, a file that could not be read is read again on the next update
+                size, mtime, digest = (None, None, None) if error else (stat.st_size, stat.st_mtime, digest)
+                with self.connection:
+                    self._delete_pages(filename)
+                    for page, text in enumerate(texts):
+                        rowid = self.connection.execute('INSERT INTO page_rows (file) VALUES (?)', (filename,)).lastrowid
+                        self.connection.execute('INSERT INTO pages (rowid, file, page, text) VALUES (?, ?, ?, ?)',
+                                                (rowid, filename, page, text))
+                    self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                            (filename, size, mtime, digest, len(texts), error))
+                print(f'[{i + 1}/{len(to_index)}] - {filename} ' + (f'failed: {error}' if error else 'indexed'))
+
+        return {'indexed': len(to_index), 'unchanged': unchanged, 'removed': len(removed)}
+
+    def search(self, query: str, limit: int = 20, phrase: bool = False) -> list[dict]:
+        """
+        Finds the pages matching a full-text query, best matches first. Matching ignores case and accents.
+
+        Parameters:
+        query (str): An FTS5 query, e.g. 'acme', 'santos AND fob' or 'facturacomercial*'.
+        limit (int, optional): Maximum number of matches. Default is 20.
+        phrase (bool, optional): Whether to search 'query' as one literal phrase instead. Default is False.
+
+        Returns:
+        list[dict]: The file, page and a snippet of the text around the match, for each matching page.
+        """
+
+        if phrase:
+            query = '"' + query.replace('"', '""') + '"'
+
+        rows = self.connection.execute('''
+            SELECT file, page, snippet(pages, 2, '[', ']', '...', 12)
+            FROM pages
+            WHERE pages MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (query, limit))
+
+        return [{'file': file, 'page': page, 'snippet': snippet} for file, page, snippet in rows]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Full-text index of the page texts in PDFs_DIR_PATH.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = subparsers.add_parser('update', help='index new and changed PDFs')
+    update_parser.add_argument('--workers', type=int, default=4, help='number of worker processes (default: 4)')
+
+    search_parser = subparsers.add_parser('search', help='find the pages matching a query')
+    search_parser.add_argument('query', help='FTS5 query, e.g. "acme" or "santos AND fob"')
+    search_parser.add_argument('--limit', type=int, default=20, help='maximum number of matches (default: 20)')
+    search_parser.add_argument('--phrase', action='store_true', help='search the query as one literal phrase')
+    args = parser.parse_args()
+
+    with PageIndex() as index:
+        if args.command == 'update':
+            print(index.update(workers=args.workers))
+        else:
+            start = time.perf_counter()
+            matches = index.search(args.query, limit=args.limit, phrase=args.phrase)
+            for match in matches:
+                print(f"{match['file']} - page {match['page']}: {' '.join(match['snippet'].split())}")
+            print(f'{len(matches)} matches in {(time.perf_counter() - start) * 1000:.1f} ms')
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from columnar_store import REVISED_INVOICES_PATH
+from customers import CUSTOMER_REGISTRY_PATH, DIR_PATH as INVOICES_DIR_PATH, FILE_NAME as INVOICES_FILE_NAME
+from insert_into_db import CATALOG_PATH
+from post_processing import INPUT_PATH as REVISED_EXCEL_PATH
+from reorder_suggestion import REORDER_SUGGESTIONS_PATH
+from utils import file_hash
+from setup import SOURCE_DIR, PDFs_DIR_PATH, CATALOGS_DIR_PATH, LAYOUTS_FILE_PATH, GENERATED_FILES_DIR_PATH, \
+    OUTPUT_DIR_PATH, DATABASE_URL
+
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_STATE_PATH = GENERATED_FILES_DIR_PATH + 'pipeline_state.json'
+PIPELINE_LOGS_DIR = GENERATED_FILES_DIR_PATH + 'pipeline_logs/'
+
+# Relative paths of the scripts (e.g. 'Catalogs/catalog_ready-2_0.xlsx') are relative to the project directory
+WORKING_DIR = OUTPUT_DIR_PATH
+
+# Outcomes of a stage in a run
+DONE, SKIPPED, FAILED, BLOCKED = 'done', 'skipped', 'failed', 'blocked'
+
+
+class Stage:
+    """
+    A step of the pipeline: a script run in its own process, with the files and directories it reads and writes.
+    A stage depends on the earlier stages writing any of its inputs; a path that is both an input and an output
+    (e.g. the customer registry, which is appended to) chains the stages writing it, so they never run at the
+    same time.
+    """
+
+    def __init__(self, name: str, script: str, inputs: list[str], outputs: list[str], args: list[str] or None = None,
+                 settings: dict or None = None) -> None:
+        """
+        Parameters:
+        name (str): The name of the stage.
+        script (str): The file name of the script, in 'SCRIPTS_DIR'.
+        inputs (list[str]): The files and directories read (relative paths are relative to 'WORKING_DIR').
+        outputs (list[str]): The files and directories written.
+        args (list[str] or None, optional): The command-line arguments of the script. Default is None.
+        settings (dict or None, optional): Other values the result depends on (e.g. the database URL); only their
+        hash is stored. Default is None.
+        """
+
+        self.name = name
+        self.script = script
+        self.inputs = [os.path.join(WORKING_DIR, path) for path in inputs]
+        self.outputs = [os.path.join(WORKING_DIR, path) for path in outputs]
+        self.args = args or []
+        self.settings = settings or {}
+
+    def command(self) -> list[str]:
+        return [sys.executable, os.path.join(SCRIPTS_DIR, self.script)] + self.args
+
+
+# The stages, in an order compatible with their dependencies
+STAGES = [
+    Stage('collect', 'collect_and_preprocess.py', inputs=[SOURCE_DIR], outputs=[PDFs_DIR_PATH]),
+    Stage('extract', 'invoice_processing.py', inputs=[PDFs_DIR_PATH, CATALOGS_DIR_PATH, LAYOUTS_FILE_PATH],
+          outputs=[INVOICES_DIR_PATH + INVOICES_FILE_NAME]),
+    Stage('customers', 'customers.py', inputs=[INVOICES_DIR_PATH + INVOICES_FILE_NAME, CUSTOMER_REGISTRY_PATH],
+          outputs=[CUSTOMER_REGISTRY_PATH, INVOICES_DIR_PATH + 'customers.csv']),
+    # Reads the invoices revised by hand, so it does not wait for the extraction
+    Stage('post_processing', 'post_processing.py', inputs=[REVISED_EXCEL_PATH], outputs=[REVISED_INVOICES_PATH]),
+    Stage('load', 'insert_into_db.py', inputs=[REVISED_INVOICES_PATH, CATALOG_PATH, CUSTOMER_REGISTRY_PATH],
+          outputs=[CUSTOMER_REGISTRY_PATH], settings={'database_url': DATABASE_URL}),
+    Stage('reorder', 'reorder_suggestion.py', inputs=[REVISED_INVOICES_PATH, CUSTOMER_REGISTRY_PATH],
+          outputs=[REORDER_SUGGESTIONS_PATH, CUSTOMER_REGISTRY_PATH]),
+]
+
+
+def path_fingerprint(path: str) -> str or None:
+    """
+    Fingerprint of a file or directory: the content hash of a file; for a directory, a hash of the relative path,
+    size and modification time of every file below it, so large directories of PDFs are not read.
+
+    Parameters:
+    path (str): The path.
+
+    Returns:
+    str or None: The fingerprint, None if the path does not exist.
+    """
+
+    if os.path.isfile(path):
+        return file_hash(path)
+    if not os.path.isdir(path):
+        return None
+
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            digest.update(f'{os.path.relpath(file_path, path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n'.encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def input_fingerprints(stage: Stage) -> dict:
+    """
+    Fingerprints of the inputs of a stage, with an entry for its script and its settings, whose changes also make
+    the stage run again.
+    """
+
+    fingerprints = {path: path_fingerprint(path) for path in stage.inputs}
+    fingerprints['script'] = file_hash(os.path.join(SCRIPTS_DIR, stage.script))
+    fingerprints['settings'] = hashlib.sha256(json.dumps([stage.args, stage.settings], sort_keys=True)
+                                              .encode('utf-8')).hexdigest()
+
+    return fingerprints
+
+
+def stage_dependencies(stages: list[Stage]) -> dict:
+    """
+    The dependencies of every stage: the earlier stages writing any of its inputs.
+
+    Parameters:
+    stages (list[Stage]): The stages, in an order compatible with their dependencies.
+
+    Returns:
+    dict: The names of the stages each stage depends on, by stage name.
+    """
+
+    dependencies = {}
+    for i, stage in enumerate(stages):
+        dependencies[stage.name] = [earlier.name for earlier in stages[:i]
+                                    if set(earlier.outputs) & set(stage.inputs)]
+
+    return dependencies
+
+
+def _load_state(path: str) -> dict:
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    return {'stages': {}}
+
+
+def _save_state(path: str, state: dict) -> None:
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=1)
+    os.replace(temp_path, path)
+
+
+def is_up_to_date(stage: Stage, record: dict or None) -> bool:
+    """
+    Whether a stage can be skipped: its last run succeeded and neither its inputs, script and settings nor its
+    outputs changed since.
+
+    Parameters:
+    stage (Stage): The stage.
+    record (dict or None): The record of its last run in the pipeline state.
+
+    Returns:
+    bool: True if the stage is up to date.
+    """
+
+    if not record or record.get('status') != DONE:
+        return False
+
+    return (record.get('inputs') == input_fingerprints(stage)
+            and record.get('outputs') == {path: path_fingerprint(path) for path in stage.outputs})
+
+
+def _run_stage(stage: Stage, logs_dir: str) -> tuple[int, float, str]:
+    """
+    Runs the script of a stage in its own process, with its output written to a log file.
+
+    Returns:
+    tuple[int, float, str]: The exit code, the duration in seconds and the path of the log file.
+    """
+
+    if not os.path.exists(logs_dir):
+        os.makedirs(logs_dir)
+    log_path = os.path.join(logs_dir, stage.name + '.log')
+
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        process = subprocess.run(stage.command(), cwd=WORKING_DIR, stdout=log, stderr=subprocess.STDOUT)
+
+    return process.returncode, time.perf_counter() - start, log_path
+
+
+def run_pipeline(stages: list[Stage] = STAGES, selected: list[str] or None = None, force: bool = False,
+                 workers: int = 2, dry_run: bool = False, state_path: str = PIPELINE_STATE_PATH,
+                 logs_dir: str = PIPELINE_LOGS_DIR) -> dict:
+    """
+    Runs the stages as a dependency graph. A stage starts as soon as the stages it depends on are done, so
+    independent stages run at the same time, in separate processes. Stages whose last run succeeded and whose
+    inputs, script, settings and outputs did not change are skipped, so a run that failed partway resumes from
+    the failed stage. The stages depending on a failed stage are not run.
+
+    Parameters:
+    stages (list[Stage], optional): The stages, in an order compatible with their dependencies. Default is 'STAGES'.
+    selected (list[str] or None, optional): The names of the stages to run; the others are considered done.
+    Default is every stage.
+    force (bool, optional): Whether to run the selected stages even if they are up to date. Default is False.
+    workers (int, optional): Maximum number of stages running at the same time. Default is 2.
+    dry_run (bool, optional): Whether to only print which stages would run. Default is False.
+    state_path (str, optional): The path of the JSON file recording the runs. Default is 'PIPELINE_STATE_PATH'.
+    logs_dir (str, optional): The directory of the stage logs. Default is 'PIPELINE_LOGS_DIR'.
+
+    Returns:
+    dict: The outcome of every selected stage ('done', 'skipped', 'failed' or 'blocked'), by stage name.
+    """
+
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in selected or [] if name not in by_name]
+    if unknown:
+        raise ValueError(f'Unknown stages: {unknown} (stages: {list(by_name)})')
+
+    selected = set(selected or by_name)
+    dependencies = {name: [dependency for dependency in names if dependency in selected]
+                    for name, names in stage_dependencies(stages).items()}
+    state = _load_state(state_path)
+    records = state['stages']
+
+    outcomes = {}
+    pending = [stage for stage in stages if stage.name in selected]
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while pending or running:
+            for stage in list(pending):
+                outcomes_before = [outcomes.get(dependency) for dependency in dependencies[stage.name]]
+                if any(outcome in (FAILED, BLOCKED) for outcome in outcomes_before):
+                    pending.remove(stage)
+                    outcomes[stage.name] = BLOCKED
+                    print(f'[{stage.name}] blocked by a failed stage')
+                    continue
+                if not all(outcome in (DONE, SKIPPED) for outcome in outcomes_before):
+                    continue
+
+                pending.remove(stage)
+                if not force and is_up_to_date(stage, records.get(stage.name)):
+                    outcomes[stage.name] = SKIPPED
+                    print(f'[{stage.name}] skipped (up to date)')
+                elif dry_run:
+                    outcomes[stage.name] = DONE
+                    print(f'[{stage.name}] would run: {" ".join(stage.command())}')
+                else:
+                    print(f'[{stage.name}] started')
+                    inputs = input_fingerprints(stage)
+                    running[executor.submit(_run_stage, stage, logs_dir)] = (stage, inputs)
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, inputs = running.pop(future)
+                try:
+                    return_code, seconds, log_path = future.result()
+                except Exception as e:
+                    return_code, seconds, log_path = None, 0.0, None
+                    print(f'[{stage.name}] could not be started - {type(e).__name__}: {str(e)}')
+
+                record = {'status': DONE if return_code == 0 else FAILED, 'return_code': return_code,
+                          'seconds': round(seconds, 3), 'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                          'log': log_path}
+                if return_code == 0:
+                    outputs = {path: path_fingerprint(path) for path in stage.outputs}
+                    # Paths the stage writes as well as reads are recorded as it left them
+                    inputs.update({path: outputs[path] for path in inputs if path in outputs})
+                    record['inputs'] = inputs
+                    record['outputs'] = outputs
+                    print(f'[{stage.name}] done in {seconds:.1f} s')
+                else:
+                    print(f'[{stage.name}] failed (exit code {return_code}), see {log_path}')
+
+                outcomes[stage.name] = record['status']
+                records[stage.name] = record
+                _save_state(state_path, state)
+
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Runs the Orbis pipeline, skipping the stages that are up to date.')
+    parser.add_argument('stages', nargs='*', help=f'stages to run (default: all of them): {", ".join(s.name for s in STAGES)}')
+    parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+    parser.add_argument('--workers', type=int, default=2, help='maximum number of stages running at the same time (default: 2)')
+    parser.add_argument('--dry-run', action='store_true', help='only print which stages would run')
+    args = parser.parse_args()
+
+    outcomes = run_pipeline(selected=args.stages or None, force=args.force, workers=args.workers, dry_run=args.dry_run)
+    sys.exit(1 if any(outcome in (FAILED, BLOCKED) for outcome in outcomes.values()) else 0)
@@ -1,49 +1,117 @@
-import pandas as pd
-
-
-def convert_foreign_date(date, month_dict):
-    if isinstance(date, str):
-        for month_abbr, replacement in month_dict.items():
-            if month_abbr in date:
-                date = date.replace(month_abbr, replacement)
-                break
-        return pd.to_datetime(date, format='%d-%b-%y', errors='coerce')
-    else:
-        return date
-    
-def convert_amount_to_float(amount):
-    try:
-        amount = amount.replace('.', '').replace(',', '.')
-        return round(float(amount), 2)
-    except:
-        return round(amount, 2)
-
-def filter_consecutive_invoices(df):
-    df['Invoice_Change'] = df['Invoice_number'] != df['Invoice_number'].shift(1)
-    df['Group'] = df['Invoice_Change'].cumsum()
-    group_counts = df.groupby(['Invoice_number', 'Group']).size()
-    max_groups = group_counts.reset_index().groupby('Invoice_number')[0].idxmax()
-    valid_groups = group_counts.iloc[max_groups].index.get_level_values('Group')
-
-    return df[df['Group'].isin(valid_groups)].drop(columns=['Invoice_Change', 'Group'])
-
-
-df_original = pd.read_excel('generated_files/invoices_revised.xlsx')
-df = df_original.copy()
-
-spanish_to_english_months = {
-    'Ene': 'Jan', 'Feb': 'Feb', 'Mar': 'Mar', 'Abr': 'Apr', 'May': 'May', 'Jun': 'Jun',
-    'Jul': 'Jul', 'Ago': 'Aug', 'Sep': 'Sep', 'Oct': 'Oct', 'Nov': 'Nov', 'Dic': 'Dec'
-}
-
-df['Date'] = df['Date'].apply(lambda x: convert_foreign_date(x, spanish_to_english_months))
-df['Sqm'] = df['Sqm'].apply(convert_amount_to_float)
-df['Unit_price'] = df['Unit_price'].apply(convert_amount_to_float)
-df['Total_price'] = df['Total_price'].apply(convert_amount_to_float)
-df['FOB'] = df['FOB'].apply(convert_amount_to_float)
-df['Size'] = df['Size'].apply(lambda x: x.lower() if isinstance(x, str) else x)
-
-filtered_df = filter_consecutive_invoices(df)
-
-filtered_df.to_excel('generated_files/invoices_revised-2_0.xlsx', index=False)
-
+import re
+import argparse
+import pandas as pd
+from utils import to_decimal_amounts
+from columnar_store import REVISED_INVOICES_PATH, REVISED_INVOICES_EXCEL_PATH, write_table, export_excel
+
+
+# Invoices revised by hand, exported from invoices.csv
+INPUT_PATH = 'generated_files/invoices_revised.xlsx'
+AMOUNT_COLUMNS = ['Sqm', 'Unit_price', 'Total_price', 'FOB']
+
+
+# Spanish and English month names, translated to the English abbreviations understood by '%b'
+MONTH_TRANSLATIONS = {
+    'enero': 'Jan', 'ene': 'Jan', 'january': 'Jan',
+    'febrero': 'Feb', 'february': 'Feb',
+    'marzo': 'Mar', 'march': 'Mar',
+    'abril': 'Apr', 'abr': 'Apr', 'april': 'Apr',
+    'mayo': 'May',
+    'junio': 'Jun', 'june': 'Jun',
+    'julio': 'Jul', 'july': 'Jul',
+    'agosto': 'Aug', 'ago': 'Aug', 'august': 'Aug',
+    'septiembre': 'Sep', 'setiembre': 'Sep', 'sept': 'Sep', 'september': 'Sep',
+    'octubre': 'Oct', 'october': 'Oct',
+    'noviembre': 'Nov', 'november': 'Nov',
+    'diciembre': 'Dec', 'dic': 'Dec', 'december': 'Dec',
+}
+# Longest names first, so 'enero' is not translated as 'ene' + 'ro'
+MONTH_PATTERN = re.compile('|'.join(sorted(MONTH_TRANSLATIONS, key=len, reverse=True)), re.IGNORECASE)
+
+# Formats tried in order, after the month names were translated
+DATE_FORMATS = ['%d-%b-%y', '%d-%b-%Y', '%d %b %Y', '%d de %b de %Y', '%b %d, %Y',
+                '%d/%m/%Y', '%d/%m/%y', '%d.%m.%Y', '%d-%m-%Y', '%Y-%m-%d']
+
+
+def normalize_dates(dates: pd.Series, formats: list[str] = DATE_FORMATS) -> tuple[pd.Series, list]:
+    """
+    Converts a column of raw invoice dates (e.g. '12-Ene-23', '12-Jan-23', '12/01/2023') to datetimes.
+    Each distinct raw string is parsed only once: month names are translated with one precompiled pattern,
+    then each format is tried with a single vectorized 'pd.to_datetime' call over the strings still unparsed,
+    and the results are mapped back onto the column. Values that are not strings (e.g. dates already read
+    as datetimes) are kept as they are.
+
+    Parameters:
+    dates (pd.Series): The raw dates.
+    formats (list[str], optional): The formats to try, in order. Default is 'DATE_FORMATS'.
+
+    Returns:
+    tuple[pd.Series, list]: The datetimes, and the raw strings that no format could parse (NaT in the result).
+    """
+
+    is_text = dates.map(lambda value: isinstance(value, str))
+    raw = pd.Series(dates[is_text].unique(), dtype=object)
+
+    translated = raw.str.strip().str.replace(MONTH_PATTERN, lambda match: MONTH_TRANSLATIONS[match.group(0).lower()], regex=True)
+    parsed = pd.Series(pd.NaT, index=raw.index, dtype='datetime64[ns]')
+    for date_format in formats:
+        pending = parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(translated[pending], format=date_format, errors='coerce')
+
+    lookup = pd.Series(parsed.values, index=raw.values)
+    normalized = pd.to_datetime(dates.where(~is_text), errors='coerce')
+    normalized[is_text] = dates[is_text].map(lookup)
+
+    unparseable = raw[parsed.isna()].tolist()
+    return normalized, unparseable
+
+
+def filter_consecutive_invoices(df):
+    df['Invoice_Change'] = df['Invoice_number'] != df['Invoice_number'].shift(1)
+    df['Group'] = df['Invoice_Change'].cumsum()
+    group_counts = df.groupby(['Invoice_number', 'Group']).size()
+    max_groups = group_counts.reset_index().groupby('Invoice_number')[0].idxmax()
+    valid_groups = group_counts.iloc[max_groups].index.get_level_values('Group')
+
+    return df[df['Group'].isin(valid_groups)].drop(columns=['Invoice_Change', 'Group'])
+
+
+def main(input_path: str = INPUT_PATH, output_path: str = REVISED_INVOICES_PATH, excel_path: str or None = None) -> None:
+    """
+    Cleans the revised invoices (dates, amounts, sizes, repeated invoice rows) and writes them to the typed
+    columnar store read by insert_into_db.py and reorder_suggestion.py.
+
+    Parameters:
+    input_path (str): The path of the revised invoices. Default is 'INPUT_PATH'.
+    output_path (str): The path of the Parquet file written. Default is 'REVISED_INVOICES_PATH'.
+    excel_path (str or None): The path of an Excel copy for review, if any. Default is None.
+    """
+
+    # Codes are kept as text (e.g. '00990')
+    df_original = pd.read_excel(input_path, dtype={'Product_code': str, 'Invoice_number': str})
+    df = df_original.copy()
+
+    df['Date'], unparseable_dates = normalize_dates(df['Date'])
+    if unparseable_dates:
+        print(f'{len(unparseable_dates)} dates could not be parsed: {unparseable_dates}')
+    # Amounts are numeric cells or text written with either separator convention ('1,234.56' or '1.234,56');
+    # values that are not numbers become missing
+    for column in AMOUNT_COLUMNS:
+        df[column] = to_decimal_amounts(df[column])
+    df['Size'] = df['Size'].apply(lambda x: x.lower() if isinstance(x, str) else x)
+
+    filtered_df = filter_consecutive_invoices(df)
+
+    write_table(filtered_df, output_path)
+    if excel_path is not None:
+        export_excel(output_path, excel_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cleans the revised invoices and writes them to the columnar store.')
+    parser.add_argument('--excel', action='store_true', help=f'also export an Excel copy ({REVISED_INVOICES_EXCEL_PATH})')
+    args = parser.parse_args()
+
+    main(excel_path=REVISED_INVOICES_EXCEL_PATH if args.excel else None)
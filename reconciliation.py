@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import pandas as pd
+from utils import to_fixed_point
+from setup import GENERATED_FILES_DIR_PATH
+
+
+RECONCILIATION_REPORT_PATH = GENERATED_FILES_DIR_PATH + 'reconciliation_report.csv'
+
+# Outcome of the reconciliation of an invoice
+RECONCILED = 'ok'              # the product prices add up to the sub-total
+DEDUPLICATED = 'deduplicated'  # they add up once repeated product codes are dropped
+MISMATCH = 'mismatch'          # they do not add up either way; the invoice is flagged
+FAILED = 'failed'              # the amounts could not be read
+
+REPORT_COLUMNS = ['file', 'invoice_number', 'status', 'sub_total', 'products_sum', 'deduplicated_sum',
+                  'difference', 'error']
+
+
+def reconcile_batch(items: pd.DataFrame, invoices: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Reconciles a whole batch of invoices at once: the sub-total of every invoice is compared with the sum of its
+    product prices and, when they differ, with the sum once repeated product codes are dropped (keeping the first
+    row). Amounts are parsed once for the whole batch and compared as exact integer cents, and all sums are
+    grouped, vectorized operations.
+
+    Parameters:
+    items (pd.DataFrame): The product rows of every invoice, with 'File', 'Product_code' and 'Total_price' columns.
+    invoices (pd.DataFrame): One row per invoice, with 'file', 'invoice_number' and 'sub_total_amount' columns.
+
+    Returns:
+    tuple[pd.DataFrame, pd.Series]:
+    - the report, one row per invoice with the 'REPORT_COLUMNS' (amounts in cents, 'difference' being
+      the sub-total minus the last sum compared);
+    - a boolean Series over 'items', True for the rows of reconciled invoices that are kept (all rows when the
+      status is 'ok', the first row of each product code when it is 'deduplicated').
+    """
+
+    keys = invoices['file']
+    sub_total = to_fixed_point(invoices['sub_total_amount'], errors='coerce')
+    sub_total.index = keys
+
+    prices = to_fixed_point(items['Total_price'], errors='coerce')
+    missing_prices = items['Total_price'].isna()
+    invalid_prices = prices.isna() & ~missing_prices
+    first = ~items.duplicated(subset=['File', 'Product_code'], keep='first')
+
+    products_sum = prices.groupby(items['File']).sum().reindex(keys, fill_value=0)
+    deduplicated_sum = prices[first].groupby(items['File'][first]).sum().reindex(keys, fill_value=0)
+    has_invalid_prices = invalid_prices.groupby(items['File']).any().reindex(keys, fill_value=False)
+    # Sums skip missing prices, so an invoice with one could otherwise add up
+    has_missing_prices = missing_prices.groupby(items['File']).any().reindex(keys, fill_value=False)
+
+    errors = np.select(
+        [invoices['sub_total_amount'].isna().to_numpy(), sub_total.isna().to_numpy(), has_missing_prices.to_numpy(),
+         has_invalid_prices.to_numpy()],
+        ['sub-total amount not found', 'invalid sub-total amount', 'product price not found', 'invalid product price'],
+        '')
+    failed = errors != ''
+    status = np.select(
+        [failed, (sub_total == products_sum).fillna(False).to_numpy(), (sub_total == deduplicated_sum).fillna(False).to_numpy()],
+        [FAILED, RECONCILED, DEDUPLICATED],
+        MISMATCH)
+
+    report = pd.DataFrame({
+        'file': keys.to_numpy(),
+        'invoice_number': invoices['invoice_number'].to_numpy(),
+        'status': status,
+        'sub_total': sub_total.array,
+        'products_sum': products_sum.array,
+        'deduplicated_sum': deduplicated_sum.array,
+        'error': errors,
+    })
+    report['difference'] = report['sub_total'] - report['products_sum'].where(report['status'] == RECONCILED,
+                                                                             report['deduplicated_sum'])
+    report.loc[failed, ['products_sum', 'deduplicated_sum', 'difference']] = pd.NA
+    report = report[REPORT_COLUMNS]
+
+    status_by_file = pd.Series(status, index=keys)
+    item_status = items['File'].map(status_by_file)
+    keep = (item_status == RECONCILED) | ((item_status == DEDUPLICATED) & first)
+
+    return report, keep
+
+
+class ReconciliationReport:
+    """
+    Appends the report of every batch to a CSV file, so the mismatches of a run can be reviewed afterwards.
+    """
+
+    def __init__(self, path: str = RECONCILIATION_REPORT_PATH) -> None:
+        """
+        Starts an empty report.
+
+        Parameters:
+        path (str, optional): The path of the CSV file. Default is 'RECONCILIATION_REPORT_PATH'.
+        """
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.counts = {status: 0 for status in [RECONCILED, DEDUPLICATED, MISMATCH, FAILED]}
+        pd.DataFrame(columns=REPORT_COLUMNS).to_csv(path, index=False)
+
+    def append(self, report: pd.DataFrame) -> None:
+        """
+        Adds the report of a batch.
+
+        Parameters:
+        report (pd.DataFrame): A report returned by 'reconcile_batch'.
+        """
+
+        report.to_csv(self.path, mode='a', header=False, index=False)
+        for status, count in report['status'].value_counts().items():
+            self.counts[status] += int(count)
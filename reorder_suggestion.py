@@ -1,71 +1,326 @@
-import pandas as pd
-
-
-file_path = 'generated_files/invoices_revised-2_0.xlsx'
-invoices_df = pd.read_excel(file_path, engine='openpyxl')
-
-start_date = pd.Timestamp('2022-07-01')
-end_date = pd.Timestamp('2023-07-31')
-eligible_start_date = pd.Timestamp('2022-07-01')
-eligible_end_date = pd.Timestamp('2023-01-01')
-exclusion_start_date = pd.Timestamp('2023-01-01')
-exclusion_end_date = pd.Timestamp('2023-07-31')
-
-# Filter Active Clients 
-active_clients_df = invoices_df[
-    (invoices_df['Date'] >= start_date) & (invoices_df['Date'] <= end_date)
-]
-
-# Determine Eligible Products for Each Client and Exclude Recent Purchases
-client_reorder_suggestions = {}
-
-for client in active_clients_df['Client'].unique():
-    client_data = invoices_df[invoices_df['Client'] == client]
-
-    # Products purchased by the client more than 6 months ago but less than a year ago
-    eligible_products_client = set(client_data[
-        (client_data['Date'] >= eligible_start_date) & (client_data['Date'] < eligible_end_date)
-    ]['Product_code'].unique())
-
-    # Products purchased by the client in the last 6 months
-    excluded_products_client = set(client_data[
-        (client_data['Date'] >= exclusion_start_date) & (client_data['Date'] <= exclusion_end_date)
-    ]['Product_code'].unique())
-
-    # Products eligible for reorder suggestion for the client
-    reorder_products = list(eligible_products_client - excluded_products_client)
-
-    client_reorder_suggestions[client] = reorder_products
-
-
-reorder_suggestions_df = pd.DataFrame(list(client_reorder_suggestions.items()), columns=['Client', 'Reorder Suggestions'])
-
-# Mapping from Product_code to Product_name merged with Size
-product_name_size_map = {
-    row['Product_code']: f"{row['Product_name']} {row['Size']}"
-    for _, row in invoices_df[['Product_code', 'Product_name', 'Size']].drop_duplicates().iterrows()
-}
-
-# Modify client_reorder_suggestions to use product names instead of codes
-for client in client_reorder_suggestions:
-    client_reorder_suggestions[client] = [
-        product_name_size_map.get(product_code, "Unknown Product")
-        for product_code in client_reorder_suggestions[client]
-    ]
-
-# Replace client names with auto incremented numbers
-client_ids = {client: idx for idx, client in enumerate(client_reorder_suggestions.keys(), start=1)}
-
-modified_reorder_suggestions_df = pd.DataFrame([
-    {"Client ID": client_ids[client], "Reorder Suggestions": suggestions}
-    for client, suggestions in client_reorder_suggestions.items()
-])
-
-modified_reorder_suggestions_df['Reorder Suggestions'] = modified_reorder_suggestions_df['Reorder Suggestions'].apply(lambda x: x[:5])
-modified_reorder_suggestions_df.to_csv('C:/All/PyProjects/Orbis/generated_files/reorder_suggestion.csv', index=False)
-
-
-
-
-
-
+import argparse
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from db_loader import DEFAULT_CHUNK_SIZE, create_database_engine
+from columnar_store import REVISED_INVOICES_PATH, read_table
+from customers import CustomerRegistry
+from setup import GENERATED_FILES_DIR_PATH, DATABASE_URL
+
+
+INVOICES_PATH = REVISED_INVOICES_PATH
+INVOICES_COLUMNS = ['Client', 'Product_code', 'Product_name', 'Size', 'Date']
+REORDER_SUGGESTIONS_PATH = GENERATED_FILES_DIR_PATH + 'reorder_suggestion.csv'
+
+# A product a client bought from 'ELIGIBLE_MONTHS' to 'RECENT_MONTHS' months before the month of the as-of date,
+# and did not buy again since, is suggested for reorder
+ELIGIBLE_MONTHS = 12
+RECENT_MONTHS = 6
+MAX_SUGGESTIONS = 5
+
+# Suggestions computed in the database, from the tables of 'all.sql', in one pass: the last purchase of every
+# product by every customer up to the as-of date, ranked per customer with the products whose last purchase is in
+# the eligible window first (bought longest ago first). The top eligible products of each customer are returned,
+# and a row without product for the active customers with nothing to suggest
+REORDER_QUERY = text('''
+    WITH last_purchase AS (
+        SELECT i.customer_id, ii.product_code, MAX(i.issue_date) AS last_date
+        FROM invoice i
+        JOIN invoiceitem ii ON ii.invoice_number = i.invoice_number
+        WHERE i.issue_date >= :start AND i.issue_date < :end
+        GROUP BY i.customer_id, ii.product_code
+    ),
+    ranked AS (
+        SELECT customer_id, product_code,
+               CASE WHEN last_date < :recent_start THEN 1 ELSE 0 END AS eligible,
+               ROW_NUMBER() OVER (
+                   PARTITION BY customer_id
+                   ORDER BY CASE WHEN last_date < :recent_start THEN 0 ELSE 1 END, last_date, product_code
+               ) AS suggestion_rank
+        FROM last_purchase
+    )
+    SELECT r.customer_id, r.suggestion_rank, CASE WHEN r.eligible = 1 THEN r.product_code END AS product_code,
+           p.reference, p.size
+    FROM ranked r
+    LEFT JOIN product p ON p.product_code = r.product_code AND r.eligible = 1
+    WHERE r.suggestion_rank <= :max_suggestions AND (r.eligible = 1 OR r.suggestion_rank = 1)
+    ORDER BY r.customer_id, r.suggestion_rank
+''')
+
+
+def reorder_windows(as_of) -> tuple[pd.Timestamp, pd.Timestamp, pd.Timestamp]:
+    """
+    Date windows of the suggestions at a date. Clients are active if they bought anything from 'start' to 'as_of';
+    the products they bought from 'start' to before 'recent_start' are eligible, except the ones they bought from
+    'recent_start' to 'as_of'. E.g. for 2023-07-31: 2022-07-01, 2023-01-01 and 2023-07-31.
+
+    Parameters:
+    as_of (str or pd.Timestamp): The date of the suggestions.
+
+    Returns:
+    tuple[pd.Timestamp, pd.Timestamp, pd.Timestamp]: 'start', 'recent_start' and 'as_of'.
+    """
+
+    as_of = pd.Timestamp(as_of).normalize()
+    month = as_of.to_period('M')
+
+    return (month - ELIGIBLE_MONTHS).start_time, (month - RECENT_MONTHS).start_time, as_of
+
+
+def _months_after(dates: np.ndarray, months: int) -> np.ndarray:
+    """
+    First day of the month that comes 'months' months after the month of each date.
+    """
+
+    return (dates.astype('datetime64[M]') + months).astype('datetime64[ns]')
+
+
+def _purchase_intervals(purchases: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    """
+    Distinct purchase dates of each key, with the date of the next purchase of the same key ('Next_date',
+    the latest representable date for the last purchase).
+    """
+
+    purchases = purchases[keys + ['Date']].drop_duplicates().sort_values(keys + ['Date'])
+    next_date = purchases.groupby(keys, sort=False)['Date'].shift(-1).fillna(pd.Timestamp.max)
+
+    return purchases.assign(Next_date=next_date)
+
+
+def _expand(lower: np.ndarray, upper: np.ndarray, as_of_dates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs every interval [lower, upper) with each of the sorted as-of dates it contains.
+
+    Returns:
+    tuple[np.ndarray, np.ndarray]: The position of the interval and of the as-of date of every pair.
+    """
+
+    first = as_of_dates.searchsorted(lower, side='left')
+    last = as_of_dates.searchsorted(upper, side='left')
+    counts = np.maximum(last - first, 0)
+
+    rows = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    return rows, first[rows] + offsets
+
+
+def compute_reorder_suggestions(invoices_df: pd.DataFrame, as_of) -> pd.DataFrame:
+    """
+    Computes the reorder suggestions of every active client at one or more dates (see 'reorder_windows'), in a
+    few vectorized passes over the invoice lines instead of one pass per client and date.
+
+    A product is suggested at a date exactly when the last time the client bought it, on or before that date,
+    falls in the eligible window. So each distinct purchase suggests its product for the as-of dates from the
+    month 'RECENT_MONTHS' + 1 after it up to the next purchase of the same product, or the end of the window,
+    and these ranges are matched against all as-of dates at once with a binary search. Active clients are
+    found the same way.
+
+    Parameters:
+    invoices_df (pd.DataFrame): The invoice lines, with 'Client', 'Product_code' and 'Date' columns.
+    as_of (str, pd.Timestamp or list): The date of the suggestions, or several dates for a backfill.
+
+    Returns:
+    pd.DataFrame: One row per as-of date and active client, with 'As_of', 'Client' and 'Reorder Suggestions'
+    (the product codes, bought longest ago first) columns. Rows are ordered by date, then by the first
+    appearance of the client in 'invoices_df'.
+    """
+
+    as_of_dates = pd.DatetimeIndex(np.atleast_1d(as_of)).normalize().unique().sort_values().as_unit('ns').to_numpy()
+
+    purchases = pd.DataFrame({
+        'Client': invoices_df['Client'],
+        'Product_code': invoices_df['Product_code'],
+        'Date': pd.to_datetime(invoices_df['Date'], errors='coerce').dt.normalize().astype('datetime64[ns]'),
+    }).dropna()
+    client_order = pd.Series(np.arange(purchases['Client'].nunique()), index=purchases['Client'].unique())
+
+    # Active clients: their last purchase on or before the as-of date is at most 'ELIGIBLE_MONTHS' old
+    clients = _purchase_intervals(purchases, ['Client'])
+    dates = clients['Date'].to_numpy()
+    upper = np.minimum(clients['Next_date'].to_numpy(), _months_after(dates, ELIGIBLE_MONTHS + 1))
+    rows, at = _expand(dates, upper, as_of_dates)
+    active = pd.DataFrame({'As_of': as_of_dates[at], 'Client': clients['Client'].to_numpy()[rows]})
+
+    # Suggested products: their last purchase on or before the as-of date is in the eligible window
+    products = _purchase_intervals(purchases, ['Client', 'Product_code'])
+    dates = products['Date'].to_numpy()
+    lower = _months_after(dates, RECENT_MONTHS + 1)
+    upper = np.minimum(products['Next_date'].to_numpy(), _months_after(dates, ELIGIBLE_MONTHS + 1))
+    rows, at = _expand(lower, upper, as_of_dates)
+    suggested = products.iloc[rows][['Client', 'Product_code', 'Date']].assign(As_of=as_of_dates[at])
+
+    # One list of codes per date and client, split from the sorted codes at the group boundaries
+    suggested = suggested.sort_values(['As_of', 'Client', 'Date', 'Product_code'])
+    starts = np.flatnonzero(~suggested.duplicated(subset=['As_of', 'Client']).to_numpy())
+    codes = np.split(suggested['Product_code'].to_numpy(), starts[1:]) if len(starts) else []
+    suggestions = pd.Series([group.tolist() for group in codes], name='Reorder Suggestions',
+                            index=pd.MultiIndex.from_frame(suggested.iloc[starts][['As_of', 'Client']]))
+
+    active['order'] = active['Client'].map(client_order)
+    active = active.sort_values(['As_of', 'order']).drop(columns='order')
+    active = active.join(suggestions, on=['As_of', 'Client'])
+    active['Reorder Suggestions'] = [codes if isinstance(codes, list) else [] for codes in active['Reorder Suggestions']]
+
+    return active.reset_index(drop=True)
+
+
+def _group_suggestions(rows: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turns rows of 'REORDER_QUERY', ordered by customer, into one row per customer with the list of product names.
+    """
+
+    names = (rows['reference'].map(str) + ' ' + rows['size'].map(str)).where(rows['reference'].notna(), 'Unknown Product')
+    names = names.where(rows['product_code'].notna()).to_numpy(dtype=object)
+
+    starts = np.flatnonzero(~rows['customer_id'].duplicated().to_numpy())
+    return pd.DataFrame({
+        'Client ID': rows['customer_id'].to_numpy()[starts],
+        'Reorder Suggestions': [group[pd.notna(group)].tolist() for group in np.split(names, starts[1:])],
+    })
+
+
+def stream_reorder_suggestions(connection, as_of, max_suggestions: int = MAX_SUGGESTIONS,
+                               chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Computes the reorder suggestions at a date inside the database, with 'REORDER_QUERY', and streams them in
+    chunks, so the invoices are never loaded into memory. Same windows and order as 'compute_reorder_suggestions',
+    with the top products of each client chosen by the database.
+
+    Parameters:
+    connection: An open SQLAlchemy connection to a database created by 'all.sql'.
+    as_of (str or pd.Timestamp): The date of the suggestions.
+    max_suggestions (int, optional): Maximum number of products suggested to each client. Default is 'MAX_SUGGESTIONS'.
+    chunk_size (int, optional): Number of result rows fetched at a time. Default is 'DEFAULT_CHUNK_SIZE'.
+
+    Yields:
+    pd.DataFrame: The suggestions of a chunk of clients, with 'Client ID' (the 'customer_id') and
+    'Reorder Suggestions' (product names and sizes) columns.
+    """
+
+    start, recent_start, as_of = reorder_windows(as_of)
+    params = {'start': start.date(), 'recent_start': recent_start.date(),
+              'end': (as_of + pd.Timedelta(days=1)).date(), 'max_suggestions': max_suggestions}
+
+    # The rows of the last client of a chunk may continue in the next one
+    pending = None
+    connection = connection.execution_options(stream_results=True)
+    for rows in pd.read_sql(REORDER_QUERY, con=connection, params=params, chunksize=chunk_size):
+        if pending is not None:
+            rows = pd.concat([pending, rows], ignore_index=True)
+        last = rows['customer_id'].iloc[-1]
+        pending = rows[rows['customer_id'] == last]
+        rows = rows[rows['customer_id'] != last]
+        if not rows.empty:
+            yield _group_suggestions(rows)
+
+    if pending is not None:
+        yield _group_suggestions(pending)
+
+
+def write_suggestions_from_database(database_url: str = DATABASE_URL, as_of=None,
+                                    output_path: str = REORDER_SUGGESTIONS_PATH,
+                                    max_suggestions: int = MAX_SUGGESTIONS, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes the reorder suggestions computed in the database (see 'stream_reorder_suggestions'), chunk by chunk.
+
+    Parameters:
+    database_url (str): The SQLAlchemy database URL. Default is 'DATABASE_URL'.
+    as_of (str, pd.Timestamp, list or None): The date of the suggestions, or several dates for a backfill (an
+    'As_of' column is then added). Default is the latest issue date in the database.
+    output_path (str): The path of the CSV file written. Default is 'REORDER_SUGGESTIONS_PATH'.
+    max_suggestions (int): Maximum number of products suggested to each client. Default is 'MAX_SUGGESTIONS'.
+    chunk_size (int): Number of result rows fetched at a time. Default is 'DEFAULT_CHUNK_SIZE'.
+
+    Returns:
+    int: Number of rows written.
+    """
+
+    engine = create_database_engine(database_url)
+    written = 0
+    with engine.connect() as connection:
+        if as_of is None:
+            as_of = connection.execute(text('SELECT MAX(issue_date) FROM invoice')).scalar()
+        dates = pd.DatetimeIndex(np.atleast_1d(as_of)).normalize().unique().sort_values()
+
+        for date in dates:
+            for suggestions_df in stream_reorder_suggestions(connection, date, max_suggestions, chunk_size):
+                if len(dates) > 1:
+                    suggestions_df.insert(0, 'As_of', date)
+                suggestions_df.to_csv(output_path, index=False, mode='a' if written else 'w', header=not written)
+                written += len(suggestions_df)
+
+    if not written:
+        pd.DataFrame(columns=['Client ID', 'Reorder Suggestions']).to_csv(output_path, index=False)
+    engine.dispose()
+    print(f'Reorder suggestions written: {written} rows')
+
+    return written
+
+
+def main(as_of=None, file_path: str = INVOICES_PATH, output_path: str = REORDER_SUGGESTIONS_PATH,
+         max_suggestions: int = MAX_SUGGESTIONS) -> pd.DataFrame:
+    """
+    Writes the reorder suggestions of every active client, with products named by name and size and clients
+    replaced by their IDs in the customer registry (the same IDs as in the database).
+
+    Parameters:
+    as_of (str, pd.Timestamp, list or None): The date of the suggestions, or several dates for a backfill (an
+    'As_of' column is then added). Default is the latest issue date of the invoices.
+    file_path (str): The path of the revised invoices. Default is 'INVOICES_PATH'.
+    output_path (str): The path of the CSV file written. Default is 'REORDER_SUGGESTIONS_PATH'.
+    max_suggestions (int): Maximum number of products suggested to each client. Default is 'MAX_SUGGESTIONS'.
+
+    Returns:
+    pd.DataFrame: The suggestions written.
+    """
+
+    invoices_df = read_table(file_path, INVOICES_COLUMNS)
+    if as_of is None:
+        as_of = pd.to_datetime(invoices_df['Date'], errors='coerce').max()
+
+    suggestions_df = compute_reorder_suggestions(invoices_df, as_of)
+    suggestions_df['Reorder Suggestions'] = suggestions_df['Reorder Suggestions'].str[:max_suggestions]
+
+    # Mapping from Product_code to Product_name merged with Size
+    products = invoices_df[['Product_code', 'Product_name', 'Size']].drop_duplicates()
+    products = products.drop_duplicates(subset='Product_code', keep='last')
+    product_names = pd.Series((products['Product_name'].map(str) + ' ' + products['Size'].map(str)).to_numpy(),
+                              index=products['Product_code'])
+
+    codes = suggestions_df['Reorder Suggestions'].explode().dropna()
+    names = codes.map(product_names).fillna('Unknown Product').groupby(level=0).agg(list)
+    suggestions_df['Reorder Suggestions'] = [names.get(row, []) for row in suggestions_df.index]
+
+    # Replace client names with their IDs in the customer registry
+    registry = CustomerRegistry()
+    suggestions_df['Client ID'] = registry.assign(suggestions_df['Client'])
+    registry.save()
+
+    columns = ['Client ID', 'Reorder Suggestions']
+    if suggestions_df['As_of'].nunique() > 1:
+        columns = ['As_of'] + columns
+    suggestions_df = suggestions_df[columns]
+    suggestions_df.to_csv(output_path, index=False)
+    print(f'Reorder suggestions written for {suggestions_df["Client ID"].nunique()} clients')
+
+    return suggestions_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Suggests to each active client the products to reorder.')
+    parser.add_argument('--as-of', nargs='+', default=None,
+                        help='date(s) of the suggestions, several for a backfill (default: the latest issue date)')
+    parser.add_argument('--max-suggestions', type=int, default=MAX_SUGGESTIONS,
+                        help=f'products suggested to each client (default: {MAX_SUGGESTIONS})')
+    parser.add_argument('--database', nargs='?', const=DATABASE_URL, default=None, metavar='URL',
+                        help='compute the suggestions in the database (default URL: DATABASE_URL) instead of the Excel file')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'rows fetched at a time from the database (default: {DEFAULT_CHUNK_SIZE})')
+    args = parser.parse_args()
+
+    if args.database is not None:
+        write_suggestions_from_database(args.database, args.as_of, max_suggestions=args.max_suggestions,
+                                        chunk_size=args.chunk_size)
+    else:
+        main(as_of=args.as_of, max_suggestions=args.max_suggestions)
@@ -1,4 +1,15 @@
-SOURCE_DIR = 'C:/All/PyProjects/Orbis/CECAFI/'
-PDFs_DIR_PATH = 'C:/All/PyProjects/Orbis/Invoices-pdf/'
-DOCS_DIR_PATH = 'C:/All/PyProjects/Orbis/Invoices-docx/'
-CATALOGS_DIR_PATH = 'C:/All/PyProjects/Orbis/Catalogs/'
\ No newline at end of file
+import os
+
+
+# Every setting can be overridden with an environment variable named 'ORBIS_' + its name in upper case
+# (e.g. ORBIS_PDFS_DIR_PATH), so the same code runs on other machines and in pipeline.py without edits.
+# Directory paths end with '/'
+SOURCE_DIR = os.environ.get('ORBIS_SOURCE_DIR', 'C:/All/PyProjects/Orbis/CECAFI/')
+PDFs_DIR_PATH = os.environ.get('ORBIS_PDFS_DIR_PATH', 'C:/All/PyProjects/Orbis/Invoices-pdf/')
+DOCS_DIR_PATH = os.environ.get('ORBIS_DOCS_DIR_PATH', 'C:/All/PyProjects/Orbis/Invoices-docx/')
+CATALOGS_DIR_PATH = os.environ.get('ORBIS_CATALOGS_DIR_PATH', 'C:/All/PyProjects/Orbis/Catalogs/')
+GENERATED_FILES_DIR_PATH = os.environ.get('ORBIS_GENERATED_FILES_DIR_PATH', 'C:/All/PyProjects/Orbis/generated_files/')
+OUTPUT_DIR_PATH = os.environ.get('ORBIS_OUTPUT_DIR_PATH', 'C:/All/PyProjects/Orbis/')
+LAYOUTS_FILE_PATH = os.environ.get('ORBIS_LAYOUTS_FILE_PATH', 'C:/All/PyProjects/Orbis/layouts.json')
+DATABASE_URL = os.environ.get('ORBIS_DATABASE_URL', 'mysql+mysqlconnector://<username>:<password>4@<host/ip>/<servername>')
+LOG_LEVEL = os.environ.get('ORBIS_LOG_LEVEL', 'INFO')
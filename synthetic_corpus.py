@@ -0,0 +1,310 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from catalog import CATALOG_FILE_SUFFIX
+from setup import GENERATED_FILES_DIR_PATH
+
+
+# Synthetic invoices with known content, for benchmarks and accuracy checks (generated offline with reportlab),
+# kept apart from the real invoices
+SYNTHETIC_DIR_PATH = GENERATED_FILES_DIR_PATH + 'synthetic/'
+SYNTHETIC_PDFs_DIR_PATH = SYNTHETIC_DIR_PATH + 'Invoices-pdf/'
+SYNTHETIC_CATALOGS_DIR_PATH = SYNTHETIC_DIR_PATH + 'Catalogs/'
+GROUND_TRUTH_PATH = SYNTHETIC_DIR_PATH + 'ground_truth.csv'
+SYNTHETIC_FACTORY = 'Synthetic'
+FILE_PREFIX = 'synthetic'
+FIRST_INVOICE_NUMBER = 100000
+
+# Printed labels of each language, matching the keywords of the built-in layouts (see layouts.py)
+LABELS = {
+    'english': {
+        'title': 'COMMERCIAL INVOICE', 'invoice_number': 'Invoice Number', 'issue_date': 'Issue Date',
+        'client_name': 'Bill To', 'currency': 'Currency', 'destination_port': 'Destination Port',
+        'goods': 'Description of goods', 'sqm': 'Sqm', 'unit_price': 'Unit.Price', 'total_price': 'Total',
+        'sub_total': 'Sub-total amount', 'fumigation': 'Fumigation', 'fob': 'FOB',
+        'conditions': 'Payment Conditions {days} days', 'end': 'Signature',
+    },
+    'spanish': {
+        'title': 'FACTURA COMERCIAL', 'invoice_number': 'Invoice Nr', 'issue_date': 'Fecha',
+        'client_name': 'Importador', 'currency': 'Moneda', 'destination_port': 'Puerto de destino',
+        'goods': 'Descripcion de las mercancias', 'sqm': 'M2', 'unit_price': 'Precio Unitario', 'total_price': 'Importe',
+        'sub_total': 'Sub-total', 'fumigation': 'Fumigacion', 'fob': 'FOB',
+        'conditions': 'Condiciones de pago {days} dias', 'end': 'Visto',
+    },
+}
+MONTHS = {
+    'english': ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'],
+    'spanish': ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic'],
+}
+
+# Vocabulary of the products and clients
+STONES = ['MARMO', 'PIETRA', 'LEGNO', 'CEMENTO', 'ARDESIA', 'TRAVERTINO', 'CALACATTA', 'GRANITO', 'BASALTO', 'ONICE']
+SHADES = ['BIANCO', 'GRIGIO', 'NERO', 'BEIGE', 'AVORIO', 'SABBIA', 'ANTRACITE', 'PERLA']
+FINISHES = ['', ' LUX', ' MATT', ' RETT']
+SIZES = ['60X60', '30X60', '20X120', '45X45', '90X90', '60X120']
+CLIENT_NAMES = ['ACME', 'ANDES', 'PAMPA', 'CARIBE', 'PACIFICO', 'AURORA', 'ATLAS', 'CONDOR', 'SOL', 'MAYA']
+CLIENT_SUFFIXES = ['LTDA', 'S.A.', 'SRL', 'INC', 'CORP']
+PORTS = [('Chile', 'San Antonio'), ('Peru', 'Callao'), ('Colombia', 'Cartagena'), ('Mexico', 'Manzanillo'),
+         ('USA', 'Miami'), ('Panama', 'Colon'), ('Argentina', 'Buenos Aires')]
+
+FUMIGATION_CENTS = 1000
+START_DATE = pd.Timestamp('2022-01-01')
+DAYS = 730
+
+
+def format_amount(cents: int, language: str) -> str:
+    """
+    Prints an amount the way the invoices of a language do: '1,234.50' in English, '1.234,50' in Spanish.
+
+    Parameters:
+    cents (int): The amount, in cents.
+    language (str): 'english' or 'spanish'.
+
+    Returns:
+    str: The printed amount.
+    """
+
+    whole, fraction = divmod(int(cents), 100)
+    printed = f'{whole:,}.{fraction:02d}'
+    if language == 'spanish':
+        printed = printed.replace(',', ' ').replace('.', ',').replace(' ', '.')
+    return printed
+
+
+def format_date(date: pd.Timestamp, language: str) -> str:
+    """
+    Prints a date the way the invoices of a language do (e.g. '12-Jan-23', '12-Ene-23').
+    """
+
+    return f'{date.day:02d}-{MONTHS[language][date.month - 1]}-{date.year % 100:02d}'
+
+
+def make_catalog(count: int = 200, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds the products of the synthetic factory. Codes have 5 digits, some with leading zeros.
+
+    Parameters:
+    count (int, optional): Number of products. Default is 200.
+    seed (int, optional): Seed of the random generator. Default is 0.
+
+    Returns:
+    pd.DataFrame: 'Product_code', 'Product_name' and 'Size' of every product.
+    """
+
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(100000, size=count, replace=False)
+    names = [f'{STONES[rng.integers(len(STONES))]} {SHADES[rng.integers(len(SHADES))]}{FINISHES[rng.integers(len(FINISHES))]}'
+             for _ in range(count)]
+
+    return pd.DataFrame({'Product_code': [f'{code:05d}' for code in codes], 'Product_name': names,
+                         'Size': rng.choice(SIZES, size=count)})
+
+
+def make_clients(count: int = 40, seed: int = 0) -> pd.DataFrame:
+    """
+    Builds the clients: name, country, destination port and currency.
+    """
+
+    rng = np.random.default_rng(seed + 1)
+    names = sorted({f'{CLIENT_NAMES[i % len(CLIENT_NAMES)]} {word} {CLIENT_SUFFIXES[i % len(CLIENT_SUFFIXES)]}'
+                    for i, word in enumerate(rng.choice(STONES + SHADES, size=count))})
+    ports = [PORTS[i] for i in rng.integers(len(PORTS), size=len(names))]
+
+    return pd.DataFrame({'Client': names, 'Country': [country for country, _ in ports],
+                         'Destination': [port for _, port in ports],
+                         'Currency': rng.choice(['USD', 'USD', 'USD', 'EUR'], size=len(names))})
+
+
+def make_invoices(count: int, seed: int = 0, spanish_share: float = 0.3, catalog: pd.DataFrame or None = None,
+                  clients: pd.DataFrame or None = None) -> pd.DataFrame:
+    """
+    Draws the content of the invoices: one row per product line, with the header of its invoice. Quantities
+    and prices are exact amounts in cents, line totals are rounded half up and every sub-total is at least
+    1,000.00, as on the real invoices.
+
+    Parameters:
+    count (int): Number of invoices.
+    seed (int, optional): Seed of the random generator. Default is 0.
+    spanish_share (float, optional): Share of Spanish invoices. Default is 0.3.
+    catalog (pd.DataFrame or None, optional): The products. Default is 'make_catalog(seed=seed)'.
+    clients (pd.DataFrame or None, optional): The clients. Default is 'make_clients(seed=seed)'.
+
+    Returns:
+    pd.DataFrame: The ground truth.
+    """
+
+    catalog = make_catalog(seed=seed) if catalog is None else catalog
+    clients = make_clients(seed=seed) if clients is None else clients
+    rng = np.random.default_rng(seed + 2)
+
+    rows = []
+    for i in range(count):
+        client = clients.iloc[rng.integers(len(clients))]
+        language = 'spanish' if rng.random() < spanish_share else 'english'
+        date = START_DATE + pd.Timedelta(days=int(rng.integers(DAYS)))
+        products = catalog.iloc[rng.choice(len(catalog), size=int(rng.integers(1, 9)), replace=False)]
+        sqm = rng.integers(200_00, 2500_00, size=len(products))
+        unit_price = rng.integers(5_00, 30_00, size=len(products))
+        total_price = (sqm * unit_price + 50) // 100
+        sub_total = int(total_price.sum())
+
+        for product, line_sqm, line_price, line_total in zip(products.itertuples(index=False), sqm, unit_price, total_price):
+            rows.append({
+                'File': f'{FILE_PREFIX}_{i:06d}',
+                'Language': language,
+                'Invoice_number': str(FIRST_INVOICE_NUMBER + i),
+                'Client': client['Client'],
+                'Country': client['Country'],
+                'Date': format_date(date, language),
+                'Issue_date': date.date().isoformat(),
+                'Currency': client['Currency'],
+                'Destination': client['Destination'],
+                'Product_code': product.Product_code,
+                'Product_name': product.Product_name,
+                'Size': product.Size,
+                'Sqm': int(line_sqm),
+                'Unit_price': int(line_price),
+                'Total_price': int(line_total),
+                'Sub_total': sub_total,
+                'FOB': sub_total + FUMIGATION_CENTS,
+            })
+
+    return pd.DataFrame(rows)
+
+
+def render_invoice(lines: pd.DataFrame, file_path: str) -> None:
+    """
+    Writes the PDF of one invoice: a header table, the product lines between the start and end strings of its
+    layout, a table with the quantity, unit price and total columns, and the amounts.
+
+    Parameters:
+    lines (pd.DataFrame): The ground truth rows of the invoice.
+    file_path (str): The path of the PDF file.
+    """
+
+    first = lines.iloc[0]
+    language = first['Language']
+    labels = LABELS[language]
+    styles = getSampleStyleSheet()
+    grid = TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.black)])
+
+    header = Table([[f'{labels["invoice_number"]} {first["Invoice_number"]}', f'{labels["issue_date"]} {first["Date"]}'],
+                    [f'{labels["client_name"]} {first["Client"]}', f'{labels["currency"]} {first["Currency"]}'],
+                    [f'{labels["destination_port"]} {first["Destination"]}', '']])
+    header.setStyle(grid)
+
+    amounts = Table([[labels['sqm'] + '\n' + '\n'.join(format_amount(value, language) for value in lines['Sqm']),
+                      labels['unit_price'] + '\n' + '\n'.join(format_amount(value, language) for value in lines['Unit_price']),
+                      labels['total_price'] + '\n' + '\n'.join(format_amount(value, language) for value in lines['Total_price'])]])
+    amounts.setStyle(grid)
+
+    elements = [Paragraph(labels['title'], styles['Title']), header, Spacer(1, 12),
+                Paragraph(labels['goods'], styles['Normal'])]
+    elements += [Paragraph(f'{line.Product_code} {line.Product_name} {line.Size}', styles['Normal'])
+                 for line in lines.itertuples(index=False)]
+    elements += [Spacer(1, 12), amounts, Spacer(1, 12),
+                 Paragraph(f'{labels["sub_total"]} {format_amount(first["Sub_total"], language)}', styles['Normal']),
+                 Paragraph(f'{labels["fumigation"]} {format_amount(FUMIGATION_CENTS, language)}', styles['Normal']),
+                 Paragraph(f'{labels["fob"]} {format_amount(first["FOB"], language)}', styles['Normal']),
+                 Paragraph(labels['conditions'].format(days=30), styles['Normal']),
+                 Paragraph(labels['end'], styles['Normal'])]
+
+    SimpleDocTemplate(file_path, pagesize=A4).build(elements)
+
+
+def _render_file(item: tuple) -> None:
+    lines, file_path = item
+    render_invoice(lines, file_path)
+
+
+def write_catalog(catalog: pd.DataFrame, catalogs_dir: str = SYNTHETIC_CATALOGS_DIR_PATH, seed: int = 0) -> str:
+    """
+    Writes the products as a factory catalog, with the raw codes of the real catalogs (a trailing check digit,
+    dropped by 'catalog.normalize_codes').
+
+    Returns:
+    str: The path of the catalog file.
+    """
+
+    rng = np.random.default_rng(seed + 3)
+    path = os.path.join(catalogs_dir, SYNTHETIC_FACTORY + CATALOG_FILE_SUFFIX)
+    pd.DataFrame({'COD': catalog['Product_code'] + pd.Series(rng.integers(10, size=len(catalog))).astype(str).to_numpy(),
+                  'REFERÊNCIA': catalog['Product_name'], 'TAMANHO': catalog['Size']}).to_csv(path, index=False)
+
+    return path
+
+
+def generate_corpus(count: int, pdfs_dir: str = SYNTHETIC_PDFs_DIR_PATH, catalogs_dir: str = SYNTHETIC_CATALOGS_DIR_PATH,
+                    ground_truth_path: str = GROUND_TRUTH_PATH, seed: int = 0, spanish_share: float = 0.3,
+                    workers: int = 1) -> pd.DataFrame:
+    """
+    Generates a corpus of English and Spanish invoice PDFs, the catalog of their products and their ground truth.
+    The same arguments always give the same corpus.
+
+    Parameters:
+    count (int): Number of invoices.
+    pdfs_dir (str, optional): Directory of the PDFs. Default is 'SYNTHETIC_PDFs_DIR_PATH'.
+    catalogs_dir (str, optional): Directory of the catalog. Default is 'SYNTHETIC_CATALOGS_DIR_PATH'.
+    ground_truth_path (str, optional): Path of the ground truth CSV file. Default is 'GROUND_TRUTH_PATH'.
+    seed (int, optional): Seed of the random generator. Default is 0.
+    spanish_share (float, optional): Share of Spanish invoices. Default is 0.3.
+    workers (int, optional): Number of processes rendering the PDFs. Default is 1.
+
+    Returns:
+    pd.DataFrame: The ground truth, one row per product line.
+    """
+
+    for directory in (pdfs_dir, catalogs_dir, os.path.dirname(ground_truth_path)):
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    # PDFs of an earlier, larger corpus would be extracted with this one
+    for file_name in os.listdir(pdfs_dir):
+        if file_name.startswith(FILE_PREFIX + '_') and file_name.endswith('.pdf'):
+            os.remove(os.path.join(pdfs_dir, file_name))
+
+    catalog = make_catalog(seed=seed)
+    truth = make_invoices(count, seed, spanish_share, catalog)
+    write_catalog(catalog, catalogs_dir, seed)
+
+    items = [(lines, os.path.join(pdfs_dir, file_name + '.pdf')) for file_name, lines in truth.groupby('File', sort=True)]
+    if workers <= 1:
+        for item in items:
+            _render_file(item)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_render_file, items, chunksize=16))
+
+    truth.to_csv(ground_truth_path, index=False)
+    with open(ground_truth_path + '.json', 'w', encoding='utf-8') as file:
+        json.dump({'count': count, 'seed': seed, 'spanish_share': spanish_share}, file)
+
+    return truth
+
+
+def load_ground_truth(path: str = GROUND_TRUTH_PATH) -> pd.DataFrame:
+    """
+    Reads the ground truth written by 'generate_corpus', with codes and numbers as text.
+    """
+
+    return pd.read_csv(path, dtype={'Product_code': str, 'Invoice_number': str, 'File': str})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generates synthetic English and Spanish invoice PDFs with their ground truth.')
+    parser.add_argument('count', type=int, help='number of invoices')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random generator (default: 0)')
+    parser.add_argument('--spanish-share', type=float, default=0.3, help='share of Spanish invoices (default: 0.3)')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes rendering the PDFs (default: 1)')
+    args = parser.parse_args()
+
+    truth = generate_corpus(args.count, seed=args.seed, spanish_share=args.spanish_share, workers=args.workers)
+    print(f'{truth["File"].nunique()} invoices ({len(truth)} product lines) written to {SYNTHETIC_PDFs_DIR_PATH}; '
+          f'ground truth: {GROUND_TRUTH_PATH}')
@@ -1,175 +1,492 @@
-import PyPDF2
-from pdf2docx import Converter
-import docx2txt
-import pdfplumber
-from docx import Document
-import os
-import re
-import pandas as pd
-from setup import PDFs_DIR_PATH, DOCS_DIR_PATH
-
-
-def get_text_from_pdf(file_name: str) -> str:
-    """
-    Extracts text from a PDF file, returning the text from all pages.
-    
-    Parameters:
-    file_name (str): The name of the PDF file.
-
-    Returns:
-    str: Text extracted from the PDF file.
-    """
-
-    file_path = PDFs_DIR_PATH + file_name
-    pdf_text = ''
-    try:
-        with open(file_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-
-            for page_number in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_number]
-                pdf_text += page.extract_text()
-
-    except FileNotFoundError:
-        print(f'The file {file_path} does not exist.')
-    except Exception as e:
-        print(f'An unexpected error with the file {file_path} occurred: {str(e)}')
-
-    return pdf_text
-
-
-def convert_pdf_to_docx(pdf_file_name: str) -> str or None:
-    """
-    Converts a PDF file to a DOCX file.
-
-    Parameters:
-    pdf_file_name (str): The name of the PDF file to be converted.
-
-    Returns:
-    str or None: The path to the converted DOCX file, or None if an error occurs.
-    """
-
-    pdf_file_path = PDFs_DIR_PATH + pdf_file_name
-    docx_file_name = pdf_file_name.replace('pdf', 'docx')
-    docx_file_path = DOCS_DIR_PATH + docx_file_name
-
-    if not os.path.isfile(docx_file_path):
-        try:
-            file = Converter(pdf_file_path)
-            file.convert(docx_file_path)
-            file.close()
-        except Exception as e:
-            print(f'An unexpected error with the file {pdf_file_path} occurred: {str(e)}')
-            return None
-        else:
-            print(f'{os.path.splitext(pdf_file_name)[0]} - File Converted Successfully')
-            return docx_file_path
-    return docx_file_path
-
-
-def extract_text_from_docx(docx_file_path: str) -> str:
-    """
-    Extracts text from a DOCX file and returns it as a string. Extra line breaks are removed.
-
-    Parameters:
-    docx_file_path (str): The file path of the DOCX document.
-
-    Returns:
-    str: The extracted text from the DOCX file.
-    """
-
-    text_docx = docx2txt.process(docx_file_path)
-    text_docx = re.sub('\n+', '\n', text_docx)
-    return text_docx
-
-
-def get_table_from_pdf(file_name: str) -> pd.DataFrame:
-    """
-    Extracts the first table from a PDF file and returns it as a pandas DataFrame.
-
-    Parameters:
-    file_name (str): The name of the PDF file.
-    
-    Returns:
-    pd.DataFrame: A DataFrame containing the extracted table data.
-    """
-
-    file_path = PDFs_DIR_PATH + file_name
-    table_settings = {
-        'vertical_strategy': 'text',
-        'horizontal_strategy': 'lines'
-    }
-
-    pdf = pdfplumber.open(file_path)
-    table = pdf.pages[0].extract_table(table_settings)
-    df = pd.DataFrame(table[1::], columns=table[0])
-
-    return df
-
-
-def extract_table_data_from_docx(file_name: str) -> list:
-    """
-    Extracts and returns all unique text data from every cell in all tables within a DOCX file.
-
-    Parameters:
-    file_name (str): The name of the DOCX file.
-
-    Returns:
-    list: A list of unique cell texts from all tables in the DOCX file.
-    """
-
-    document = Document(DOCS_DIR_PATH + file_name)
-
-    table_data = []
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                table_data.append(cell.text)
-
-    table_data = list(dict.fromkeys(table_data))
-    return table_data
-
-
-def extract_table_data_from_pdf(file_name: str) -> list:
-    """
-    Extracts and returns all unique text data from every cell in all tables within a PDF file.
-
-    Parameters:
-    file_name (str): The name of the PDF file.
-
-    Returns:
-    list: A list of unique cell texts from all tables in the PDF file.
-    """
-
-    with pdfplumber.open(PDFs_DIR_PATH + file_name) as pdf:
-        all_text = []
-        for page in pdf.pages:
-            tables = page.extract_tables()
-
-            for table in tables:
-                for row in table:
-                    for cell in row:
-                        all_text.append(cell)
-
-        all_text = list(set(all_text))
-        return all_text
-
-
-def truncate_to_shortest(*lists) -> None:
-    """
-    Truncates all input lists to the length of the shortest list among them.
-
-    Parameters:
-    *lists: A variable number of list arguments.
-    """
-
-    # Get the length of the shortest list
-    min_length = min(len(lst) for lst in lists)
-
-    # Truncate each list to the length of the shortest list
-    for lst in lists:
-        del lst[min_length:]
-
-
-
-
+import PyPDF2
+from pdf2docx import Converter
+import docx2txt
+import pdfplumber
+from docx import Document
+import io
+import os
+import re
+import pandas as pd
+from instrumentation import get_logger, measure, measured
+from setup import PDFs_DIR_PATH, DOCS_DIR_PATH
+
+
+logger = get_logger('text_extraction')
+
+
+def get_text_from_pdf(file_name: str) -> str:
+    """
+    Extracts text from a PDF file, returning the text from all pages.
+    
+    Parameters:
+    file_name (str): The name of the PDF file.
+
+    Returns:
+    str: Text extracted from the PDF file.
+    """
+
+    file_path = PDFs_DIR_PATH + file_name
+    pdf_text = ''
+    try:
+        with open(file_path, 'rb') as pdf_file:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            pdf_text = _get_text_from_pdf_reader(pdf_reader)
+
+    except FileNotFoundError:
+        logger.error(f'The file {file_path} does not exist.')
+    except Exception as e:
+        logger.error(f'An unexpected error with the file {file_path} occurred: {str(e)}')
+
+    return pdf_text
+
+
+def iter_page_texts_from_pdf(file_path: str):
+    """
+    Yields the text of each page of a PDF file, one page at a time, so callers can stop reading
+    as soon as they have what they need.
+
+    Parameters:
+    file_path (str): The path of the PDF file.
+
+    Yields:
+    str: Text extracted from each page.
+    """
+
+    with open(file_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        for page in pdf_reader.pages:
+            yield page.extract_text()
+
+
+def convert_pdf_to_docx(pdf_file_name: str) -> str or None:
+    """
+    Converts a PDF file to a DOCX file.
+
+    Parameters:
+    pdf_file_name (str): The name of the PDF file to be converted.
+
+    Returns:
+    str or None: The path to the converted DOCX file, or None if an error occurs.
+    """
+
+    pdf_file_path = PDFs_DIR_PATH + pdf_file_name
+    docx_file_name = pdf_file_name.replace('pdf', 'docx')
+    docx_file_path = DOCS_DIR_PATH + docx_file_name
+
+    if not os.path.isfile(docx_file_path):
+        try:
+            file = Converter(pdf_file_path)
+            file.convert(docx_file_path)
+            file.close()
+        except Exception as e:
+            logger.error(f'An unexpected error with the file {pdf_file_path} occurred: {str(e)}')
+            return None
+        else:
+            logger.info(f'{os.path.splitext(pdf_file_name)[0]} - File Converted Successfully')
+            return docx_file_path
+    return docx_file_path
+
+
+def extract_text_from_docx(docx_file_path: str) -> str:
+    """
+    Extracts text from a DOCX file and returns it as a string. Extra line breaks are removed.
+
+    Parameters:
+    docx_file_path (str): The file path of the DOCX document.
+
+    Returns:
+    str: The extracted text from the DOCX file.
+    """
+
+    text_docx = docx2txt.process(docx_file_path)
+    text_docx = re.sub('\n+', '\n', text_docx)
+    return text_docx
+
+
+def get_table_from_pdf(file_name: str) -> pd.DataFrame:
+    """
+    Extracts the first table from a PDF file and returns it as a pandas DataFrame.
+
+    Parameters:
+    file_name (str): The name of the PDF file.
+    
+    Returns:
+    pd.DataFrame: A DataFrame containing the extracted table data.
+    """
+
+    file_path = PDFs_DIR_PATH + file_name
+    table_settings = {
+        'vertical_strategy': 'text',
+        'horizontal_strategy': 'lines'
+    }
+
+    pdf = pdfplumber.open(file_path)
+    table = pdf.pages[0].extract_table(table_settings)
+    df = pd.DataFrame(table[1::], columns=table[0])
+
+    return df
+
+
+def extract_table_data_from_docx(file_name: str) -> list:
+    """
+    Extracts and returns all unique text data from every cell in all tables within a DOCX file.
+
+    Parameters:
+    file_name (str): The name of the DOCX file.
+
+    Returns:
+    list: A list of unique cell texts from all tables in the DOCX file.
+    """
+
+    document = Document(DOCS_DIR_PATH + file_name)
+    return _get_table_data_from_docx_document(document)
+
+
+def extract_table_data_from_pdf(file_name: str) -> list:
+    """
+    Extracts and returns all unique text data from every cell in all tables within a PDF file.
+
+    Parameters:
+    file_name (str): The name of the PDF file.
+
+    Returns:
+    list: A list of unique cell texts from all tables in the PDF file.
+    """
+
+    with pdfplumber.open(PDFs_DIR_PATH + file_name) as pdf:
+        return _get_table_data_from_plumber_pdf(pdf)
+
+
+def _get_text_from_pdf_reader(pdf_reader: PyPDF2.PdfReader) -> str:
+    """
+    Concatenates the text of every page of an already opened PDF.
+
+    Parameters:
+    pdf_reader (PyPDF2.PdfReader): The opened PDF.
+
+    Returns:
+    str: Text extracted from all pages.
+    """
+
+    pdf_text = ''
+    for page in pdf_reader.pages:
+        pdf_text += page.extract_text()
+
+    return pdf_text
+
+
+def _get_table_data_from_docx_document(document) -> list:
+    """
+    Collects the unique cell texts of every table in an already opened DOCX document,
+    keeping the order in which they first appear.
+
+    Parameters:
+    document (docx.Document): The opened DOCX document.
+
+    Returns:
+    list: A list of unique cell texts.
+    """
+
+    table_data = []
+    for table in document.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                table_data.append(cell.text)
+
+    table_data = list(dict.fromkeys(table_data))
+    return table_data
+
+
+def _get_table_data_from_plumber_pdf(pdf) -> list:
+    """
+    Collects the unique cell texts of every table in an already opened pdfplumber PDF.
+
+    Parameters:
+    pdf (pdfplumber.PDF): The opened PDF.
+
+    Returns:
+    list: A list of unique cell texts.
+    """
+
+    all_text = []
+    for page in pdf.pages:
+        tables = page.extract_tables()
+
+        for table in tables:
+            for row in table:
+                for cell in row:
+                    all_text.append(cell)
+
+    all_text = list(set(all_text))
+    return all_text
+
+
+def _get_native_page_layout(page, line_tolerance: float = 3) -> tuple[list, list]:
+    """
+    Rebuilds, from pdfplumber's words and tables, the structures the DOCX conversion produces for a page:
+    text lines outside the tables, and the text of every table cell. Lines and table cells are returned in
+    reading order (top to bottom), with every line of a cell's text emitted on its own, like a DOCX paragraph.
+
+    Parameters:
+    page (pdfplumber.page.Page): The page.
+    line_tolerance (float, optional): Maximum vertical distance (in points) between words of the same line. Default is 3.
+
+    Returns:
+    tuple[list, list]: The page lines and the page table cell texts.
+    """
+
+    tables = page.find_tables()
+    blocks = []
+    cells = []
+    for table in tables:
+        table_lines = []
+        for row in table.extract():
+            for cell in row:
+                # None marks a cell spanned by its neighbour
+                if cell is None:
+                    continue
+                cells.append(cell)
+                table_lines.extend(cell.split('\n'))
+        blocks.append((table.bbox[1], table_lines))
+
+    def inside_table(word):
+        return any(x0 <= word['x0'] and word['x1'] <= x1 and top <= word['top'] and word['bottom'] <= bottom
+                   for x0, top, x1, bottom in (table.bbox for table in tables))
+
+    words = sorted((w for w in page.extract_words() if not inside_table(w)), key=lambda w: (w['top'], w['x0']))
+    line_words = []
+    for word in words:
+        if line_words and word['top'] - line_words[0]['top'] > line_tolerance:
+            blocks.append((line_words[0]['top'], [' '.join(w['text'] for w in sorted(line_words, key=lambda w: w['x0']))]))
+            line_words = []
+        line_words.append(word)
+    if line_words:
+        blocks.append((line_words[0]['top'], [' '.join(w['text'] for w in sorted(line_words, key=lambda w: w['x0']))]))
+
+    blocks.sort(key=lambda block: block[0])
+    lines = [line for _, block_lines in blocks for line in block_lines]
+
+    return lines, cells
+
+
+class InvoiceDocument:
+    """
+    Parsed-document session for a single invoice. The PDF is read from disk once and every extractor
+    (PyPDF2, pdfplumber, pdf2docx, docx2txt and python-docx) works from the same bytes and handles,
+    which are opened lazily and kept until the session is closed.
+
+    Usage:
+    with InvoiceDocument('invoice.pdf') as document:
+        text = document.get_text()
+        table_data = document.get_docx_table_data()
+    """
+
+    def __init__(self, pdf_file_name: str, docx_dir_path: str = DOCS_DIR_PATH) -> None:
+        """
+        Reads the PDF file bytes.
+
+        Parameters:
+        pdf_file_name (str): The name of the PDF file inside 'PDFs_DIR_PATH'.
+        docx_dir_path (str, optional): Directory where the converted DOCX is kept. Default is 'DOCS_DIR_PATH'.
+        """
+
+        self.pdf_file_name = pdf_file_name
+        self.pdf_file_path = PDFs_DIR_PATH + pdf_file_name
+        self.docx_file_name = pdf_file_name.replace('pdf', 'docx')
+        self.docx_file_path = docx_dir_path + self.docx_file_name
+
+        with open(self.pdf_file_path, 'rb') as pdf_file:
+            self.pdf_bytes = pdf_file.read()
+
+        self._pdf_reader = None
+        self._plumber_pdf = None
+        self._docx_bytes = None
+        self._docx_document = None
+        self._native_layout = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @property
+    def pdf_reader(self) -> PyPDF2.PdfReader:
+        if self._pdf_reader is None:
+            self._pdf_reader = PyPDF2.PdfReader(io.BytesIO(self.pdf_bytes))
+        return self._pdf_reader
+
+    @property
+    def plumber_pdf(self):
+        if self._plumber_pdf is None:
+            self._plumber_pdf = pdfplumber.open(io.BytesIO(self.pdf_bytes))
+        return self._plumber_pdf
+
+    @property
+    def docx_bytes(self) -> bytes or None:
+        """
+        The bytes of the DOCX version of the invoice, converting the PDF first when needed.
+        """
+
+        if self._docx_bytes is None and self.convert_to_docx():
+            with open(self.docx_file_path, 'rb') as docx_file:
+                self._docx_bytes = docx_file.read()
+        return self._docx_bytes
+
+    @property
+    def docx_document(self):
+        if self._docx_document is None and self.docx_bytes is not None:
+            self._docx_document = Document(io.BytesIO(self.docx_bytes))
+        return self._docx_document
+
+    @measured('pdf_text')
+    def get_text(self) -> str:
+        """
+        Same as 'get_text_from_pdf', using the session PDF.
+
+        Returns:
+        str: Text extracted from the PDF file.
+        """
+
+        try:
+            return _get_text_from_pdf_reader(self.pdf_reader)
+        except Exception as e:
+            logger.error(f'An unexpected error with the file {self.pdf_file_path} occurred: {str(e)}')
+            return ''
+
+    @measured('pdf_tables')
+    def get_table_data(self) -> list:
+        """
+        Same as 'extract_table_data_from_pdf', using the session PDF.
+
+        Returns:
+        list: A list of unique cell texts from all tables in the PDF file.
+        """
+
+        return _get_table_data_from_plumber_pdf(self.plumber_pdf)
+
+    @measured('docx_conversion')
+    def convert_to_docx(self) -> str or None:
+        """
+        Same as 'convert_pdf_to_docx', feeding pdf2docx from the session bytes. An existing DOCX is reused.
+
+        Returns:
+        str or None: The path to the converted DOCX file, or None if an error occurs.
+        """
+
+        if not os.path.isfile(self.docx_file_path):
+            try:
+                file = Converter(stream=self.pdf_bytes)
+                file.convert(self.docx_file_path)
+                file.close()
+            except Exception as e:
+                logger.error(f'An unexpected error with the file {self.pdf_file_path} occurred: {str(e)}')
+                return None
+            else:
+                logger.info(f'{os.path.splitext(self.pdf_file_name)[0]} - File Converted Successfully')
+        return self.docx_file_path
+
+    @measured('docx_text')
+    def get_docx_text(self) -> str:
+        """
+        Same as 'extract_text_from_docx', using the session DOCX.
+
+        Returns:
+        str: The extracted text from the DOCX file, or an empty string if there is no DOCX.
+        """
+
+        if self.docx_bytes is None:
+            return ''
+
+        text_docx = docx2txt.process(io.BytesIO(self.docx_bytes))
+        text_docx = re.sub('\n+', '\n', text_docx)
+        return text_docx
+
+    @measured('docx_tables')
+    def get_docx_table_data(self) -> list:
+        """
+        Same as 'extract_table_data_from_docx', using the session DOCX.
+
+        Returns:
+        list: A list of unique cell texts from all tables in the DOCX file.
+        """
+
+        if self.docx_document is None:
+            return []
+
+        return _get_table_data_from_docx_document(self.docx_document)
+
+    @property
+    def native_layout(self) -> tuple[list, list]:
+        """
+        The lines and table cell texts of the whole PDF, built by pdfplumber without any DOCX conversion.
+        Only the first access, which builds them, is measured.
+        """
+
+        if self._native_layout is None:
+            with measure('native_layout'):
+                lines = []
+                cells = []
+                for page in self.plumber_pdf.pages:
+                    page_lines, page_cells = _get_native_page_layout(page)
+                    lines.extend(page_lines)
+                    cells.extend(page_cells)
+                self._native_layout = (lines, list(dict.fromkeys(cells)))
+        return self._native_layout
+
+    def get_native_text(self) -> str:
+        """
+        Native counterpart of 'get_docx_text': one line per text line or table cell line, read straight from the PDF.
+
+        Returns:
+        str: The extracted text.
+        """
+
+        lines, _ = self.native_layout
+        return '\n'.join(line for line in lines if line.strip())
+
+    def get_native_table_data(self) -> list:
+        """
+        Native counterpart of 'get_docx_table_data', read straight from the PDF tables.
+
+        Returns:
+        list: A list of unique cell texts from all tables in the PDF file.
+        """
+
+        _, cells = self.native_layout
+        return cells
+
+    def close(self) -> None:
+        """
+        Releases the parsed handles and the file bytes.
+        """
+
+        if self._plumber_pdf is not None:
+            self._plumber_pdf.close()
+
+        self._pdf_reader = None
+        self._plumber_pdf = None
+        self._docx_document = None
+        self._docx_bytes = None
+        self._native_layout = None
+        self.pdf_bytes = None
+
+
+def truncate_to_shortest(*lists) -> None:
+    """
+    Truncates all input lists to the length of the shortest list among them.
+
+    Parameters:
+    *lists: A variable number of list arguments.
+    """
+
+    # Get the length of the shortest list
+    min_length = min(len(lst) for lst in lists)
+
+    # Truncate each list to the length of the shortest list
+    for lst in lists:
+        del lst[min_length:]
+
+
+
+
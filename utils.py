@@ -1,46 +1,276 @@
-import pandas as pd
-from decimal import Decimal
-from setup import CATALOGS_DIR_PATH
-
-
-def read_and_preprocess_catalog():
-    catalog = pd.read_csv(CATALOGS_DIR_PATH + 'CarmeloFior_catalog.csv')
-
-    catalog['COD'] = catalog['COD'].apply(lambda x: ''.join(filter(str.isdigit, str(x))) if pd.notnull(x) else 'NaN')
-    catalog['COD'] = catalog['COD'].apply(lambda x: x[:-1] if pd.notnull(x) else 'NaN')
-    catalog['COD'] = catalog['COD'].str.zfill(5)
-
-    return catalog
-
-
-def to_float(value: str or float or int, precision: int = 2) -> Decimal:
-    """
-    Converts a string, float, or integer value to a Decimal with a specified precision. It handles
-    values with different formats of decimal and thousands separators (either ',' or '.'). For example,
-    it can handle values like '1,234.56', '1234,56', and '1.234,56'.
-
-    Parameters:
-    value (str or float or int): The value to be converted to a Decimal.
-    precision (int, optional): The precision of the Decimal. Default is 2.
-
-    Returns:
-    Decimal: The converted value as a Decimal with the specified precision.
-    """
-    
-    if type(value) != str:
-        value = str(value)
-
-    if '.' in value and ',' in value:
-        if value.rfind('.') > value.rfind(','):
-            value = value.replace(',', '')
-        else:
-            value = value.replace('.', '').replace(',', '.')
-    else:
-        if value.count('.') > 1 or (value.count('.') == 1 and value.rfind('.') < len(value) - 3):
-            value = value.replace('.', '')
-        elif value.count(',') > 1 or (value.count(',') == 1 and value.rfind(',') < len(value) - 3):
-            value = value.replace(',', '')
-
-        value = value.replace(',', '.')
-
-    return Decimal(value)
\ No newline at end of file
+import pandas as pd
+import numpy as np
+import hashlib
+import inspect
+from decimal import Decimal, ROUND_HALF_UP
+
+
+# Digits of the largest fixed-point integer handled without overflow (int64 holds any 18-digit number)
+MAX_FIXED_POINT_DIGITS = 18
+
+
+def to_float(value: str or float or int, precision: int = 2) -> Decimal:
+    """
+    Converts a string, float, or integer value to a Decimal with a specified precision. It handles
+    values with different formats of decimal and thousands separators (either ',' or '.'). For example,
+    it can handle values like '1,234.56', '1234,56', and '1.234,56'.
+
+    Parameters:
+    value (str or float or int): The value to be converted to a Decimal.
+    precision (int, optional): The precision of the Decimal. Default is 2.
+
+    Returns:
+    Decimal: The converted value as a Decimal with the specified precision.
+    """
+    
+    if type(value) != str:
+        value = str(value)
+
+    if '.' in value and ',' in value:
+        if value.rfind('.') > value.rfind(','):
+            value = value.replace(',', '')
+        else:
+            value = value.replace('.', '').replace(',', '.')
+    else:
+        if value.count('.') > 1 or (value.count('.') == 1 and value.rfind('.') < len(value) - 3):
+            value = value.replace('.', '')
+        elif value.count(',') > 1 or (value.count(',') == 1 and value.rfind(',') < len(value) - 3):
+            value = value.replace(',', '')
+
+        value = value.replace(',', '.')
+
+    return Decimal(value)
+
+
+def _normalize_amounts(values: pd.Series) -> pd.Series:
+    """
+    Vectorized version of the separator handling of 'to_float': rewrites every value with '.' as the only
+    decimal separator and no thousands separator, using the same rules.
+
+    Parameters:
+    values (pd.Series): The values to normalize, without missing values.
+
+    Returns:
+    pd.Series: The normalized strings.
+    """
+
+    s = values.astype(str)
+
+    has_dot = s.str.contains('.', regex=False)
+    has_comma = s.str.contains(',', regex=False)
+    # Anchored patterns stand in for the count and rfind comparisons of 'to_float'
+    dot_is_last = s.str.contains(r'\.[^,]*$', regex=True)
+    many_dots = s.str.contains(r'\..*\.', regex=True)
+    many_commas = s.str.contains(r',.*,', regex=True)
+    long_after_dot = s.str.contains(r'\.[^.]{3,}$', regex=True)
+    long_after_comma = s.str.contains(r',[^,]{3,}$', regex=True)
+
+    both = has_dot & has_comma
+    # A single separator followed by more than two characters is a thousands separator
+    drop_dots = many_dots | long_after_dot
+    drop_commas = ~drop_dots & (many_commas | long_after_comma)
+
+    remove_commas = (both & dot_is_last) | (~both & drop_commas)
+    remove_dots = (both & ~dot_is_last) | (~both & drop_dots)
+
+    s = s.mask(remove_commas, s.str.replace(',', '', regex=False))
+    s = s.mask(remove_dots, s.str.replace('.', '', regex=False))
+    return s.str.replace(',', '.', regex=False)
+
+
+def to_fixed_point(values, precision: int = 2, as_decimal: bool = False, errors: str = 'raise') -> pd.Series:
+    """
+    Vectorized counterpart of 'to_float' for whole columns. Each distinct value is parsed once; separators are
+    detected with pandas string operations under the same rules as 'to_float' ('1,234.56', '1234,56', '1.234,56', ...),
+    and the values are returned as exact fixed-point integers (e.g. cents for precision 2), or as the same Decimals
+    'to_float' returns.
+
+    Parameters:
+    values (pd.Series or array-like): The values to convert (strings, floats or integers).
+    precision (int, optional): Number of decimal places of the fixed-point integers. Values with more decimal
+    places are rounded half away from zero. Default is 2.
+    as_decimal (bool, optional): Whether to return Decimals instead of fixed-point integers. Default is False.
+    errors (str, optional): 'raise' to raise a ValueError on values that are not numbers or do not fit the
+    fixed-point integers (more than 'MAX_FIXED_POINT_DIGITS' digits once scaled), 'coerce' to return them as
+    missing. Missing values stay missing either way. Default is 'raise'.
+
+    Returns:
+    pd.Series: Integers in units of 10 ** -precision (nullable 'Int64'), or Decimals, with the index of 'values'.
+    """
+
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.Series(None, index=values.index, dtype=object if as_decimal else 'Int64')
+
+    s = _normalize_amounts(pd.Series(uniques)).str.strip()
+
+    if as_decimal:
+        def parse(value):
+            try:
+                return Decimal(value)
+            except ArithmeticError:
+                return None
+
+        parsed = s.map(parse).astype(object)
+        invalid = parsed.isna()
+    else:
+        invalid = ~s.str.fullmatch(r'[+-]?(\d+\.?\d*|\.\d+)').astype(bool)
+        s = s.mask(invalid, '0')
+
+        # Digits without the decimal point, scaled by the number of decimal places
+        dot = s.str.find('.').to_numpy()
+        decimals = np.where(dot >= 0, s.str.len().to_numpy() - dot - 1, 0)
+        digits = s.str.replace('.', '', regex=False).str.replace('+', '', regex=False)
+        shift = precision - decimals
+
+        # Values with more significant digits than int64 holds once scaled are out of range, and invalid
+        digit_count = digits.str.lstrip('-').str.lstrip('0').str.len().to_numpy()
+        out_of_range = (digit_count + np.clip(shift, 0, None) > MAX_FIXED_POINT_DIGITS) | (-shift > MAX_FIXED_POINT_DIGITS)
+        if out_of_range.any():
+            invalid = invalid | out_of_range
+            digits = digits.mask(out_of_range, '0')
+            shift = np.where(out_of_range, 0, shift)
+        digits = digits.astype('int64').to_numpy()
+
+        units = digits * 10 ** np.clip(shift, 0, None)
+        divisor = 10 ** np.clip(-shift, 0, None)
+        magnitude = np.abs(units)
+        rounded = magnitude // divisor + ((magnitude % divisor) * 2 >= divisor) * (divisor > 1)
+        parsed = pd.Series(np.sign(units) * rounded).astype('Int64').mask(invalid.to_numpy())
+
+    if invalid.any() and errors == 'raise':
+        raise ValueError(f'Could not convert to a number: {list(uniques[invalid.to_numpy()][:5])}')
+
+    # Missing values have code -1
+    result = parsed.reindex(codes)
+    result.index = values.index
+    return result
+
+
+def to_decimal_amounts(values, precision: int = 2) -> pd.Series:
+    """
+    Converts a column of amounts that mixes numeric cells and text, as read from a spreadsheet, to Decimals with
+    'precision' decimal places. Numbers (integers, floats and Decimals) are rounded half away from zero as they are;
+    only text goes through the separator rules of 'to_fixed_point', so a numeric 12.345 is 12.35, not 12345.
+
+    Parameters:
+    values (pd.Series or array-like): The amounts.
+    precision (int, optional): Number of decimal places. Default is 2.
+
+    Returns:
+    pd.Series: Decimals with the index of 'values'. Missing values and values that are not numbers are None.
+    """
+
+    values = pd.Series(values)
+    quantum = Decimal(1).scaleb(-precision)
+    result = pd.Series(None, index=values.index, dtype=object)
+
+    is_text = values.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+    if is_text.any():
+        units = to_fixed_point(values[is_text], precision=precision, errors='coerce')
+        result[is_text] = units.map(lambda unit: None if pd.isna(unit) else Decimal(int(unit)).scaleb(-precision))
+
+    def quantize(value):
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, (int, float, Decimal, np.number)):
+            return None
+        # Floats are taken by their shortest representation (2.675, not 2.67499999...)
+        number = value if isinstance(value, Decimal) else Decimal(str(value))
+        if not number.is_finite():
+            return None
+        return number.quantize(quantum, rounding=ROUND_HALF_UP)
+
+    if not is_text.all():
+        result[~is_text] = values[~is_text].map(quantize).astype(object)
+
+    return result
+
+
+def file_hash(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes the SHA-256 digest of a file's content, reading it in chunks.
+
+    Parameters:
+    file_path (str): The path of the file.
+    chunk_size (int, optional): Number of bytes read at a time. Default is 1 MiB.
+
+    Returns:
+    str: The hexadecimal digest.
+    """
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def source_version(*objects) -> str:
+    """
+    Builds a version string from the source code of the given modules, classes or functions, so that
+    any edit to the extraction code yields a new version.
+
+    Parameters:
+    *objects: Modules, classes or functions whose source defines the version.
+
+    Returns:
+    str: A short hexadecimal digest of the combined source code.
+    """
+
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode('utf-8'))
+
+    return digest.hexdigest()[:16]
+
+
+class KeywordTrie:
+    """
+    Prefix tree of keywords, for finding every keyword a text starts with in a single walk over the text,
+    however many keywords there are.
+
+    Usage:
+    trie = KeywordTrie()
+    trie.add('total', 'total_price')
+    trie.match_prefixes('total usd 100')  # [('total', 'total_price')]
+    """
+
+    def __init__(self) -> None:
+        self.root = {}
+
+    def add(self, keyword: str, value) -> None:
+        """
+        Adds a keyword.
+
+        Parameters:
+        keyword (str): The keyword. Matching is literal, so it should already be casefolded.
+        value: The value returned when the keyword matches.
+        """
+
+        node = self.root
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(value)
+
+    def match_prefixes(self, text: str) -> list[tuple]:
+        """
+        Finds the keywords that 'text' starts with, shortest first.
+
+        Parameters:
+        text (str): The text.
+
+        Returns:
+        list[tuple]: (keyword, value) for every matching keyword.
+        """
+
+        matches = []
+        node = self.root
+        for i, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            for value in node.get(None, ()):
+                matches.append((text[:i + 1], value))
+
+        return matches